@@ -1,11 +1,12 @@
 from agno.agent import Agent
-from agno.models.google import Gemini
 from typing import Dict, Any, List, Optional
 from pydantic import BaseModel, Field
-import os
 import json
 import traceback
-from google import genai
+
+import llm_gateway
+import model_router
+import token_accounting
 
 # Import search functionality
 from search import google_search
@@ -34,7 +35,7 @@ def get_detail_generator_agent() -> Agent:
     """Initialize a detailed curriculum step generator agent"""
     return Agent(
         name="Curriculum Detail Generator",
-        model=Gemini(id="gemini-2.0-flash"),
+        model=model_router.gemini_model("step_detail"),
         instructions="""You are an expert educational content developer specializing in creating 
         detailed, comprehensive learning materials. Your task is to expand a curriculum step 
         outline into detailed learning content.
@@ -83,16 +84,15 @@ def generate_step_detail(input_data: StepDetailInput) -> DetailedStep:
                 
             search_text, links = google_search(search_query)
             if search_text:
+                search_text = token_accounting.fit_to_budget(
+                    search_text, token_accounting.budget("step_detail_search"), stage="step_detail_search"
+                )
                 search_results = f"\nSearch Results for Resources:\n{search_text}"
                 resource_links = links
                 print(f"Found {len(links)} resource links")
         except Exception as e:
             print(f"Error performing search for resources: {e}")
         
-        # Use Gemini API to generate the detailed step content
-        api_key = os.getenv("GEMINI_API_KEY", "")
-        client = genai.Client(api_key=api_key)
-        
         # Create a prompt for Gemini
         detail_prompt = f"""
         You are an expert educational content developer specializing in creating detailed, comprehensive learning materials.
@@ -140,9 +140,10 @@ def generate_step_detail(input_data: StepDetailInput) -> DetailedStep:
         Make the content educational, practical, and engaging, focusing on both theoretical understanding and practical skills.
         """
         
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=detail_prompt,
+        # Use Gemini API to generate the detailed step content
+        response = llm_gateway.generate(
+            "step_detail",
+            detail_prompt,
             config={
                 'response_mime_type': 'application/json'
             }
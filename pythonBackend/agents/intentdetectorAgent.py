@@ -1,15 +1,12 @@
-import os
-from google import genai
 from typing import Dict, Any, Tuple
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
+import llm_gateway
+
 # Load environment variables
 load_dotenv()
 
-api_key = os.getenv("GEMINI_API_KEY", "")
-client = genai.Client(api_key=api_key)
-
 class GoogleSearchIntentResult(BaseModel):
     requires_search: bool
 
@@ -48,13 +45,13 @@ def detect_google_search_intent(query: str) -> bool:
      
     try:
         
-        response = client.models.generate_content(
-            model='gemini-2.0-flash',
-            contents=prompt,
+        response = llm_gateway.generate(
+            "intent_detection",
+            prompt,
             config={
                 'response_mime_type': 'application/json',
                 'response_schema': GoogleSearchIntentResult,
-            },
+            }
         )
         
         result = response.parsed
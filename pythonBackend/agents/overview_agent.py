@@ -1,9 +1,9 @@
-import os
 import json
 from typing import Dict, Any, List, Optional, TYPE_CHECKING
 from pydantic import BaseModel, Field
-from google import genai
 
+import llm_gateway
+import token_accounting
 # Import Google search functionality
 from search import google_search
 
@@ -52,6 +52,9 @@ def generate_overview(coordinator_output: "CoordinatorOutput") -> CurriculumOver
         search_query = f"{subject} curriculum best practices educational standards"
         search_text, _ = google_search(search_query)
         if search_text:
+            search_text = token_accounting.fit_to_budget(
+                search_text, token_accounting.budget("curriculum_search"), stage="curriculum_search"
+            )
             search_results = f"\nAdditional context from search:\n{search_text}"
             print("Successfully retrieved additional context from search")
         else:
@@ -61,9 +64,6 @@ def generate_overview(coordinator_output: "CoordinatorOutput") -> CurriculumOver
     
     # Use Gemini API to generate the curriculum overview
     try:
-        api_key = os.getenv("GEMINI_API_KEY", "")
-        client = genai.Client(api_key=api_key)
-        
         # Create a prompt for Gemini using the coordinator data with simplified requirements
         overview_prompt = f"""
         You are an expert educational curriculum designer. Create a simplified curriculum overview 
@@ -99,9 +99,9 @@ def generate_overview(coordinator_output: "CoordinatorOutput") -> CurriculumOver
         }}
         """
         
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=overview_prompt,
+        response = llm_gateway.generate(
+            "curriculum_overview",
+            overview_prompt,
             config={
                 'response_mime_type': 'application/json'
             }
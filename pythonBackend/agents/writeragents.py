@@ -1,12 +1,12 @@
 from agno.agent import Agent
-from agno.models.google import Gemini
 from typing import Dict, Any, List
 from pydantic import BaseModel
-from google import genai
 import json
-import os
 from dotenv import load_dotenv
 
+import llm_gateway
+import model_router
+
 # Load environment variables
 load_dotenv()
 
@@ -14,7 +14,7 @@ def get_query_rewriter_agent() -> Agent:
     """Initialize a query rewriting agent."""
     return Agent(
         name="Query Rewriter",
-        model=Gemini(id="gemini-2.0-flash"),
+        model=model_router.gemini_model("query_rewrite"),
         instructions="""You are an expert at reformulating questions to be more precise and detailed. 
         Your task is to:
         1. Analyze the user's question
@@ -32,7 +32,7 @@ def get_rag_agent() -> Agent:
     """Initialize the main RAG agent."""
     return Agent(
         name="Gemini RAG Agent",
-        model=Gemini(id="gemini-2.0-flash"),
+        model=model_router.gemini_model("rag_answer"),
         instructions="""You are an Intelligent Agent specializing in providing accurate answers.
         
         When given context from documents:
@@ -51,11 +51,37 @@ def get_rag_agent() -> Agent:
     )
 
 
+def rewrite_query(query: str) -> str:
+    """
+    Rewrite a user query for retrieval with the query rewriter agent.
+    
+    Args:
+        query (str): The user's query
+        
+    Returns:
+        str: The rewritten query
+    """
+    return llm_gateway.run_agent(get_query_rewriter_agent, query, task="query_rewrite").content
+
+
+def generate_rag_answer(prompt: str) -> str:
+    """
+    Answer a prompt (question plus retrieved context) with the RAG agent.
+    
+    Args:
+        prompt (str): Full prompt including context and question
+        
+    Returns:
+        str: The generated answer
+    """
+    return llm_gateway.run_agent(get_rag_agent, prompt, task="rag_answer").content
+
+
 def get_session_title_generator() -> Agent:
     """Initialize a session title generator agent."""
     return Agent(
         name="Session Title Generator",
-        model=Gemini(id="gemini-2.0-flash"),
+        model=model_router.gemini_model("session_title"),
         instructions="""You are an expert at creating short, concise titles.
         
         Your task is to:
@@ -80,14 +106,15 @@ def generate_session_title(query: str) -> str:
         str: A concise 4-5 word title
     """
     try:
-        title_agent = get_session_title_generator()
-        title = title_agent.run(f"Generate a concise 4-5 word title for this query: {query}").content
+        title = llm_gateway.run_agent(
+            get_session_title_generator,
+            f"Generate a concise 4-5 word title for this query: {query}",
+            task="session_title"
+        ).content
         return title.strip()
     except Exception as e:
         return "Untitled Session"
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY", ""))
-
 class UrldetectionResult(BaseModel):
     urls: List[str]
     query: str
@@ -122,11 +149,10 @@ def test_url_detector(query: str) -> Dict[str, Any]:
     """
      
     try:
-        # Use the GenerativeModel class instead of Client
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        response = model.generate_content(
+        response = llm_gateway.generate(
+            "url_detection",
             prompt,
-            generation_config={
+            config={
                 "response_mime_type": "application/json",
             }
         )
@@ -145,7 +171,7 @@ def get_curriculum_modifier_agent() -> Agent:
     """Initialize an agent for modifying curriculum structure."""
     return Agent(
         name="Curriculum Modifier",
-        model=Gemini(id="gemini-2.0-flash"),
+        model=model_router.gemini_model("curriculum_modify"),
         instructions="""You are an expert educational curriculum designer specializing in modifying existing curricula.
 
         Your task is to:
@@ -172,9 +198,6 @@ def modify_curriculum(curriculum, user_input: str) -> dict:
         dict: Modified curriculum data 
     """
     try:
-        # Get the curriculum modifier agent
-        modifier_agent = get_curriculum_modifier_agent()
-        
         # Create a prompt that explains the current curriculum and asks for modifications
         prompt = f"""
         Here is a curriculum overview:
@@ -201,8 +224,8 @@ def modify_curriculum(curriculum, user_input: str) -> dict:
         }}
         """
         
-        # Use the agent to process the modification
-        response = modifier_agent.run(prompt)
+        # Use the agent to process the modification (a fresh agent per attempt)
+        response = llm_gateway.run_agent(get_curriculum_modifier_agent, prompt, task="curriculum_modify")
         
         # Get the response content
         response_text = response.content
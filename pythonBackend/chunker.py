@@ -0,0 +1,220 @@
+"""
+Structure-aware chunking for extracted documents.
+
+Splits on headings, paragraphs and page boundaries (one input document per
+page) instead of fixed character windows, sizes chunks in tokens, and tags
+every chunk with the `page` and `section` it came from so chat sources can
+point back into the original material.
+"""
+import os
+import re
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from token_accounting import count_tokens
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Chunk size limits, in (approximate) tokens
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "350"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+# Chunks smaller than this are merged into the next block of the same section
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "60"))
+
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+_MARKDOWN_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_NUMBERED_HEADING = re.compile(r"^((?:\d+\.)*\d+)\.?\s+([A-Z][^.!?]{2,80})$")
+
+
+def _heading_level(line: str) -> Optional[Tuple[int, str]]:
+    """Return (level, title) if the line looks like a heading, else None"""
+    line = line.strip()
+    if not line or len(line) > 120:
+        return None
+
+    match = _MARKDOWN_HEADING.match(line)
+    if match:
+        return len(match.group(1)), match.group(2).strip()
+
+    match = _NUMBERED_HEADING.match(line)
+    if match and count_tokens(line) <= 16:
+        return match.group(1).count(".") + 1, line
+
+    # Short all-caps lines, e.g. "INTRODUCTION" or "CHAPTER 3 SORTING"
+    letters = [ch for ch in line if ch.isalpha()]
+    if len(letters) >= 4 and line.upper() == line and count_tokens(line) <= 12 and not line.endswith((".", ",")):
+        return 1, line
+
+    return None
+
+
+def _page_number(metadata: Dict) -> Optional[int]:
+    """First page a document covers (`page`, or the lowest of `pages`), if known"""
+    pages = [metadata.get("page")] if metadata.get("page") is not None else list(metadata.get("pages") or [])
+    numbers = []
+    for page in pages:
+        try:
+            numbers.append(int(page))
+        except (TypeError, ValueError):
+            continue
+    return min(numbers) if numbers else None
+
+
+class StructuredChunker:
+    """
+    Heading/paragraph/page aware text splitter.
+
+    Exposes split_documents() so it can be used wherever a LangChain text
+    splitter is expected. The heading path at the end of every page is
+    remembered per source, and a page starts from the path of the nearest
+    earlier page seen, so a section that spans pages keeps its `section`
+    metadata even if pages arrive out of order.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = CHUNK_MAX_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+        min_tokens: int = CHUNK_MIN_TOKENS
+    ):
+        self.max_tokens = max(1, max_tokens)
+        self.overlap_tokens = max(0, min(overlap_tokens, self.max_tokens // 2))
+        self.min_tokens = max(0, min(min_tokens, self.max_tokens))
+        # source -> page number (None for unpaged documents) -> heading path
+        # at the end of that page
+        self._headings: Dict[str, Dict[Optional[int], List[Tuple[int, str]]]] = {}
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        """Split each document into structured chunks, keeping its metadata"""
+        chunks: List[Document] = []
+        for doc in documents:
+            source = str(doc.metadata.get("file_name") or doc.metadata.get("url") or doc.metadata.get("source") or "")
+            page = _page_number(doc.metadata)
+            states = self._headings.setdefault(source, {})
+            headings = self._start_headings(states, page)
+            chunked = self._split(doc.page_content, headings)
+            states[page] = headings
+            for text, section in chunked:
+                metadata = dict(doc.metadata)
+                if section:
+                    metadata["section"] = section
+                metadata["tokens"] = count_tokens(text)
+                chunks.append(Document(page_content=text, metadata=metadata))
+        return chunks
+
+    @staticmethod
+    def _start_headings(states: Dict[Optional[int], List[Tuple[int, str]]], page: Optional[int]) -> List[Tuple[int, str]]:
+        """Heading path a page starts with: the end state of the nearest earlier page"""
+        if page is None:
+            return list(states.get(None, []))
+        earlier = [seen for seen in states if seen is not None and seen < page]
+        return list(states[max(earlier)]) if earlier else []
+
+    def split_text(self, text: str) -> List[str]:
+        """Split raw text into chunk strings"""
+        return [chunk for chunk, _ in self._split(text, [])]
+
+    def _blocks(self, text: str, headings: List[Tuple[int, str]]):
+        """Yield (block, section, is_heading) in reading order"""
+        paragraph: List[str] = []
+
+        def section() -> str:
+            return " > ".join(title for _, title in headings)
+
+        for line in text.splitlines():
+            heading = _heading_level(line)
+            if heading is not None:
+                if paragraph:
+                    yield " ".join(paragraph), section(), False
+                    paragraph = []
+                level, title = heading
+                while headings and headings[-1][0] >= level:
+                    headings.pop()
+                headings.append((level, title))
+                yield line.strip(), section(), True
+            elif not line.strip():
+                if paragraph:
+                    yield " ".join(paragraph), section(), False
+                    paragraph = []
+            else:
+                paragraph.append(line.strip())
+        if paragraph:
+            yield " ".join(paragraph), section(), False
+
+    def _pieces(self, block: str) -> List[str]:
+        """Break an oversized block into sentences, then into word windows"""
+        if count_tokens(block) <= self.max_tokens:
+            return [block]
+        pieces: List[str] = []
+        for sentence in _SENTENCE_PATTERN.split(block):
+            if count_tokens(sentence) <= self.max_tokens:
+                pieces.append(sentence)
+                continue
+            words = sentence.split()
+            window: List[str] = []
+            for word in words:
+                window.append(word)
+                if count_tokens(" ".join(window)) >= self.max_tokens:
+                    pieces.append(" ".join(window))
+                    window = []
+            if window:
+                pieces.append(" ".join(window))
+        return pieces
+
+    def _overlap(self, pieces: List[Tuple[str, bool]]) -> List[Tuple[str, bool]]:
+        """Trailing body pieces of a chunk to repeat at the start of the next one"""
+        if not self.overlap_tokens:
+            return []
+        tail: List[Tuple[str, bool]] = []
+        tokens = 0
+        for piece, is_heading in reversed(pieces):
+            piece_tokens = count_tokens(piece)
+            if is_heading or tokens + piece_tokens > self.overlap_tokens:
+                break
+            tail.insert(0, (piece, False))
+            tokens += piece_tokens
+        return tail
+
+    def _split(self, text: str, headings: List[Tuple[int, str]]) -> List[Tuple[str, str]]:
+        """Pack blocks into token-bounded chunks that never straddle sections"""
+        chunks: List[Tuple[str, str]] = []
+        # (piece, is_heading) pairs of the chunk being built
+        current: List[Tuple[str, bool]] = []
+        # Leading pieces of `current` repeated from the previous chunk
+        carried = 0
+        current_section = " > ".join(title for _, title in headings)
+
+        def body_tokens() -> int:
+            return sum(count_tokens(piece) for piece, is_heading in current[carried:] if not is_heading)
+
+        def flush(keep_overlap: bool):
+            nonlocal current, carried
+            if len(current) > carried:
+                chunks.append(("\n\n".join(piece for piece, _ in current).strip(), current_section))
+            current = self._overlap(current) if keep_overlap else []
+            carried = len(current)
+
+        for block, section, is_heading in self._blocks(text, headings):
+            if is_heading or section != current_section:
+                if body_tokens() >= self.min_tokens:
+                    flush(keep_overlap=False)
+                else:
+                    # Keep a tiny chunk (e.g. a bare parent heading) together
+                    # with the next section, but drop overlap from the old one
+                    current = current[carried:]
+                    carried = 0
+                current_section = section
+
+            for piece in ([block] if is_heading else self._pieces(block)):
+                # Headings always stay with the body that follows them
+                pending = body_tokens()
+                if not is_heading and pending and pending + count_tokens(piece) > self.max_tokens:
+                    flush(keep_overlap=True)
+                current.append((piece, is_heading))
+
+        flush(keep_overlap=False)
+        return [(chunk, section) for chunk, section in chunks if chunk]
@@ -1,16 +1,19 @@
 import os
 import json
 import uuid
-import requests
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 from pydantic import BaseModel, Field
 
+import llm_gateway
+import token_accounting
+
 # Import document processing and search functionalities
 from document_loader import process_web, process_pdf
 from search import google_search
-# Import Supabase client
-from utils.supabase_client import initialize_supabase
+# Import curriculum persistence (shares the curriculum row cache)
+from utils.curriculum_utils import save_curriculum_step
+from utils.http_cache import download_to_tempfile
 # Import overview agent
 from agents.overview_agent import generate_overview, format_curriculum_text, CurriculumOverview
 
@@ -37,50 +40,6 @@ class CoordinatorCompleteOutput(BaseModel):
     overview: CurriculumOverview
     formatted_text: str
 
-def save_curriculum_step(step_id: str, step_title: str, estimated_time: str, overview=None, detailed_content=None):
-    """
-    Save curriculum step to Supabase
-    
-    Args:
-        step_id: UUID for the curriculum step
-        step_title: Title of the curriculum step (subject)
-        estimated_time: Estimated time for completion
-        overview: JSON data for overview (optional)
-        detailed_content: JSON data for detailed content (optional)
-        
-    Returns:
-        bool: True if save was successful, False otherwise
-    """
-    try:
-        # Initialize Supabase client
-        supabase = initialize_supabase()
-        if not supabase:
-            print("Failed to initialize Supabase client")
-            return False
-            
-        # Prepare data
-        data = {
-            "step_id": step_id,
-            "step_title": step_title,
-            "estimated_time": estimated_time
-        }
-        
-        # Add JSON data if provided
-        if overview:
-            data["overview"] = overview
-            
-        if detailed_content:
-            data["detailed_content"] = detailed_content
-            
-        # Insert data into Supabase
-        response = supabase.table("curriculum_steps").insert(data).execute()
-        print(f"Successfully saved curriculum step with ID: {step_id}")
-        return True
-        
-    except Exception as e:
-        print(f"Error saving curriculum step to Supabase: {e}")
-        return False
-
 def get_default_ml_topics():
     """Fallback function to provide default ML curriculum topics when API is unavailable."""
     return [
@@ -162,16 +121,8 @@ def coordinate(user_input: CoordinatorInput) -> CoordinatorCompleteOutput:
         if syllabus_url.endswith('.pdf'):
             # Handle PDF syllabus
             try:
-                # Download the PDF
-                response = requests.get(syllabus_url, stream=True)
-                response.raise_for_status()
-                
-                # Save to temporary file
-                import tempfile
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        tmp_file.write(chunk)
-                    temp_path = tmp_file.name
+                # Download the PDF (served from the HTTP cache when still fresh)
+                temp_path, _ = download_to_tempfile(syllabus_url, suffix='.pdf')
                 
                 # Process the PDF
                 documents = process_pdf(temp_path)
@@ -241,15 +192,16 @@ def coordinate(user_input: CoordinatorInput) -> CoordinatorCompleteOutput:
     
     # Step 3: Extract key topics and concepts from content
     if extracted_content:
-        combined_content = "\n\n".join(extracted_content)
+        # Keep syllabus and source material within the token budget, cutting
+        # at paragraph boundaries
+        combined_content = token_accounting.fit_to_budget(
+            "\n\n".join(extracted_content),
+            token_accounting.budget("curriculum_sources"),
+            stage="curriculum_sources"
+        )
         
         # Use direct Gemini API to extract topics
-        from google import genai
-        
         try:
-            api_key = os.getenv("GEMINI_API_KEY", "")
-            client = genai.Client(api_key=api_key)
-            
             extract_prompt = f"""
             Based on the following content about '{query}', extract:
             
@@ -259,7 +211,7 @@ def coordinate(user_input: CoordinatorInput) -> CoordinatorCompleteOutput:
             4. Any prerequisites or dependent relationships between topics
             
             Content:
-            {combined_content[:10000]}  # Limit content length to avoid token limits
+            {combined_content}
             
             Format your response as JSON with this structure:
             {{
@@ -274,9 +226,9 @@ def coordinate(user_input: CoordinatorInput) -> CoordinatorCompleteOutput:
             }}
             """
             
-            response = client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=extract_prompt,
+            response = llm_gateway.generate(
+                "topic_extraction",
+                extract_prompt,
                 config={
                     'response_mime_type': 'application/json'
                 }
@@ -357,9 +309,6 @@ def coordinate(user_input: CoordinatorInput) -> CoordinatorCompleteOutput:
     if output.extracted_topics:
         try:
             # Use direct Gemini API to create structure
-            api_key = os.getenv("GEMINI_API_KEY", "")
-            client = genai.Client(api_key=api_key)
-            
             structure_prompt = f"""
             Create a curriculum structure for '{query}' based on these topics:
             
@@ -384,9 +333,9 @@ def coordinate(user_input: CoordinatorInput) -> CoordinatorCompleteOutput:
             }}
             """
             
-            response = client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=structure_prompt,
+            response = llm_gateway.generate(
+                "curriculum_structure",
+                structure_prompt,
                 config={
                     'response_mime_type': 'application/json'
                 }
@@ -2,21 +2,45 @@ import os
 import json
 import uuid
 import traceback
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
 from typing import Dict, Any, List, Optional, Tuple
 from pydantic import BaseModel
 
-# Import curriculum generation components
-from coordinator_agent import CoordinatorInput, coordinate
-from agents.overview_agent import CurriculumStep, CurriculumOverview, format_curriculum_text
-from utils.curriculum_utils import save_curriculum_step, get_curriculum_step, update_curriculum_step
-from agents.writeragents import modify_curriculum
-from agents.detailagent import generate_step_detail, format_detailed_step_text, StepDetailInput, DetailedStep
+from utils.lazy_import import lazy_import
+from utils.singleflight import SingleFlight
+
+# Curriculum generation components are imported on first use so that loading
+# the request/response models below does not pull in the agent SDKs
+coordinator_agent = lazy_import("coordinator_agent")
+overview_agent = lazy_import("agents.overview_agent")
+curriculum_utils = lazy_import("utils.curriculum_utils")
+writeragents = lazy_import("agents.writeragents")
+detailagent = lazy_import("agents.detailagent")
+token_accounting = lazy_import("token_accounting")
+
+# Preloaded by the application's warm-up task
+lazy_modules = (coordinator_agent, overview_agent, curriculum_utils, writeragents, detailagent, token_accounting)
+
+# Concurrent identical requests share one in-flight generation
+step_detail_flight = SingleFlight("step_detail")
+curriculum_flight = SingleFlight("curriculum")
+
+# Background prefetch of step details after curriculum generation.
+# CURRICULUM_PREFETCH_DEPTH: number of leading steps to prefetch (0 disables, -1 = all steps)
+CURRICULUM_PREFETCH_DEPTH = int(os.getenv("CURRICULUM_PREFETCH_DEPTH", "0"))
+CURRICULUM_PREFETCH_CONCURRENCY = int(os.getenv("CURRICULUM_PREFETCH_CONCURRENCY", "2"))
+
+_prefetch_executor: Optional[ThreadPoolExecutor] = None
+_prefetch_jobs: Dict[str, Tuple[threading.Event, List[Future]]] = {}
+_prefetch_lock = threading.Lock()
 
 class CurriculumRequest(BaseModel):
     """Request model for curriculum generation"""
     subject: str
     syllabus_url: Optional[str] = None
     time_constraint: Optional[str] = None
+    prefetch_depth: Optional[int] = None  # Steps to prefetch in the background; None uses CURRICULUM_PREFETCH_DEPTH
 
 class CurriculumModificationRequest(BaseModel):
     """Request model for curriculum modification"""
@@ -46,6 +70,10 @@ class RoadmapResponse(BaseModel):
 class CurriculumListResponse(BaseModel):
     """Response model for listing curriculums"""
     curriculums: List[Dict[str, str]]
+    limit: Optional[int] = None
+    offset: Optional[int] = None
+    next_offset: Optional[int] = None
+    total: Optional[int] = None
 
 class CurriculumCreateRequest(BaseModel):
     """Request model for creating a new curriculum"""
@@ -63,14 +91,23 @@ def generate_curriculum(request: CurriculumRequest) -> CurriculumResponse:
     """
     try:
         # Create input for coordinator
-        coordinator_input = CoordinatorInput(
+        coordinator_input = coordinator_agent.CoordinatorInput(
             query=request.subject,
             syllabus_url=request.syllabus_url,
             time_constraint=request.time_constraint
         )
         
-        # Generate curriculum
-        result = coordinate(coordinator_input)
+        # Generate curriculum; identical concurrent requests share one run
+        result = curriculum_flight.do(
+            (request.subject, request.syllabus_url, request.time_constraint),
+            coordinator_agent.coordinate,
+            coordinator_input
+        )
+        
+        # Generate details for the first steps in the background
+        prefetch_depth = request.prefetch_depth if request.prefetch_depth is not None else CURRICULUM_PREFETCH_DEPTH
+        if prefetch_depth:
+            prefetch_step_details(result.overview.curriculum_id, prefetch_depth)
         
         # Create response
         return CurriculumResponse(
@@ -99,7 +136,7 @@ def get_curriculum(curriculum_id: str) -> CurriculumResponse:
     """
     try:
         # Get curriculum step from database
-        curriculum_step = get_curriculum_step(curriculum_id)
+        curriculum_step = curriculum_utils.get_curriculum_step(curriculum_id)
         
         if not curriculum_step:
             raise Exception(f"Curriculum with ID {curriculum_id} not found")
@@ -116,16 +153,16 @@ def get_curriculum(curriculum_id: str) -> CurriculumResponse:
             })
         
         # Create curriculum overview
-        overview = CurriculumOverview(
+        overview = overview_agent.CurriculumOverview(
             curriculum_id=curriculum_id,
             title=curriculum_step.get("step_title", "Untitled Curriculum"),
             overview=f"A curriculum covering key aspects of {curriculum_step.get('step_title', 'the subject')}.",
-            steps=[CurriculumStep(title=step["title"], estimated_time=step["estimated_time"]) for step in steps],
+            steps=[overview_agent.CurriculumStep(title=step["title"], estimated_time=step["estimated_time"]) for step in steps],
             total_time=curriculum_step.get("estimated_time", "Not specified")
         )
         
         # Format text
-        formatted_text = format_curriculum_text(overview)
+        formatted_text = overview_agent.format_curriculum_text(overview)
         
         # Create response
         return CurriculumResponse(
@@ -154,7 +191,7 @@ def modify_curriculum_by_id(curriculum_id: str, request: CurriculumModificationR
     """
     try:
         # Get current curriculum
-        curriculum_step = get_curriculum_step(curriculum_id)
+        curriculum_step = curriculum_utils.get_curriculum_step(curriculum_id)
         
         if not curriculum_step:
             raise Exception(f"Curriculum with ID {curriculum_id} not found")
@@ -166,12 +203,12 @@ def modify_curriculum_by_id(curriculum_id: str, request: CurriculumModificationR
         # Create curriculum overview object from data
         steps = []
         for topic in step_data:
-            steps.append(CurriculumStep(
+            steps.append(overview_agent.CurriculumStep(
                 title=topic.get("name", "Unknown step"),
                 estimated_time="Not specified"
             ))
         
-        current_curriculum = CurriculumOverview(
+        current_curriculum = overview_agent.CurriculumOverview(
             curriculum_id=curriculum_id,
             title=curriculum_step.get("step_title", "Untitled Curriculum"),
             overview=f"A curriculum covering key aspects of {curriculum_step.get('step_title', 'the subject')}.",
@@ -180,18 +217,18 @@ def modify_curriculum_by_id(curriculum_id: str, request: CurriculumModificationR
         )
         
         # Apply modifications
-        modified_data = modify_curriculum(current_curriculum, request.modification_text)
+        modified_data = writeragents.modify_curriculum(current_curriculum, request.modification_text)
         
         # Create new steps from the JSON data
         new_steps = []
         for step_data in modified_data.get("steps", []):
-            new_steps.append(CurriculumStep(
+            new_steps.append(overview_agent.CurriculumStep(
                 title=step_data.get("title", "Untitled Step"),
                 estimated_time=step_data.get("estimated_time", "Not specified")
             ))
         
         # Create a new curriculum with the updated steps
-        updated_curriculum = CurriculumOverview(
+        updated_curriculum = overview_agent.CurriculumOverview(
             curriculum_id=curriculum_id,
             title=current_curriculum.title,
             overview=current_curriculum.overview,
@@ -200,7 +237,7 @@ def modify_curriculum_by_id(curriculum_id: str, request: CurriculumModificationR
         )
         
         # Format as text
-        formatted_text = format_curriculum_text(updated_curriculum)
+        formatted_text = overview_agent.format_curriculum_text(updated_curriculum)
         
         # Save updated curriculum to database
         updated_overview_data = {
@@ -208,7 +245,8 @@ def modify_curriculum_by_id(curriculum_id: str, request: CurriculumModificationR
                     for step in updated_curriculum.steps]
         }
         
-        save_result = save_curriculum_step(
+        # The row already exists, so update it in place
+        save_result = curriculum_utils.update_curriculum_step(
             curriculum_id,
             updated_curriculum.title,
             updated_curriculum.total_time,
@@ -216,7 +254,13 @@ def modify_curriculum_by_id(curriculum_id: str, request: CurriculumModificationR
         )
         
         if not save_result:
-            print("Warning: Failed to save updated curriculum to database")
+            # The old steps are still stored, so their details stay valid
+            raise Exception("Failed to save updated curriculum to database")
+        
+        # Details are keyed by step index, so they no longer match the new steps
+        cancel_prefetch(curriculum_id)
+        if not curriculum_utils.delete_step_details(curriculum_id):
+            print(f"Warning: Failed to delete stale step details of curriculum {curriculum_id}")
         
         # Create response
         return CurriculumResponse(
@@ -248,7 +292,7 @@ def generate_curriculum_details(curriculum_id: str) -> Dict[int, StepDetailRespo
         
         # Get curriculum
         print(f"DEBUG: Calling get_curriculum_step for curriculum_id={curriculum_id}")
-        curriculum_step = get_curriculum_step(curriculum_id)
+        curriculum_step = curriculum_utils.get_curriculum_step(curriculum_id)
         
         if not curriculum_step:
             print(f"DEBUG: ERROR - Curriculum with ID {curriculum_id} not found")
@@ -273,14 +317,14 @@ def generate_curriculum_details(curriculum_id: str) -> Dict[int, StepDetailRespo
         steps = []
         for i, topic in enumerate(step_data):
             print(f"DEBUG: Processing topic/step {i}: {json.dumps(topic)[:100]}...")
-            steps.append(CurriculumStep(
+            steps.append(overview_agent.CurriculumStep(
                 title=topic.get("name", topic.get("title", "Unknown step")),
                 estimated_time=topic.get("estimated_time", "Not specified")
             ))
         
         print(f"DEBUG: Created {len(steps)} CurriculumStep objects")
         
-        curriculum = CurriculumOverview(
+        curriculum = overview_agent.CurriculumOverview(
             curriculum_id=curriculum_id,
             title=curriculum_step.get("step_title", "Untitled Curriculum"),
             overview=f"A curriculum covering key aspects of {curriculum_step.get('step_title', 'the subject')}.",
@@ -295,7 +339,7 @@ def generate_curriculum_details(curriculum_id: str) -> Dict[int, StepDetailRespo
             print(f"DEBUG: Generating details for step {index}: {step.title}")
             
             # Set up input for detail generator
-            detail_input = StepDetailInput(
+            detail_input = detailagent.StepDetailInput(
                 step_title=step.title,
                 estimated_time=step.estimated_time,
                 subject=curriculum.title
@@ -304,14 +348,15 @@ def generate_curriculum_details(curriculum_id: str) -> Dict[int, StepDetailRespo
             try:
                 # Generate detailed content
                 print(f"DEBUG: Calling generate_step_detail for step {index}")
-                detailed_step = generate_step_detail(detail_input)
+                detailed_step = detailagent.generate_step_detail(detail_input)
                 
                 # Format as text
-                detailed_text = format_detailed_step_text(detailed_step)
+                detailed_text = detailagent.format_detailed_step_text(detailed_step)
                 
                 # Store the results
                 if detailed_step:
                     print(f"DEBUG: Successfully generated details for step {index}")
+                    store_step_detail(curriculum_id, index, detailed_step.dict())
                     detailed_steps[index] = StepDetailResponse(
                         step_title=detailed_step.step_title,
                         estimated_time=detailed_step.estimated_time,
@@ -332,6 +377,184 @@ def generate_curriculum_details(curriculum_id: str) -> Dict[int, StepDetailRespo
         print(error_details)
         raise Exception(f"Failed to generate curriculum details: {str(e)}")
 
+def store_step_detail(curriculum_id: str, step_index: int, detail: Dict[str, Any]) -> bool:
+    """
+    Persist the detail of a single step without rewriting other steps
+    
+    Args:
+        curriculum_id: The UUID of the curriculum
+        step_index: The index of the step
+        detail: The detailed step content
+        
+    Returns:
+        Boolean indicating success
+    """
+    try:
+        return curriculum_utils.save_step_detail(curriculum_id, step_index, detail)
+    except curriculum_utils.StepDetailsTableMissing:
+        # Only a missing table falls back to the read-modify-write of the
+        # legacy blob; any other error is raised to the caller
+        print(f"Warning: Per-step detail table missing, patching detailed_content for step {step_index}")
+        return curriculum_utils.patch_legacy_step_detail(curriculum_id, step_index, detail)
+
+def generate_and_store_step_detail(curriculum_id: str, step_index: int, curriculum_step: Dict[str, Any], cancel_event: Optional[threading.Event] = None) -> StepDetailResponse:
+    """
+    Generate the detailed content for one step and store it
+    
+    Args:
+        curriculum_id: The UUID of the curriculum
+        step_index: The index of the step
+        curriculum_step: The curriculum row the step belongs to
+        cancel_event: Optional event; if set once generation finishes, the result is not stored
+        
+    Returns:
+        StepDetailResponse with the generated step content
+    """
+    # Parse curriculum data to get step information
+    overview_data = curriculum_step.get("overview", {})
+    step_data = overview_data.get("topics", []) or overview_data.get("steps", [])
+    
+    if step_index >= len(step_data):
+        print(f"DEBUG: ERROR - Step index {step_index} out of range (total steps: {len(step_data)})")
+        raise Exception(f"Step with index {step_index} not found in curriculum {curriculum_id}")
+    
+    # Get the specific step data
+    step_info = step_data[step_index]
+    step_title = step_info.get("name", step_info.get("title", "Unknown step"))
+    estimated_time = step_info.get("estimated_time", "Not specified")
+    
+    # Set up input for detail generator
+    detail_input = detailagent.StepDetailInput(
+        step_title=step_title,
+        estimated_time=estimated_time,
+        subject=curriculum_step.get("step_title", "Untitled Curriculum")
+    )
+    
+    # Generate detailed content for just this step
+    detailed_step = detailagent.generate_step_detail(detail_input)
+    detailed_text = detailagent.format_detailed_step_text(detailed_step)
+    
+    # Save only this step to avoid regenerating it next time
+    if cancel_event is not None and cancel_event.is_set():
+        print(f"DEBUG: Prefetch for curriculum {curriculum_id} cancelled, not storing step {step_index}")
+    else:
+        store_step_detail(curriculum_id, step_index, detailed_step.dict())
+    
+    return StepDetailResponse(
+        step_title=detailed_step.step_title,
+        estimated_time=detailed_step.estimated_time,
+        content=detailed_step.dict(),
+        formatted_text=detailed_text
+    )
+
+def _prefetch_step(curriculum_id: str, step_index: int, cancel_event: threading.Event):
+    """Generate and store one step detail unless it exists or the prefetch was cancelled"""
+    if cancel_event.is_set():
+        return
+    token_accounting.bind(endpoint="curriculum_prefetch", session_id=curriculum_id)
+    try:
+        if curriculum_utils.get_step_detail_record(curriculum_id, step_index) is not None:
+            return
+        curriculum_step = curriculum_utils.get_curriculum_step(curriculum_id)
+        if not curriculum_step or cancel_event.is_set():
+            return
+        step_detail_flight.do(
+            (curriculum_id, step_index),
+            generate_and_store_step_detail,
+            curriculum_id,
+            step_index,
+            curriculum_step,
+            cancel_event
+        )
+        print(f"DEBUG: Prefetched detail for step {step_index} of curriculum {curriculum_id}")
+    except Exception as e:
+        print(f"Error prefetching step {step_index} of curriculum {curriculum_id}: {e}")
+
+def _finish_prefetch_job(curriculum_id: str, futures: List[Future]):
+    """Forget a prefetch job once all of its steps have completed"""
+    with _prefetch_lock:
+        job = _prefetch_jobs.get(curriculum_id)
+        if job and job[1] is futures and all(f.done() for f in futures):
+            del _prefetch_jobs[curriculum_id]
+
+def prefetch_step_details(curriculum_id: str, depth: int = -1) -> int:
+    """
+    Generate details for the first steps of a curriculum in the background
+    
+    Steps are generated at most CURRICULUM_PREFETCH_CONCURRENCY at a time and
+    share the single-flight key used by get_step_detail, so a user opening a
+    step that is being prefetched waits for the same generation.
+    
+    Args:
+        curriculum_id: The UUID of the curriculum
+        depth: Number of leading steps to prefetch, or -1 for all steps
+        
+    Returns:
+        Number of steps scheduled
+    """
+    global _prefetch_executor
+    
+    curriculum_step = curriculum_utils.get_curriculum_step(curriculum_id)
+    if not curriculum_step:
+        return 0
+    
+    overview_data = curriculum_step.get("overview", {}) or {}
+    step_count = len(overview_data.get("topics", []) or overview_data.get("steps", []))
+    if depth >= 0:
+        step_count = min(step_count, depth)
+    if step_count <= 0:
+        return 0
+    
+    with _prefetch_lock:
+        if _prefetch_executor is None:
+            _prefetch_executor = ThreadPoolExecutor(
+                max_workers=max(1, CURRICULUM_PREFETCH_CONCURRENCY),
+                thread_name_prefix="curriculum-prefetch"
+            )
+        if curriculum_id in _prefetch_jobs:
+            return 0
+        cancel_event = threading.Event()
+        futures: List[Future] = []
+        _prefetch_jobs[curriculum_id] = (cancel_event, futures)
+        for index in range(step_count):
+            futures.append(_prefetch_executor.submit(_prefetch_step, curriculum_id, index, cancel_event))
+    
+    for future in futures:
+        future.add_done_callback(lambda _f: _finish_prefetch_job(curriculum_id, futures))
+    
+    print(f"DEBUG: Scheduled prefetch of {step_count} step details for curriculum {curriculum_id}")
+    return step_count
+
+def cancel_prefetch(curriculum_id: str) -> bool:
+    """
+    Cancel any pending or running prefetch for a curriculum
+    
+    Queued steps are dropped; steps already generating finish but are not stored.
+    
+    Returns:
+        True if a prefetch job was cancelled
+    """
+    with _prefetch_lock:
+        job = _prefetch_jobs.pop(curriculum_id, None)
+    if not job:
+        return False
+    cancel_event, futures = job
+    cancel_event.set()
+    for future in futures:
+        future.cancel()
+    print(f"DEBUG: Cancelled prefetch for curriculum {curriculum_id}")
+    return True
+
+def shutdown_prefetcher():
+    """Cancel all prefetch jobs and stop the worker threads"""
+    global _prefetch_executor
+    for curriculum_id in list(_prefetch_jobs.keys()):
+        cancel_prefetch(curriculum_id)
+    with _prefetch_lock:
+        executor, _prefetch_executor = _prefetch_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
 def get_step_detail(curriculum_id: str, step_index: int) -> StepDetailResponse:
     """
     Get detailed content for a specific step
@@ -347,16 +570,21 @@ def get_step_detail(curriculum_id: str, step_index: int) -> StepDetailResponse:
         print(f"DEBUG: get_step_detail called for curriculum_id={curriculum_id}, step_index={step_index}")
         
         # First, get the curriculum step to check if it exists
-        curriculum_step = get_curriculum_step(curriculum_id)
+        curriculum_step = curriculum_utils.get_curriculum_step(curriculum_id)
         if not curriculum_step:
             print(f"DEBUG: ERROR - Curriculum with ID {curriculum_id} not found")
             raise Exception(f"Curriculum with ID {curriculum_id} not found")
         
-        # Check if detailed content already exists for this step
-        detailed_content = curriculum_step.get("detailed_content", {})
-        if detailed_content and str(step_index) in detailed_content:
+        # Check if detailed content already exists for this step, first in the
+        # per-step table and then in the legacy detailed_content blob
+        step_detail = curriculum_utils.get_step_detail_record(curriculum_id, step_index)
+        if step_detail is None:
+            detailed_content = curriculum_step.get("detailed_content", {})
+            if detailed_content and str(step_index) in detailed_content:
+                step_detail = detailed_content[str(step_index)]
+        
+        if step_detail is not None:
             print(f"DEBUG: Found existing detailed content for step {step_index}")
-            step_detail = detailed_content[str(step_index)]
             
             # Get step title and estimated time from the overview
             overview_data = curriculum_step.get("overview", {})
@@ -370,7 +598,7 @@ def get_step_detail(curriculum_id: str, step_index: int) -> StepDetailResponse:
                 estimated_time = step_detail.get("estimated_time", "Not specified")
             
             # Format the text
-            formatted_text = format_detailed_step_text(DetailedStep.parse_obj(step_detail))
+            formatted_text = detailagent.format_detailed_step_text(detailagent.DetailedStep.parse_obj(step_detail))
             
             return StepDetailResponse(
                 step_title=step_title,
@@ -379,51 +607,15 @@ def get_step_detail(curriculum_id: str, step_index: int) -> StepDetailResponse:
                 formatted_text=formatted_text
             )
         
-        # If we don't have the details yet, generate just this specific step
+        # If we don't have the details yet, generate just this specific step.
+        # Concurrent requests for the same step share one generation.
         print(f"DEBUG: No existing detailed content found for step {step_index}, generating now")
-        
-        # Parse curriculum data to get step information
-        overview_data = curriculum_step.get("overview", {})
-        step_data = overview_data.get("topics", []) or overview_data.get("steps", [])
-        
-        if step_index >= len(step_data):
-            print(f"DEBUG: ERROR - Step index {step_index} out of range (total steps: {len(step_data)})")
-            raise Exception(f"Step with index {step_index} not found in curriculum {curriculum_id}")
-        
-        # Get the specific step data
-        step_info = step_data[step_index]
-        step_title = step_info.get("name", step_info.get("title", "Unknown step"))
-        estimated_time = step_info.get("estimated_time", "Not specified")
-        
-        # Set up input for detail generator
-        detail_input = StepDetailInput(
-            step_title=step_title,
-            estimated_time=estimated_time,
-            subject=curriculum_step.get("step_title", "Untitled Curriculum")
-        )
-        
-        # Generate detailed content for just this step
-        detailed_step = generate_step_detail(detail_input)
-        detailed_text = format_detailed_step_text(detailed_step)
-        
-        # Save this detailed step to avoid regenerating it next time
-        if not detailed_content:
-            detailed_content = {}
-        
-        detailed_content[str(step_index)] = detailed_step.dict()
-        update_curriculum_step(
+        return step_detail_flight.do(
+            (curriculum_id, step_index),
+            generate_and_store_step_detail,
             curriculum_id,
-            curriculum_step.get("step_title", "Untitled Curriculum"),
-            curriculum_step.get("estimated_time", "Not specified"),
-            overview_data,
-            detailed_content
-        )
-        
-        return StepDetailResponse(
-            step_title=detailed_step.step_title,
-            estimated_time=detailed_step.estimated_time,
-            content=detailed_step.dict(),
-            formatted_text=detailed_text
+            step_index,
+            curriculum_step
         )
         
     except Exception as e:
@@ -443,7 +635,7 @@ def generate_roadmap(curriculum_id: str) -> RoadmapResponse:
     """
     try:
         # Get curriculum
-        curriculum_step = get_curriculum_step(curriculum_id)
+        curriculum_step = curriculum_utils.get_curriculum_step(curriculum_id)
         
         if not curriculum_step:
             raise Exception(f"Curriculum with ID {curriculum_id} not found")
@@ -455,12 +647,12 @@ def generate_roadmap(curriculum_id: str) -> RoadmapResponse:
         # Create curriculum overview object from data
         steps = []
         for topic in step_data:
-            steps.append(CurriculumStep(
+            steps.append(overview_agent.CurriculumStep(
                 title=topic.get("name", "Unknown step"),
                 estimated_time="Not specified"
             ))
         
-        curriculum = CurriculumOverview(
+        curriculum = overview_agent.CurriculumOverview(
             curriculum_id=curriculum_id,
             title=curriculum_step.get("step_title", "Untitled Curriculum"),
             overview=f"A curriculum covering key aspects of {curriculum_step.get('step_title', 'the subject')}.",
@@ -509,19 +701,25 @@ def generate_roadmap(curriculum_id: str) -> RoadmapResponse:
         print(error_details)
         raise Exception(f"Failed to generate roadmap: {str(e)}")
 
-def get_all_curriculums() -> CurriculumListResponse:
+def get_all_curriculums(limit: Optional[int] = None, offset: int = 0, include_count: bool = False) -> CurriculumListResponse:
     """
-    Get a list of all available curriculums
+    Get available curriculums, optionally one page at a time
+    
+    Args:
+        limit: Maximum number of curriculums to return (None for all)
+        offset: Number of curriculums to skip
+        include_count: Include the total number of curriculums
     
     Returns:
         CurriculumListResponse containing list of curriculum metadata
     """
     try:
-        # Get all curriculum steps from Supabase database
-        from utils.curriculum_utils import get_all_curriculum_steps
-        
-        # Query all curriculum records from Supabase
-        curriculum_records = get_all_curriculum_steps()
+        # Query curriculum IDs and titles from Supabase
+        curriculum_records, has_more, total = curriculum_utils.list_curriculum_steps(
+            limit=limit,
+            offset=offset,
+            include_count=include_count
+        )
         
         # Format the curriculum list for response
         curriculum_list = []
@@ -531,7 +729,13 @@ def get_all_curriculums() -> CurriculumListResponse:
                 "curriculum_name": record.get("step_title", "Untitled Curriculum")
             })
         
-        return CurriculumListResponse(curriculums=curriculum_list)
+        return CurriculumListResponse(
+            curriculums=curriculum_list,
+            limit=limit,
+            offset=offset,
+            next_offset=offset + len(curriculum_records) if has_more else None,
+            total=total
+        )
     except Exception as e:
         error_details = f"Error listing curriculums: {e}\n{traceback.format_exc()}"
         print(error_details)
@@ -561,7 +765,7 @@ def create_curriculum(request: CurriculumCreateRequest) -> Dict[str, str]:
         }
         
         # Save to database
-        save_result = save_curriculum_step(
+        save_result = curriculum_utils.save_curriculum_step(
             curriculum_id,
             curriculum_name,
             "Not specified",
@@ -592,10 +796,15 @@ def delete_curriculum_by_id(curriculum_id: str) -> bool:
     """
     try:
         # Check if curriculum exists
-        curriculum_step = get_curriculum_step(curriculum_id)
+        curriculum_step = curriculum_utils.get_curriculum_step(curriculum_id)
         if not curriculum_step:
             raise Exception(f"Curriculum with ID {curriculum_id} not found")
         
+        cancel_prefetch(curriculum_id)
+        if not curriculum_utils.delete_step_details(curriculum_id):
+            print(f"Warning: Failed to delete step details of curriculum {curriculum_id}")
+        curriculum_utils.invalidate_curriculum_cache(curriculum_id)
+        
         # Delete curriculum file
         # In a real implementation, you would remove from your database
         curriculum_file = os.path.join(os.path.dirname(__file__), "data", "curriculums", f"{curriculum_id}.json")
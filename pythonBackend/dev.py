@@ -19,7 +19,7 @@ from search import google_search
 from document_loader import prepare_document, process_pdf, process_web, process_image
 
 # Import agents
-from agents.writeragents import get_query_rewriter_agent, get_rag_agent, test_url_detector
+from agents.writeragents import rewrite_query, generate_rag_answer, test_url_detector
 
 # Load environment variables
 load_dotenv()
@@ -130,8 +130,7 @@ class ChatAssistant:
         # Rewrite the query for better retrieval
         print("Reformulating query...")
         try:
-            query_rewriter = get_query_rewriter_agent()
-            rewritten_query = query_rewriter.run(prompt).content
+            rewritten_query = rewrite_query(prompt)
             print(f"Original: {prompt}")
             print(f"Rewritten: {rewritten_query}")
         except Exception as e:
@@ -179,7 +178,6 @@ class ChatAssistant:
         # Generate response using the RAG agent
         print("Generating response...")
         try:
-            rag_agent = get_rag_agent()
             
             if context:
                 full_prompt = f"""Context: {context}
@@ -196,15 +194,15 @@ Rewritten Question: {rewritten_query}
                 full_prompt = f"Original Question: {prompt}\nRewritten Question: {rewritten_query}"
                 print("No relevant information found in documents or Google search.")
 
-            response = rag_agent.run(full_prompt)
+            answer = generate_rag_answer(full_prompt)
             
             # Add assistant response to history
             self.history.append({
                 "role": "assistant",
-                "content": response.content
+                "content": answer
             })
             
-            return response.content
+            return answer
                 
         except Exception as e:
             error_msg = f"Error generating response: {str(e)}"
@@ -1,47 +1,358 @@
+import re
 import tempfile
+import contextvars
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Tuple, Optional
+from typing import Any, Deque, Dict, Iterator, List, Tuple, Optional
 import os
 import logging
 from pathlib import Path
 
 import bs4
-from langchain_community.document_loaders import PyPDFLoader, WebBaseLoader, CSVLoader
+from langchain_community.document_loaders import PyPDFLoader, CSVLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
-from google import genai
-from google.generativeai import types
+import llm_gateway
+from chunker import StructuredChunker
+from utils import http_cache
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:  # Without pypdf every PDF goes through Gemini
+    PdfReader = PdfWriter = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def prepare_document(file_path: str) -> List[Document]:
+# Local PDF text-layer extraction. Pages whose text layer passes the quality
+# heuristic are used as-is; scanned or image-heavy pages go to Gemini.
+PDF_TEXT_FAST_PATH = os.getenv("PDF_TEXT_FAST_PATH", "true").lower() == "true"
+# Minimum characters for a page's text layer to count as usable
+PDF_MIN_PAGE_CHARS = int(os.getenv("PDF_MIN_PAGE_CHARS", "40"))
+# Pages with embedded images and fewer characters than this are transcribed
+# by the model so the images get described
+PDF_IMAGE_PAGE_MIN_CHARS = int(os.getenv("PDF_IMAGE_PAGE_MIN_CHARS", "400"))
+# Pages per model transcription call, and how many calls run at once
+PDF_PAGES_PER_SHARD = max(1, int(os.getenv("PDF_PAGES_PER_SHARD", "10")))
+PDF_EXTRACTION_CONCURRENCY = int(os.getenv("PDF_EXTRACTION_CONCURRENCY", "4"))
+# Seconds a single transcription call may take before it is retried
+PDF_TRANSCRIBE_TIMEOUT = float(os.getenv("PDF_TRANSCRIBE_TIMEOUT", "180"))
+
+DOCUMENT_PROMPT = """
+            type all the content of the document, keeping its structure: write headings as
+            markdown headings (#, ##, ###) and separate paragraphs, lists and tables with blank lines.
+            if there is any image describe it in detail in its own paragraph.
+            """
+
+PAGE_MARKER_PATTERN = re.compile(r"\[\[PAGE\s+(\d+)\]\]")
+
+SHARD_PROMPT = """
+            This file has {page_count} pages. For each page, first write a line [[PAGE n]] where n is
+            the page number within this file (1 to {page_count}), then type all the content of that page,
+            keeping its structure: write headings as markdown headings (#, ##, ###) and separate
+            paragraphs, lists and tables with blank lines.
+            if there is any image describe it in detail in its own paragraph.
+            """
+
+
+def _transcribe_with_gemini(file_path: str, prompt: str) -> str:
     """
-    Processes any document type using Gemini API and returns it in a format
-    compatible with the vector storage system.
+    Upload a file to Gemini and return the generated transcription.
+
+    Both calls go through the LLM gateway, which retries transient failures.
+
+    Args:
+        file_path (str): Path to the file to upload
+        prompt (str): Instruction sent along with the file
+
+    Returns:
+        str: Generated content
+    """
+    try:
+        uploaded_file = llm_gateway.upload_file(file_path)
+        logger.info(f"File uploaded successfully: {uploaded_file}")
+    except Exception as upload_error:
+        logger.error(f"File upload failed: {str(upload_error)}")
+        raise ValueError(f"File upload failed: {str(upload_error)}")
+
+    try:
+        response = llm_gateway.generate(
+            "document_transcription",
+            [uploaded_file, prompt],
+            timeout=PDF_TRANSCRIBE_TIMEOUT
+        )
+        content = response.text
+        if not content:
+            raise ValueError("Empty content received from the API")
+        logger.info(f"Generated content, length: {len(content)}")
+    except Exception as generation_error:
+        logger.error(f"Detailed generation error: {str(generation_error)}")
+        raise ValueError(f"Content generation failed: {str(generation_error)}")
+
+    return content
+
+
+def _page_image_count(page) -> int:
+    """Count image XObjects on a PDF page without decoding them"""
+    try:
+        resources = page.get("/Resources")
+        if resources is None:
+            return 0
+        xobjects = resources.get_object().get("/XObject")
+        if xobjects is None:
+            return 0
+        xobjects = xobjects.get_object()
+        return sum(1 for name in xobjects if xobjects[name].get_object().get("/Subtype") == "/Image")
+    except Exception:
+        return 0
+
+
+def is_usable_page_text(text: str, image_count: int = 0) -> bool:
+    """
+    Decide whether a page's text layer is good enough to skip the model.
+
+    Rejects empty or near-empty pages (scans), pages dominated by garbage
+    glyphs (broken font encodings) and image-heavy pages with little text.
+    """
+    stripped = (text or "").strip()
+    if len(stripped) < PDF_MIN_PAGE_CHARS:
+        return False
+    if image_count and len(stripped) < PDF_IMAGE_PAGE_MIN_CHARS:
+        return False
+
+    non_space = [ch for ch in stripped if not ch.isspace()]
+    if not non_space:
+        return False
+    # Replacement characters and control codes come from unmapped glyphs
+    garbage = sum(1 for ch in non_space if ch == "\ufffd" or (not ch.isprintable()))
+    if garbage / len(non_space) > 0.05:
+        return False
+    # Real prose is mostly letters and digits
+    alnum = sum(1 for ch in non_space if ch.isalnum())
+    if alnum / len(non_space) < 0.5:
+        return False
+    # Text layers with one glyph per "word" (letter-spaced OCR junk)
+    words = stripped.split()
+    if len(words) > 20 and sum(len(w) for w in words) / len(words) < 2:
+        return False
+    return True
+
+
+def extract_pdf_pages(file_path: str, reader=None) -> Iterator[Document]:
+    """
+    Extract a PDF page by page, using the local text layer where it is usable
+    and sending only the remaining pages to Gemini, in shards of
+    PDF_PAGES_PER_SHARD pages transcribed concurrently.
+
+    Pages are classified as they are read and yielded strictly in page order:
+    a text-layer page is yielded as soon as no earlier page is still waiting
+    for its shard, so the chunker sees headings in document order. At most
+    PDF_PAGES_PER_SHARD * (PDF_EXTRACTION_CONCURRENCY + 1) pages are held
+    back; beyond that the oldest pending shard is sent (even if not full)
+    and waited for.
+
+    Args:
+        file_path (str): Path to the PDF file
+        reader: Optional already-opened PdfReader for file_path
+
+    Yields:
+        Document: One document per page in page order; each carries `page`
+        metadata (or `pages` when the model output could not be split per
+        page, in which case it is yielded at the shard's first page)
+    """
+    reader = reader or PdfReader(file_path)
+    file_name = os.path.basename(file_path)
+    page_count = len(reader.pages)
+    max_backlog = PDF_PAGES_PER_SHARD * (max(1, PDF_EXTRACTION_CONCURRENCY) + 1)
+
+    # Pages read but not yielded yet, in page order: (page, Document) for
+    # text-layer pages, (page, shard index) for pages sent to the model
+    backlog: Deque[Tuple[int, Any]] = deque()
+    # Model pages of the shard being filled (its index is len(futures))
+    filling: List[int] = []
+    shards: List[List[int]] = []
+    futures: List[Future] = []
+    # Transcribed documents by the page they are yielded at
+    transcribed: Dict[int, List[Document]] = {}
+    collected = set()
+    shard_paths: List[str] = []
+    executor: Optional[ThreadPoolExecutor] = None
+    text_page_count = 0
+
+    def submit_shard():
+        nonlocal executor
+        shard = list(filling)
+        filling.clear()
+        # A PDF sent to the model in full needs no sub-PDF
+        whole_file = not shards and len(shard) == page_count
+        # PdfReader is not thread-safe, so sub-PDFs are written here and
+        # only the model calls run in the pool
+        shard_path = file_path if whole_file else _write_sub_pdf(reader, shard)
+        if not whole_file:
+            shard_paths.append(shard_path)
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=max(1, PDF_EXTRACTION_CONCURRENCY),
+                thread_name_prefix="pdf-extract"
+            )
+        prompt = SHARD_PROMPT.format(page_count=len(shard))
+        shards.append(shard)
+        # Run in a copy of the caller's context so token usage is
+        # attributed to the request's endpoint and session
+        futures.append(executor.submit(contextvars.copy_context().run, _transcribe_with_gemini, shard_path, prompt))
+        logger.info(f"Queued pages {shard[0]}-{shard[-1]} ({len(shard)} pages) of {file_name} for transcription")
+
+    def collect(index: int):
+        shard = shards[index]
+        for doc in _split_shard_by_page(futures[index].result(), shard):
+            doc.metadata.update({
+                "source_type": "document",
+                "file_name": file_name,
+                "extraction": "model",
+                "timestamp": datetime.now().isoformat()
+            })
+            transcribed.setdefault(doc.metadata.get("page", shard[0]), []).append(doc)
+        collected.add(index)
+
+    def drain(limit: int) -> Iterator[Document]:
+        """Yield pages that are ready; wait for shards while more than limit pages are held"""
+        while backlog:
+            page_number, item = backlog[0]
+            if isinstance(item, Document):
+                backlog.popleft()
+                yield item
+                continue
+            index = item
+            if index not in collected:
+                block = len(backlog) > limit
+                if index == len(futures):
+                    if not block:
+                        return
+                    submit_shard()
+                if not block and not futures[index].done():
+                    return
+                collect(index)
+            backlog.popleft()
+            yield from transcribed.pop(page_number, [])
+
+    try:
+        for page_number, page in enumerate(reader.pages, start=1):
+            try:
+                text = page.extract_text() or ""
+            except Exception as e:
+                logger.warning(f"Text extraction failed for page {page_number} of {file_name}: {str(e)}")
+                text = ""
+
+            if is_usable_page_text(text, _page_image_count(page)):
+                text_page_count += 1
+                backlog.append((page_number, Document(
+                    page_content=text.strip(),
+                    metadata={
+                        "source_type": "document",
+                        "file_name": file_name,
+                        "page": page_number,
+                        "extraction": "text_layer",
+                        "timestamp": datetime.now().isoformat()
+                    }
+                )))
+            else:
+                backlog.append((page_number, len(futures)))
+                filling.append(page_number)
+                # Shard the model pages so no single generation call hits the output limit
+                if len(filling) >= PDF_PAGES_PER_SHARD:
+                    submit_shard()
+            yield from drain(max_backlog)
+
+        if filling:
+            submit_shard()
+        logger.info(
+            f"PDF {file_name}: {text_page_count} pages from text layer, "
+            f"{page_count - text_page_count} pages sent to the model"
+        )
+        yield from drain(0)
+    finally:
+        if executor is not None:
+            # Do not hold the caller on transcriptions nobody will read
+            executor.shutdown(wait=False, cancel_futures=True)
+        for shard_path in shard_paths:
+            try:
+                os.unlink(shard_path)
+            except OSError:
+                pass
+
+
+def _write_sub_pdf(reader, pages: List[int]) -> str:
+    """Copy the given 1-based pages into a temporary PDF and return its path"""
+    writer = PdfWriter()
+    for page_number in pages:
+        writer.add_page(reader.pages[page_number - 1])
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
+        writer.write(tmp_file)
+        return tmp_file.name
+
+
+def _split_shard_by_page(content: str, shard: List[int]) -> List[Document]:
+    """
+    Split a shard transcription on its page markers and map the shard-local
+    page numbers back to the original ones.
+
+    Falls back to a single document covering every page in the shard when the
+    model did not emit usable markers.
+    """
+    parts = PAGE_MARKER_PATTERN.split(content)
+    # parts = [preamble, n1, text1, n2, text2, ...]
+    docs: List[Document] = []
+    preamble = parts[0].strip()
+    for i in range(1, len(parts) - 1, 2):
+        local_page = int(parts[i])
+        text = parts[i + 1].strip()
+        if not text:
+            continue
+        if 1 <= local_page <= len(shard):
+            docs.append(Document(page_content=text, metadata={"page": shard[local_page - 1]}))
+        elif docs:
+            # Out-of-range marker: keep the text with the previous page
+            docs[-1].page_content += "\n" + text
+
+    if not docs:
+        return [Document(
+            page_content=content.strip(),
+            metadata={"pages": [str(page_number) for page_number in shard]}
+        )]
+    if preamble:
+        docs[0].page_content = preamble + "\n" + docs[0].page_content
+    return docs
+
+
+def extract_document(file_path: str) -> Iterator[Document]:
+    """
+    Extracts the content of any document type, yielding unsplit documents as
+    soon as they are available. PDFs use the local text layer where possible;
+    everything else (and scanned PDF pages) is transcribed by Gemini.
     
     Args:
         file_path (str): Path to the document file
         
-    Returns:
-        List[Document]: List containing the processed document
+    Yields:
+        Document: Extracted document content with source metadata
     """
     try:
-        # Handle API key retrieval from environment
-        api_key = os.getenv("GEMINI_API_KEY", "")
-        client = genai.Client(api_key=api_key)
-        
         # Determine appropriate prompt based on file type
         file_extension = os.path.splitext(file_path)[1].lower()
-        
-        # Upload the file directly using a simpler approach
-        try:
-            uploaded_file = client.files.upload(file=file_path)
-            logger.info(f"File uploaded successfully: {uploaded_file}")
-        except Exception as upload_error:
-            logger.error(f"File upload failed: {str(upload_error)}")
-            raise ValueError(f"File upload failed: {str(upload_error)}")
+
+        if file_extension == '.pdf' and PDF_TEXT_FAST_PATH and PdfReader is not None:
+            try:
+                reader = PdfReader(file_path)
+                if reader.is_encrypted:
+                    raise ValueError("PDF is encrypted")
+            except Exception as pdf_error:
+                # Encrypted or malformed PDFs: let the model try the whole file
+                logger.warning(f"Local PDF extraction unavailable, using the model instead: {str(pdf_error)}")
+            else:
+                yield from extract_pdf_pages(file_path, reader=reader)
+                return
 
         # Build appropriate prompt based on file type
         if file_extension in ['.png', '.jpg', '.jpeg', '.gif', '.webp']:
@@ -65,48 +376,13 @@ def prepare_document(file_path: str) -> List[Document]:
             """
             source_type = "csv"
         else:
-            prompt = """
-            just type all the content of the document in a single line without any formatting.
-            if there is any image describe it in detail.
-            """
+            prompt = DOCUMENT_PROMPT
             source_type = "document"
 
-        # Generate content with a simpler approach
-        try:
-            # First try non-streaming method as fallback if needed
-            try:
-                response = client.models.generate_content(
-                    model="gemini-2.0-flash",
-                    contents=[uploaded_file, prompt],
-                )
-                content = response.text
-                logger.info(f"Generated content using non-streaming method, length: {len(content)}")
-            except Exception as non_streaming_error:
-                logger.error(f"Non-streaming attempt failed: {str(non_streaming_error)}")
-                # Try streaming as backup
-                response_chunks = []
-                for chunk in client.models.generate_content_stream(
-                    model="gemini-2.0-flash",
-                    contents=[uploaded_file, prompt],
-                ):
-                    if hasattr(chunk, 'text') and chunk.text:
-                        response_chunks.append(chunk.text)
-                    
-                if not response_chunks:
-                    raise ValueError("No content received from the streaming API")
-                    
-                content = "".join(response_chunks)
-                logger.info(f"Generated content using streaming method, length: {len(content)}")
-            
-            if not content:
-                raise ValueError("Empty content received from the API")
-                
-        except Exception as generation_error:
-            logger.error(f"Detailed generation error: {str(generation_error)}")
-            raise ValueError(f"Content generation failed: {str(generation_error)}")
+        content = _transcribe_with_gemini(file_path, prompt)
         
         # Create a Document object
-        doc = Document(
+        yield Document(
             page_content=content,
             metadata={
                 "source_type": source_type,
@@ -115,21 +391,31 @@ def prepare_document(file_path: str) -> List[Document]:
             }
         )
         
-        # Apply text splitting
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
-        )
-        chunks = text_splitter.split_documents([doc])
-        logger.info(f"Number of document chunks: {len(chunks)}")
-        
-        return chunks
-        
     except Exception as e:
         logger.error(f"Document processing error: {str(e)}")
         # Re-raise the exception with a clearer message
         raise ValueError(f"No text content could be extracted from the file: {str(e)}")
 
+def prepare_document(file_path: str) -> List[Document]:
+    """
+    Processes any document type (see extract_document) and returns it in a format
+    compatible with the vector storage system.
+    
+    Args:
+        file_path (str): Path to the document file
+        
+    Returns:
+        List[Document]: List containing the processed document chunks
+    """
+    docs = list(extract_document(file_path))
+    
+    # Apply text splitting
+    text_splitter = StructuredChunker()
+    chunks = text_splitter.split_documents(docs)
+    logger.info(f"Number of document chunks: {len(chunks)}")
+    
+    return chunks
+
 # Keep existing functions for backward compatibility
 def process_pdf(file) -> List:
     """Process PDF file and add source metadata."""
@@ -159,7 +445,7 @@ def process_pdf(file) -> List:
 
 def load_web_document(url: str) -> List:
     """
-    Load a document from a specified URL using WebBaseLoader.
+    Load a document from a specified URL through the local HTTP cache.
 
     Args:
         url (str): The URL of the webpage to load.
@@ -168,8 +454,9 @@ def load_web_document(url: str) -> List:
         List: The loaded document(s).
     """
     try:
-        loader = WebBaseLoader(url)
-        docs = loader.load()
+        from web_loader import documents_from_response
+        body, content_type = http_cache.get(url)
+        docs = documents_from_response(url, body, content_type.split(";")[0].strip().lower())
         logger.info(f"Number of web documents loaded: {len(docs)}")
         return docs
     except Exception as e:
@@ -194,16 +481,24 @@ def extract_title_and_split_content(docs: List) -> Tuple[Optional[str], List]:
         })
     
     # Apply text splitter
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200
-    )
+    text_splitter = StructuredChunker()
     content_chunks = text_splitter.split_documents(docs)
     logger.info(f"Number of content chunks after splitting: {len(content_chunks)}")
     
     return title, content_chunks
 
 
+def iter_web_documents(url: str) -> Iterator[Document]:
+    """Yield unsplit web documents with source metadata for streaming ingestion."""
+    for doc in load_web_document(url):
+        doc.metadata.update({
+            "source_type": "url",
+            "url": url,
+            "timestamp": datetime.now().isoformat()
+        })
+        yield doc
+
+
 def process_web(url: str) -> List:
     """Process web URL by loading document and splitting into chunks."""
     docs = load_web_document(url)
@@ -1,11 +1,16 @@
 import google.generativeai as genai
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 from pinecone import Pinecone, ServerlessSpec
 from langchain_pinecone import PineconeVectorStore
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 import os
 import logging
+import threading
+
+import llm_gateway
+import model_router
+from performance_monitor import track_vector_store
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -14,23 +19,49 @@ logger = logging.getLogger(__name__)
 # Constants
 INDEX_NAME = "gemini-thinking-agent-agno"
 EMBEDDING_DIMENSION = 768  # Gemini embedding-004 dimension
+# Chunks returned per retrieval; structured chunks are more precise, so fewer are needed
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+
+# Process-wide handles shared by every namespace view
+_shared_index = None
+_shared_embedder = None
+_shared_lock = threading.Lock()
 
 class GeminiEmbedder(Embeddings):
-    def __init__(self, model_name="models/text-embedding-004", api_key=None):
+    def __init__(self, model_name=None, api_key=None):
         # Use provided API key or get from environment
         api_key = api_key or os.getenv("GOOGLE_API_KEY", "")
         genai.configure(api_key=api_key)
-        self.model = model_name
+        self.model = model_name or model_router.model_for("embedding")
+
+    def _embed(self, content, task_type: str):
+        """embed_content through the LLM gateway (timeouts, retries, circuit breaker, hedging)"""
+        task_policy = model_router.policy("embedding")
+        return llm_gateway.call(
+            lambda: genai.embed_content(model=self.model, content=content, task_type=task_type),
+            self.model,
+            task="embedding",
+            hedge=task_policy.hedge
+        )
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        try:
+            # One batched request instead of one round trip per chunk
+            response = self._embed(list(texts), "retrieval_document")
+            embeddings = response['embedding']
+            if len(embeddings) == len(texts):
+                return embeddings
+        except (llm_gateway.CircuitOpenError, llm_gateway.LLMTimeoutError):
+            # Per-text calls would only pile more load onto a failing model
+            raise
+        except Exception as e:
+            logger.warning(f"Batch embedding failed, falling back to per-text calls: {str(e)}")
         return [self.embed_query(text) for text in texts]
 
     def embed_query(self, text: str) -> List[float]:
-        response = genai.embed_content(
-            model=self.model,
-            content=text,
-            task_type="retrieval_document"
-        )
+        response = self._embed(text, "retrieval_document")
         return response['embedding']
 
 
@@ -62,6 +93,146 @@ def init_pinecone(api_key=None):
         return None
 
 
+def init_shared_resources(pc_client, api_key=None):
+    """
+    Create the pooled Pinecone Index handle and the single embedder.
+
+    Called once from the FastAPI lifespan; later calls return the
+    existing handles.
+
+    Args:
+        pc_client: Pinecone client instance
+        api_key: Optional Gemini API key for the embedder
+
+    Returns:
+        tuple: (index, embedder)
+    """
+    global _shared_index, _shared_embedder
+    with _shared_lock:
+        if _shared_embedder is None:
+            _shared_embedder = GeminiEmbedder(api_key=api_key)
+        if _shared_index is None and pc_client is not None:
+            _shared_index = pc_client.Index(INDEX_NAME)
+            logger.info(f"Opened shared Pinecone index handle: {INDEX_NAME}")
+    return _shared_index, _shared_embedder
+
+
+def get_shared_index(pc_client=None):
+    """Return the pooled Index handle, creating it from pc_client if needed."""
+    if _shared_index is None and pc_client is not None:
+        init_shared_resources(pc_client)
+    return _shared_index
+
+
+def get_shared_embedder(api_key=None):
+    """Return the process-wide GeminiEmbedder, creating it if needed."""
+    if _shared_embedder is None:
+        init_shared_resources(None, api_key=api_key)
+    return _shared_embedder
+
+
+def get_namespace_vector_store(pc_client, namespace: Optional[str] = None):
+    """
+    Return a lightweight vector store view bound to a namespace.
+
+    The view reuses the pooled Index handle and embedder, so creating one
+    does no network or client setup.
+
+    Args:
+        pc_client: Pinecone client instance (used only if the pool is empty)
+        namespace: Namespace for isolating session or curriculum data
+    """
+    index = get_shared_index(pc_client)
+    if index is None:
+        return None
+    return PineconeVectorStore(
+        index=index,
+        embedding=get_shared_embedder(),
+        text_key="text",
+        namespace=namespace
+    )
+
+
+# Pinecone accepts at most 1000 IDs per delete request
+DELETE_BATCH_SIZE = 1000
+
+
+@track_vector_store("delete_vectors")
+def delete_vectors(pc_client, ids: List[str], namespace: Optional[str] = None, batch_size: int = DELETE_BATCH_SIZE) -> int:
+    """
+    Delete vectors by ID from a namespace in batches.
+
+    Args:
+        pc_client: Pinecone client instance (used only if the pool is empty)
+        ids: Vector IDs to delete
+        namespace: Namespace the vectors live in
+
+    Returns:
+        int: Number of IDs submitted for deletion
+    """
+    index = get_shared_index(pc_client)
+    if index is None:
+        raise Exception("Pinecone index is not available")
+    deleted = 0
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        index.delete(ids=batch, namespace=namespace)
+        deleted += len(batch)
+    logger.info(f"Deleted {deleted} vectors from namespace '{namespace}'")
+    return deleted
+
+
+# IDs per fetch request when reading a namespace's metadata
+FETCH_BATCH_SIZE = 100
+
+
+@track_vector_store("fetch_namespace_metadata")
+def fetch_namespace_metadata(pc_client, namespace: str, batch_size: int = FETCH_BATCH_SIZE) -> Dict[str, Dict]:
+    """
+    Read the metadata of every vector in a namespace.
+
+    Used to rebuild per-namespace state (e.g. dedup fingerprints) that is
+    stored with the vectors.
+
+    Returns:
+        Dict[str, Dict]: Vector ID -> metadata
+    """
+    index = get_shared_index(pc_client)
+    if index is None:
+        return {}
+    metadata: Dict[str, Dict] = {}
+    for ids in index.list(namespace=namespace):
+        ids = list(ids)
+        for start in range(0, len(ids), batch_size):
+            response = index.fetch(ids=ids[start:start + batch_size], namespace=namespace)
+            for vector_id, vector in response.vectors.items():
+                metadata[vector_id] = dict(getattr(vector, "metadata", None) or {})
+    return metadata
+
+
+@track_vector_store("delete_namespace")
+def delete_namespace(pc_client, namespace: str) -> bool:
+    """
+    Delete every vector in a namespace.
+
+    Returns:
+        bool: True if the namespace was purged (or did not exist)
+    """
+    index = get_shared_index(pc_client)
+    if index is None:
+        return False
+    try:
+        index.delete(delete_all=True, namespace=namespace)
+        logger.info(f"Purged namespace '{namespace}'")
+        return True
+    except Exception as e:
+        # Serverless indexes report a missing namespace as "not found"
+        if "not found" in str(e).lower():
+            return True
+        logger.error(f"Failed to purge namespace '{namespace}': {e}")
+        return False
+
+
 def create_vector_store(pc_client, texts, namespace: Optional[str] = None, curriculum_id: Optional[str] = None):
     """
     Create and initialize vector store with documents.
@@ -73,19 +244,14 @@ def create_vector_store(pc_client, texts, namespace: Optional[str] = None, curri
         curriculum_id: Optional curriculum ID to use as namespace
     """
     try:
-        # Initialize vector store
-        index = pc_client.Index(INDEX_NAME)
-        
         # Use curriculum_id as namespace if provided (takes precedence)
         if curriculum_id:
             namespace = curriculum_id
             
-        vector_store = PineconeVectorStore(
-            index=index,
-            embedding=GeminiEmbedder(),
-            text_key="text",
-            namespace=namespace
-        )
+        # Initialize vector store view over the shared index handle
+        vector_store = get_namespace_vector_store(pc_client, namespace)
+        if vector_store is None:
+            raise ValueError("Pinecone index is not available")
         
         # Add documents
         logger.info('Uploading documents to Pinecone...')
@@ -99,7 +265,8 @@ def create_vector_store(pc_client, texts, namespace: Optional[str] = None, curri
         return None
 
 
-def check_document_relevance(query: str, vector_store, threshold: float = 0.7, namespace: Optional[str] = None, curriculum_id: Optional[str] = None) -> Tuple[bool, List[Document]]:
+@track_vector_store("similarity_search")
+def check_document_relevance(query: str, vector_store, threshold: float = 0.7, namespace: Optional[str] = None, curriculum_id: Optional[str] = None, k: Optional[int] = None) -> Tuple[bool, List[Document]]:
     """
     Check if documents in vector store are relevant to the query.
     
@@ -109,6 +276,7 @@ def check_document_relevance(query: str, vector_store, threshold: float = 0.7, n
         threshold: Similarity threshold
         namespace: Optional namespace to search within
         curriculum_id: Optional curriculum ID to use as namespace
+        k: Maximum number of chunks to return (defaults to RETRIEVAL_TOP_K)
         
     Returns:
         tuple[bool, List]: (has_relevant_docs, relevant_docs)
@@ -126,7 +294,7 @@ def check_document_relevance(query: str, vector_store, threshold: float = 0.7, n
         
     retriever = vector_store.as_retriever(
         search_type="similarity_score_threshold",
-        search_kwargs={"k": 5, "score_threshold": threshold, "namespace": namespace}
+        search_kwargs={"k": k or RETRIEVAL_TOP_K, "score_threshold": threshold, "namespace": namespace}
     )
     docs = retriever.invoke(query)
     return bool(docs), docs
\ No newline at end of file
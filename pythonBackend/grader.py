@@ -1,14 +1,13 @@
 import json
-import requests
 import os
-import tempfile
 import traceback
 import logging
-import google.generativeai as genai
-from google.generativeai import types
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Tuple, TypedDict, Union
 from dotenv import load_dotenv
+from utils.singleflight import SingleFlight
+from utils.http_cache import download_to_tempfile
+import llm_gateway
 
 # Configure logging
 logging.basicConfig(
@@ -24,6 +23,9 @@ GOOGLE_API_KEY = os.environ.get("GEMINI_API_KEY", "")
 if not GOOGLE_API_KEY:
     logger.warning("GEMINI_API_KEY environment variable is not set")
 
+# Concurrent grading requests for the same file share one run
+grading_flight = SingleFlight("grading")
+
 class PaperCheckResult(BaseModel):
     Name: str = Field("", description="Paper taker's name or anything that hels identify the paper taker")
     marks: int
@@ -46,16 +48,9 @@ def download_from_url(url: str) -> Tuple[str, str]:
         filename = url.split("/")[-1]
         logger.info(f"Downloading file: {filename} from URL: {url}")
         
-        # Download the file to a temporary location
-        response = requests.get(url, stream=True)
-        response.raise_for_status()  # Raise an exception for 4XX/5XX responses
-        
-        # Create temporary file with appropriate extension
+        # Download (or copy from the HTTP cache) to a temporary file with the same extension
         file_ext = os.path.splitext(filename)[1]
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as temp_file:
-            for chunk in response.iter_content(chunk_size=8192):
-                temp_file.write(chunk)
-            temp_path = temp_file.name
+        temp_path, _ = download_to_tempfile(url, suffix=file_ext)
         logger.info(f"File downloaded successfully to: {temp_path}")
         return temp_path, filename
     except Exception as e:
@@ -70,9 +65,8 @@ def prepare_document(file_path: str) -> Dict[str, Any]:
     Returns: Dictionary with raw response
     """
     try:
-        genai.configure(api_key=GOOGLE_API_KEY)
         logger.info("Uploading file to Google AI")
-        uploaded_file = genai.upload_file(file_path)
+        uploaded_file = llm_gateway.upload_file(file_path, task="grading_upload")
         logger.info(f"File uploaded successfully: {uploaded_file}")
 
         initial_prompt = """
@@ -84,8 +78,10 @@ def prepare_document(file_path: str) -> Dict[str, Any]:
         """
 
         logger.info("Generating content with Gemini model")
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        initial_response = model.generate_content([uploaded_file, initial_prompt])
+        initial_response = llm_gateway.generate(
+            "grading_feedback",
+            [uploaded_file, initial_prompt]
+        )
         logger.info("Successfully received initial response from Gemini")
 
         return {
@@ -109,9 +105,6 @@ def analyze_document(initial_result: Dict[str, Any]) -> Dict[str, Any]:
             logger.warning("Skipping analysis as initial result was not successful")
             return initial_result
 
-        logger.info("Configuring Google AI for structured analysis")
-        genai.configure(api_key=GOOGLE_API_KEY)
-
         structure_prompt = f"""
         Convert the following feedback into a structured JSON format:
 
@@ -132,10 +125,10 @@ def analyze_document(initial_result: Dict[str, Any]) -> Dict[str, Any]:
 
         # Get structured response with simpler structure
         logger.info("Generating structured JSON response")
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        structured_response = model.generate_content(
+        structured_response = llm_gateway.generate(
+            "grading_structure",
             structure_prompt,
-            generation_config={ 'response_mime_type': 'application/json' }
+            config={ 'response_mime_type': 'application/json' }
         )
         logger.info("Successfully received structured response from Gemini")
 
@@ -191,6 +184,13 @@ def process_document(file_path_or_url: str) -> ProcessResult:
     """
     Main function that coordinates the document processing
     Accepts either a local file path or a URL
+    Concurrent calls for the same path or URL are collapsed into one run
+    """
+    return grading_flight.do(file_path_or_url, grade_document_once, file_path_or_url)
+
+def grade_document_once(file_path_or_url: str) -> ProcessResult:
+    """
+    Download (if needed), analyze and grade a single document
     """
     temp_file = None
     try:
@@ -0,0 +1,355 @@
+"""
+Streaming document ingestion: extract -> split -> embed -> upsert.
+
+Each stage runs in its own thread and hands batches to the next one through
+bounded queues, so the first chunks of a large document are searchable while
+later pages are still being extracted, and at most a few batches are held in
+memory at any time (a full queue blocks the stage feeding it).
+"""
+import hashlib
+import queue
+import contextvars
+import threading
+import time
+import uuid
+import logging
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from langchain_core.documents import Document
+
+from chunker import StructuredChunker
+from performance_monitor import performance_monitor
+from utils.dedup import FINGERPRINT_METADATA_KEY, format_fingerprint
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable per call
+EMBED_BATCH_SIZE = 32
+MAX_BUFFERED_BATCHES = 4
+# Skipped-duplicate entries included in the summary
+MAX_REPORTED_SKIPS = 50
+
+_DONE = object()
+
+
+class IngestionError(Exception):
+    """Raised when a pipeline stage fails; `stage` names the failing stage"""
+
+    def __init__(self, stage: str, error: BaseException):
+        super().__init__(f"{stage} stage failed: {error}")
+        self.stage = stage
+        self.error = error
+
+
+class StageMetrics:
+    """Per-stage counters used to report throughput"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "items": self.items,
+            "batches": self.batches,
+            "busy_seconds": round(self.busy_seconds, 4),
+            "wait_seconds": round(self.wait_seconds, 4),
+            "items_per_second": round(self.items / self.busy_seconds, 2) if self.busy_seconds else None
+        }
+
+
+class IngestionResult:
+    """Outcome of a pipeline run"""
+
+    def __init__(self):
+        self.chunks = 0
+        self.vector_ids: List[str] = []
+        self.skipped: List[Dict[str, Any]] = []
+        # Vectors of other documents that skipped chunks rely on
+        self.shared_vector_ids: List[str] = []
+        self.metrics: Dict[str, StageMetrics] = {
+            name: StageMetrics(name) for name in ("extract", "split", "dedup", "embed", "upsert")
+        }
+        self.elapsed_seconds = 0.0
+        self.first_upsert_seconds: Optional[float] = None
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "chunks": self.chunks,
+            "vectors": len(self.vector_ids),
+            "skipped_duplicates": len(self.skipped),
+            "shared_vectors": len(self.shared_vector_ids),
+            "skipped": self.skipped[:MAX_REPORTED_SKIPS],
+            "elapsed_seconds": round(self.elapsed_seconds, 4),
+            "first_upsert_seconds": round(self.first_upsert_seconds, 4) if self.first_upsert_seconds is not None else None,
+            "stages": {name: metrics.as_dict() for name, metrics in self.metrics.items()}
+        }
+
+
+def with_metadata(documents: Iterable[Document], **metadata) -> Iterator[Document]:
+    """Stamp extra metadata (e.g. the original file name) onto streamed documents"""
+    for doc in documents:
+        doc.metadata.update(metadata)
+        yield doc
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 hex digest identifying a document's content"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def deterministic_ids(document_hash: str) -> Callable[[Document, int], str]:
+    """
+    Build an id_fn deriving vector IDs from the document hash and chunk index,
+    so re-ingesting the same document overwrites its vectors instead of
+    adding copies.
+    """
+    prefix = document_hash[:32]
+
+    def id_fn(chunk: Document, chunk_index: int) -> str:
+        return f"{prefix}#{chunk_index}"
+
+    return id_fn
+
+
+def default_splitter():
+    """Text splitter used when the caller does not provide one"""
+    # A fresh chunker per run, since it tracks the current section across pages
+    return StructuredChunker()
+
+
+def _clean_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Pinecone metadata values must be str, number, bool or list of str"""
+    cleaned = {}
+    for key, value in metadata.items():
+        if value is None:
+            continue
+        if isinstance(value, (str, int, float, bool)):
+            cleaned[key] = value
+        elif isinstance(value, (list, tuple)):
+            cleaned[key] = [str(item) for item in value]
+        else:
+            cleaned[key] = str(value)
+    return cleaned
+
+
+def _put(q: queue.Queue, item, stop: threading.Event, metrics: StageMetrics) -> bool:
+    """Blocking put that gives up once the pipeline is stopping (backpressure point)"""
+    started = time.perf_counter()
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            metrics.wait_seconds += time.perf_counter() - started
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q: queue.Queue, stop: threading.Event, metrics: StageMetrics):
+    """Blocking get that gives up once the pipeline is stopping"""
+    started = time.perf_counter()
+    while not stop.is_set():
+        try:
+            item = q.get(timeout=0.1)
+            metrics.wait_seconds += time.perf_counter() - started
+            return item
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def run_ingestion(
+    documents: Iterable[Document],
+    index,
+    embedder,
+    namespace: Optional[str] = None,
+    splitter=None,
+    batch_size: int = EMBED_BATCH_SIZE,
+    max_buffered_batches: int = MAX_BUFFERED_BATCHES,
+    id_fn: Optional[Callable[[Document, int], str]] = None,
+    text_key: str = "text",
+    dedup=None
+) -> IngestionResult:
+    """
+    Stream documents through split, embed and upsert with bounded buffering.
+
+    Args:
+        documents: Iterable (typically a generator) of extracted documents
+        index: Pinecone Index handle to upsert into
+        embedder: Embeddings implementation with embed_documents()
+        namespace: Pinecone namespace (session or curriculum ID)
+        splitter: Text splitter with split_documents(); defaults to StructuredChunker
+        batch_size: Chunks per embedding/upsert batch
+        max_buffered_batches: Queue capacity between stages
+        id_fn: Optional function (chunk, chunk_index) -> vector ID; random UUIDs by default
+        text_key: Metadata key holding the chunk text (must match the vector store)
+        dedup: Optional NearDuplicateRegistry; chunks near-identical to one
+            already in the namespace (or earlier in this run) are skipped
+            before embedding and reported in IngestionResult.skipped
+
+    Returns:
+        IngestionResult with chunk counts, vector IDs and per-stage metrics
+
+    Raises:
+        IngestionError: if any stage fails; the other stages are stopped
+    """
+    splitter = splitter or default_splitter()
+    result = IngestionResult()
+    metrics = result.metrics
+    stop = threading.Event()
+    errors: List[IngestionError] = []
+    # Vector IDs registered with the dedup registry during this run
+    registered: List[str] = []
+    chunk_queue: queue.Queue = queue.Queue(maxsize=max_buffered_batches)
+    vector_queue: queue.Queue = queue.Queue(maxsize=max_buffered_batches)
+    started = time.perf_counter()
+
+    def fail(stage: str, error: BaseException):
+        errors.append(IngestionError(stage, error))
+        stop.set()
+
+    def produce():
+        """Extract and split, emitting batches of chunks"""
+        stage = "extract"
+        batch: List[tuple] = []
+        chunk_index = 0
+        try:
+            iterator: Iterator[Document] = iter(documents)
+            while not stop.is_set():
+                stage = "extract"
+                t0 = time.perf_counter()
+                try:
+                    doc = next(iterator)
+                except StopIteration:
+                    break
+                metrics["extract"].busy_seconds += time.perf_counter() - t0
+                metrics["extract"].items += 1
+
+                stage = "split"
+                t0 = time.perf_counter()
+                chunks = splitter.split_documents([doc])
+                metrics["split"].busy_seconds += time.perf_counter() - t0
+                metrics["split"].items += len(chunks)
+
+                for chunk in chunks:
+                    vector_id = id_fn(chunk, chunk_index) if id_fn else str(uuid.uuid4())
+                    chunk_index += 1
+                    if dedup is not None:
+                        stage = "dedup"
+                        t0 = time.perf_counter()
+                        fingerprint = dedup.fingerprint(chunk.page_content)
+                        duplicate_of = dedup.check_and_add(namespace or "", chunk.page_content, vector_id, fingerprint)
+                        metrics["dedup"].busy_seconds += time.perf_counter() - t0
+                        metrics["dedup"].items += 1
+                        if duplicate_of is not None:
+                            result.skipped.append({
+                                "chunk_index": chunk_index - 1,
+                                "duplicate_of": duplicate_of,
+                                "file_name": chunk.metadata.get("file_name"),
+                                "url": chunk.metadata.get("url"),
+                                "page": chunk.metadata.get("page"),
+                                "preview": chunk.page_content[:80]
+                            })
+                            continue
+                        # Stored with the vector so the registry can be rebuilt from the index
+                        chunk.metadata[FINGERPRINT_METADATA_KEY] = format_fingerprint(fingerprint)
+                        registered.append(vector_id)
+                    batch.append((vector_id, chunk))
+                    if len(batch) >= batch_size:
+                        metrics["split"].batches += 1
+                        if not _put(chunk_queue, batch, stop, metrics["split"]):
+                            return
+                        batch = []
+            if batch and not stop.is_set():
+                metrics["split"].batches += 1
+                _put(chunk_queue, batch, stop, metrics["split"])
+        except BaseException as e:
+            fail(stage, e)
+        finally:
+            _put(chunk_queue, _DONE, stop, metrics["split"])
+
+    def embed():
+        """Embed batches of chunks"""
+        try:
+            while True:
+                batch = _get(chunk_queue, stop, metrics["embed"])
+                if batch is _DONE:
+                    break
+                t0 = time.perf_counter()
+                vectors = embedder.embed_documents([chunk.page_content for _, chunk in batch])
+                metrics["embed"].busy_seconds += time.perf_counter() - t0
+                metrics["embed"].items += len(batch)
+                metrics["embed"].batches += 1
+                if not _put(vector_queue, list(zip(batch, vectors)), stop, metrics["embed"]):
+                    return
+        except BaseException as e:
+            fail("embed", e)
+        finally:
+            _put(vector_queue, _DONE, stop, metrics["embed"])
+
+    # Each stage runs in a copy of the caller's context, so model calls made
+    # while extracting and embedding are attributed to the request's endpoint
+    # and session (a context can only be entered by one thread at a time)
+    producer = threading.Thread(
+        target=contextvars.copy_context().run, args=(produce,), name="ingest-extract", daemon=True
+    )
+    embedder_thread = threading.Thread(
+        target=contextvars.copy_context().run, args=(embed,), name="ingest-embed", daemon=True
+    )
+    producer.start()
+    embedder_thread.start()
+
+    # Upsert in the calling thread
+    try:
+        while True:
+            items = _get(vector_queue, stop, metrics["upsert"])
+            if items is _DONE:
+                break
+            records = []
+            for (vector_id, chunk), values in items:
+                metadata = _clean_metadata(dict(chunk.metadata))
+                metadata[text_key] = chunk.page_content
+                records.append({"id": vector_id, "values": values, "metadata": metadata})
+            t0 = time.perf_counter()
+            index.upsert(vectors=records, namespace=namespace)
+            elapsed = time.perf_counter() - t0
+            metrics["upsert"].busy_seconds += elapsed
+            performance_monitor.track_vector_store_operation("upsert", elapsed)
+            metrics["upsert"].items += len(records)
+            metrics["upsert"].batches += 1
+            result.vector_ids.extend(record["id"] for record in records)
+            result.chunks += len(records)
+            if result.first_upsert_seconds is None:
+                result.first_upsert_seconds = time.perf_counter() - started
+    except BaseException as e:
+        fail("upsert", e)
+    finally:
+        if errors:
+            stop.set()
+        producer.join()
+        embedder_thread.join()
+
+    result.elapsed_seconds = time.perf_counter() - started
+    own = set(result.vector_ids)
+    result.shared_vector_ids = list(dict.fromkeys(
+        skip["duplicate_of"] for skip in result.skipped if skip["duplicate_of"] not in own
+    ))
+    if errors:
+        if dedup is not None:
+            # Chunks that never reached the index must not block re-ingestion
+            stored = set(result.vector_ids)
+            dedup.remove(namespace or "", [vector_id for vector_id in registered if vector_id not in stored])
+        raise errors[0]
+
+    logger.info(
+        f"Ingested {result.chunks} chunks ({len(result.skipped)} near-duplicates skipped) "
+        f"into namespace '{namespace}' in {result.elapsed_seconds:.2f}s "
+        f"(first searchable after {result.first_upsert_seconds or 0:.2f}s)"
+    )
+    return result
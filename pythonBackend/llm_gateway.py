@@ -0,0 +1,527 @@
+"""
+Single gateway for every Gemini call made by the backend.
+
+Agents, the grader, search and document extraction call generate(),
+run_agent(), upload_file() or call() here instead of talking to the SDKs
+directly. Calls are named by task, and generate() takes the model and
+generation settings from the task's model_router policy. Every call gets:
+
+- a per-attempt timeout (the attempt is abandoned, not interrupted)
+- retries on transient errors (429, 5xx, timeouts, connection resets) with
+  jittered exponential backoff; client errors (400, 403, ...) fail at once
+- a circuit breaker per model: after LLM_BREAKER_FAILURES consecutive
+  transient failures the model is short-circuited for LLM_BREAKER_COOLDOWN
+  seconds, then a single probe call decides whether it closes again
+- optional hedging for short latency-critical calls: if the first attempt
+  has not answered after the model's recent p95 latency, a second identical
+  request is sent and whichever finishes first wins
+- a bound on abandoned attempts: a timed-out attempt (or a losing hedge)
+  keeps its pool thread until the SDK returns, so once
+  LLM_GATEWAY_MAX_ABANDONED of them are still running, no more hedges are
+  sent and timed-out calls are not retried
+- per-task metrics (calls, failures, retries, timeouts, hedges, latency),
+  reported through stats(), plus a per-task latency histogram in
+  performance_monitor for /metrics
+
+generate() and run_agent() also record the input and output tokens of each
+call with token_accounting, attributed to the task and the calling request's
+endpoint and session.
+
+Errors that survive the retries are raised as LLMError subclasses, so the
+callers' existing fallbacks still apply.
+
+Hedges and retries run the call again while an earlier attempt may still be
+running, so every attempt must be independent: run_agent() takes an agent
+factory and builds a fresh agno Agent per attempt, since Agent.run mutates
+the agent.
+"""
+import os
+import time
+import random
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import model_router
+import token_accounting
+from performance_monitor import performance_monitor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Seconds each attempt may take before it is abandoned
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+# Retries after the first attempt for transient errors
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+# Consecutive transient failures that open a model's circuit, and for how long
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+# Hedge delay used until enough latencies are known, and its lower bound
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "2.5"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+# Threads running attempts (abandoned attempts hold a thread until they return)
+LLM_GATEWAY_WORKERS = int(os.getenv("LLM_GATEWAY_WORKERS", "48"))
+# Abandoned attempts allowed to hold gateway threads before hedging and
+# retrying timed-out calls stop
+LLM_GATEWAY_MAX_ABANDONED = int(os.getenv("LLM_GATEWAY_MAX_ABANDONED", str(max(1, LLM_GATEWAY_WORKERS // 2))))
+
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+_RETRYABLE_MARKERS = (
+    "resource_exhausted", "unavailable", "deadline", "timed out", "timeout",
+    "rate limit", "quota", "overloaded", "internal error", "connection reset",
+    "connection aborted", "remote end closed", "temporarily"
+)
+_LATENCY_SAMPLES = 256
+_HEDGE_MIN_SAMPLES = 20
+
+
+class LLMError(Exception):
+    """Raised when a model call fails after retries"""
+
+    def __init__(self, message: str, model: str, task: str, cause: Optional[BaseException] = None):
+        super().__init__(message)
+        self.model = model
+        self.task = task
+        self.cause = cause
+
+
+class LLMTimeoutError(LLMError):
+    """Raised when every attempt of a call timed out"""
+
+
+class CircuitOpenError(LLMError):
+    """Raised without calling the model while its circuit is open"""
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    for attr in ("code", "status_code", "status"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+        # google.api_core exceptions expose an HTTPStatus-like code
+        value = getattr(value, "value", None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True for rate limits, server errors, timeouts and dropped connections"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = _status_code(error)
+    if status is not None:
+        return status in _RETRYABLE_STATUS
+    message = str(error).lower()
+    if any(marker in message for marker in _RETRYABLE_MARKERS):
+        return True
+    return any(f" {code}" in message or message.startswith(str(code)) for code in _RETRYABLE_STATUS)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one model"""
+
+    def __init__(self, name: str, failure_threshold: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go out now (half-open lets one probe through)"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """Forget a probe that ended without a verdict (e.g. a client error)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, "times_opened": self.times_opened}
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class _TaskMetrics:
+    def __init__(self):
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.short_circuited = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.recent: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self.models: Dict[str, int] = {}
+
+    def snapshot(self) -> Dict[str, Any]:
+        recent = sorted(self.recent)
+        return {
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "short_circuited": self.short_circuited,
+            "avg_latency_ms": round(self.total_latency / self.successes * 1000, 2) if self.successes else 0.0,
+            "max_latency_ms": round(self.max_latency * 1000, 2),
+            "p50_latency_ms": round(_percentile(recent, 0.50) * 1000, 2),
+            "p95_latency_ms": round(_percentile(recent, 0.95) * 1000, 2),
+            "models": dict(self.models)
+        }
+
+
+class LLMGateway:
+    """Retries, circuit breaking, timeouts, hedging and metrics for model calls"""
+
+    def __init__(self, max_workers: int = LLM_GATEWAY_WORKERS, max_abandoned: int = LLM_GATEWAY_MAX_ABANDONED):
+        self._executor = ThreadPoolExecutor(max_workers=max(2, max_workers), thread_name_prefix="llm-gateway")
+        self.max_abandoned = max(0, max_abandoned)
+        # Attempts no caller waits for any more that still hold a pool thread
+        self._abandoned = 0
+        self.abandoned_total = 0
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._metrics: Dict[str, _TaskMetrics] = {}
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = self._breakers[model] = CircuitBreaker(model)
+            return breaker
+
+    def _task_metrics(self, task: str) -> _TaskMetrics:
+        metrics = self._metrics.get(task)
+        if metrics is None:
+            metrics = self._metrics[task] = _TaskMetrics()
+        return metrics
+
+    def _count(self, task: str, field: str, amount: int = 1):
+        with self._lock:
+            metrics = self._task_metrics(task)
+            setattr(metrics, field, getattr(metrics, field) + amount)
+
+    def _record_latency(self, task: str, model: str, latency: float):
+        with self._lock:
+            metrics = self._task_metrics(task)
+            metrics.successes += 1
+            metrics.total_latency += latency
+            metrics.max_latency = max(metrics.max_latency, latency)
+            metrics.recent.append(latency)
+            samples = self._latencies.get(model)
+            if samples is None:
+                samples = self._latencies[model] = deque(maxlen=_LATENCY_SAMPLES)
+            samples.append(latency)
+
+    def hedge_delay(self, model: str) -> float:
+        """Recent p95 latency of the model, or LLM_HEDGE_DELAY until enough samples exist"""
+        with self._lock:
+            samples = sorted(self._latencies.get(model, ()))
+        if len(samples) < _HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DELAY
+        return max(LLM_HEDGE_MIN_DELAY, _percentile(samples, 0.95))
+
+    def _submit(self, fn: Callable[[], Any]) -> Future:
+        # Each attempt runs in its own copy of the caller's context
+        return self._executor.submit(contextvars.copy_context().run, fn)
+
+    def _abandon(self, futures: List[Future]):
+        """Stop waiting for attempts; running ones are counted until they return"""
+        for future in futures:
+            if future.cancel():
+                continue
+            with self._lock:
+                self._abandoned += 1
+                self.abandoned_total += 1
+            future.add_done_callback(self._abandoned_done)
+
+    def _abandoned_done(self, _future: Future):
+        with self._lock:
+            self._abandoned -= 1
+
+    def can_abandon(self) -> bool:
+        """Whether another attempt may be left running in the background"""
+        with self._lock:
+            return self._abandoned < self.max_abandoned
+
+    def _attempt(self, fn: Callable[[], Any], model: str, task: str, timeout: float, hedge: bool) -> Any:
+        """Run one (possibly hedged) attempt and return the first successful result"""
+        deadline = time.monotonic() + timeout
+        primary = self._submit(fn)
+        futures: List[Future] = [primary]
+
+        if hedge and self.can_abandon():
+            delay = min(self.hedge_delay(model), timeout)
+            done, _ = wait(futures, timeout=delay)
+            if not done and time.monotonic() < deadline:
+                self._count(task, "hedges")
+                futures.append(self._submit(fn))
+
+        error: Optional[BaseException] = None
+        try:
+            while futures:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, _ = wait(futures, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    futures.remove(future)
+                    if future.exception() is None:
+                        if future is not primary:
+                            self._count(task, "hedge_wins")
+                        return future.result()
+                    error = future.exception()
+            if error is not None and not futures:
+                raise error
+            raise TimeoutError(f"{task} call to {model} timed out after {timeout:g}s")
+        finally:
+            # The losing hedge or timed-out attempts keep running
+            self._abandon(futures)
+
+    def call(
+        self,
+        fn: Callable[[], Any],
+        model: str,
+        task: str = "default",
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        hedge: bool = False
+    ) -> Any:
+        """
+        Run a model call through the gateway
+
+        Args:
+            fn: Zero-argument callable performing the SDK request
+            model: Model name (selects the circuit breaker)
+            task: Task name the metrics are reported under
+            timeout: Seconds per attempt (LLM_TIMEOUT by default)
+            retries: Retries for transient errors (LLM_MAX_RETRIES by default)
+            hedge: Send a backup request if the first is slow (idempotent calls only)
+
+        Returns:
+            Whatever fn returns
+
+        Raises:
+            CircuitOpenError: the model's circuit is open
+            LLMTimeoutError: every attempt timed out
+            LLMError: the call failed with a non-transient error or ran out of retries
+        """
+        # End-to-end time, retries and backoff included, for /metrics
+        started = time.monotonic()
+        try:
+            return self._call(fn, model, task, timeout, retries, hedge)
+        finally:
+            performance_monitor.track_llm_call(time.monotonic() - started, task=task)
+
+    def _call(
+        self,
+        fn: Callable[[], Any],
+        model: str,
+        task: str,
+        timeout: Optional[float],
+        retries: Optional[int],
+        hedge: bool
+    ) -> Any:
+        timeout = LLM_TIMEOUT if timeout is None else timeout
+        retries = LLM_MAX_RETRIES if retries is None else max(0, retries)
+        breaker = self.breaker(model)
+        with self._lock:
+            metrics = self._task_metrics(task)
+            metrics.calls += 1
+            metrics.models[model] = metrics.models.get(model, 0) + 1
+
+        last_error: Optional[BaseException] = None
+        attempts = 0
+        for attempt in range(retries + 1):
+            if not breaker.allow():
+                self._count(task, "short_circuited")
+                self._count(task, "failures")
+                raise CircuitOpenError(f"Circuit for {model} is open", model, task, last_error)
+
+            started = time.monotonic()
+            attempts += 1
+            try:
+                result = self._attempt(fn, model, task, timeout, hedge)
+            except Exception as e:
+                last_error = e
+                if isinstance(e, TimeoutError):
+                    self._count(task, "timeouts")
+                if not is_retryable(e):
+                    breaker.release_probe()
+                    self._count(task, "failures")
+                    raise LLMError(f"{task} call to {model} failed: {str(e)}", model, task, e) from e
+                breaker.record_failure()
+                if isinstance(e, TimeoutError) and not self.can_abandon():
+                    logger.warning(f"{task} call to {model} timed out; not retrying, too many abandoned attempts running")
+                    break
+                if attempt < retries:
+                    self._count(task, "retries")
+                    backoff = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+                    logger.warning(
+                        f"{task} call to {model} failed ({type(e).__name__}: {str(e)[:200]}), "
+                        f"retry {attempt + 1}/{retries} in {backoff:.2f}s"
+                    )
+                    time.sleep(backoff)
+                continue
+
+            breaker.record_success()
+            self._record_latency(task, model, time.monotonic() - started)
+            return result
+
+        self._count(task, "failures")
+        error_type = LLMTimeoutError if isinstance(last_error, TimeoutError) else LLMError
+        raise error_type(
+            f"{task} call to {model} failed after {attempts} attempts: {str(last_error)}", model, task, last_error
+        ) from last_error
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tasks = {task: metrics.snapshot() for task, metrics in self._metrics.items()}
+            breakers = list(self._breakers.items())
+            abandoned = {
+                "in_flight": self._abandoned,
+                "limit": self.max_abandoned,
+                "total": self.abandoned_total
+            }
+        return {
+            "tasks": tasks,
+            "circuits": {model: breaker.stats() for model, breaker in breakers},
+            "abandoned_attempts": abandoned
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Process-wide gateway and shared google.genai client
+gateway = LLMGateway()
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the shared google.genai Client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from google import genai
+                _client = genai.Client(api_key=os.getenv("GEMINI_API_KEY", ""))
+    return _client
+
+
+def _record_tokens(task: str, model: str, contents: Any, response: Any):
+    try:
+        token_accounting.record_call(task, model, contents, response)
+    except Exception as e:
+        logger.warning(f"Could not record token usage for {task}: {str(e)}")
+
+
+def call(fn: Callable[[], Any], model: str, task: str = "default", **options) -> Any:
+    """Run an arbitrary SDK call through the gateway (see LLMGateway.call)"""
+    return gateway.call(fn, model, task, **options)
+
+
+def generate(task: str, contents: Any, config: Any = None, model: Optional[str] = None, **options) -> Any:
+    """
+    client.models.generate_content on the shared client, through the gateway
+
+    The model, max output tokens, temperature and hedging come from the task's
+    model_router policy; keys set in a dict `config` and explicit options take
+    precedence. Typed config objects are passed through unchanged.
+    """
+    task_policy = model_router.policy(task)
+    model = model or task_policy.model
+    if config is None or isinstance(config, dict):
+        config = dict(task_policy.generation_config(), **(config or {}))
+    options.setdefault("hedge", task_policy.hedge)
+    client = get_client()
+    response = gateway.call(
+        lambda: client.models.generate_content(model=model, contents=contents, config=config),
+        model, task, **options
+    )
+    _record_tokens(task, model, contents, response)
+    return response
+
+
+def run_agent(make_agent: Callable[[], Any], prompt: str, task: str = "default", **options) -> Any:
+    """
+    agent.run(prompt) for an agno Agent, through the gateway (hedged per the task policy)
+
+    Args:
+        make_agent: Factory returning a new Agent; every attempt, hedge and
+            retry gets its own instance, because Agent.run mutates the agent
+            and an abandoned attempt may still be running
+        prompt: Prompt to run
+        task: Task name (model_router policy and metrics)
+    """
+    model = model_router.model_for(task)
+    options.setdefault("hedge", model_router.policy(task).hedge)
+    response = gateway.call(lambda: make_agent().run(prompt), model, task, **options)
+    _record_tokens(task, model, prompt, response)
+    return response
+
+
+def upload_file(file_path: str, task: str = "file_upload", timeout: Optional[float] = None) -> Any:
+    """
+    Upload a file with the shared client for use in a later prompt.
+
+    Uploads are not idempotent (a retried or hedged attempt after a timeout
+    can leave a duplicate file behind), so the call is made exactly once.
+    """
+    client = get_client()
+    return gateway.call(lambda: client.files.upload(file=file_path), "gemini-files", task, timeout=timeout, retries=0)
+
+
+def stats() -> Dict[str, Any]:
+    return gateway.stats()
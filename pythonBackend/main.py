@@ -1,17 +1,18 @@
 import os
 import json
-import tempfile
+import functools
 import uuid
-import importlib
 from typing import List, Optional, Dict, Any
 from dotenv import load_dotenv
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, BackgroundTasks, Query, Header, Security
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, BackgroundTasks, Query, Header, Security, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from fastapi.security import APIKeyHeader
 from pydantic import BaseModel, HttpUrl
 from contextlib import asynccontextmanager
-import google.generativeai as genai
 import sys
+import asyncio
+import time
 from pathlib import Path
 
 # Improve the project path setup
@@ -25,52 +26,35 @@ sys.path.insert(0, str(current_dir))
 # Add parent of project_root to support teacherassistant.backend imports
 sys.path.insert(0, str(project_root.parent))
 
-# Now import the modules
-# Import shared functionality from embedder.py
-from embedder import (
-    init_pinecone,
-    create_vector_store,
-    check_document_relevance,
-    GeminiEmbedder
-)
-from langchain_pinecone import PineconeVectorStore
-
-from search import google_search
-
-# Import document processing functions using direct imports
-from document_loader import prepare_document, process_pdf, process_web, process_image
-
-# Import agents using direct imports
-from agents.writeragents import get_query_rewriter_agent, get_rag_agent, test_url_detector, generate_session_title
-
-# Import session management functions
-from utils.session_manager import (
-    save_session,
-    load_session,
-    get_available_sessions,
-    delete_session,
-    create_new_session
-)
+# Heavy modules (langchain, agno, Google SDKs, Pinecone, Supabase) are imported
+# lazily so the app can start serving /livez immediately; the warm-up task
+# started in lifespan loads them in the background.
+from utils.lazy_import import lazy_import, preload
 
-# Import supabase client
-from utils.supabase_client import initialize_supabase
+embedder = lazy_import("embedder")
+search = lazy_import("search")
+document_loader = lazy_import("document_loader")
+ingestion_pipeline = lazy_import("ingestion_pipeline")
+writeragents = lazy_import("agents.writeragents")
+intent_detector = lazy_import("agents.intentdetectorAgent")
+session_manager = lazy_import("utils.session_manager")
+supabase_client = lazy_import("utils.supabase_client")
+grader = lazy_import("grader")
+curriculum_utils = lazy_import("utils.curriculum_utils")
+web_loader = lazy_import("web_loader")
 
-from agents.intentdetectorAgent import detect_google_search_intent
+dedup = lazy_import("utils.dedup")
+llm_gateway = lazy_import("llm_gateway")
+model_router = lazy_import("model_router")
+token_accounting = lazy_import("token_accounting")
 
-# Import curriculum service
-from curriculum_service import (
-    CurriculumRequest,
-    CurriculumModificationRequest,
-    CurriculumResponse,
-    StepDetailResponse,
-    generate_curriculum,
-    get_curriculum,
-    modify_curriculum_by_id,
-    generate_curriculum_details,
-    get_step_detail
-)
+from utils import uploads
+from performance_monitor import OPENMETRICS_CONTENT_TYPE, performance_monitor, track_endpoint_performance
+from utils.executors import run_llm, run_db, executor_stats, shutdown_executors
+from utils.admission import ADMISSION_ENABLED, RateLimited, Saturated, admission_controller, retry_after_header
 
-# Import curriculum service with new functions
+# Import curriculum service (request/response models are needed at import time,
+# the agents behind it are imported lazily)
 from curriculum_service import (
     CurriculumRequest,
     CurriculumModificationRequest,
@@ -85,7 +69,9 @@ from curriculum_service import (
     get_step_detail,
     get_all_curriculums,
     create_curriculum,
-    delete_curriculum_by_id
+    delete_curriculum_by_id,
+    shutdown_prefetcher,
+    lazy_modules as curriculum_service_modules
 )
 
 # Load environment variables
@@ -94,6 +80,8 @@ load_dotenv()
 # Get API keys from environment variables with fallbacks
 GOOGLE_API_KEY = os.getenv("GEMINI_API_KEY", "")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY", "")
+# Read here rather than from utils.supabase_client so probes don't import the Supabase SDK
+SUPABASE_CONFIGURED = bool(os.getenv("SUPABASE_URL") and os.getenv("SUPABASE_KEY"))
 API_KEY = os.getenv("API_KEY", "")  # Remove default value to make authentication optional
 API_AUTH_REQUIRED = os.getenv("API_AUTH_REQUIRED", "false").lower() == "true"  # Default to not requiring auth
 
@@ -105,8 +93,13 @@ app_state = {
     "vector_store": None,
     "processed_documents": [],
     "pinecone_client": None,
+    "pinecone_index": None,
+    "embedder": None,
     "supabase_client": None,
-    "session_vector_stores": {}
+    "session_vector_stores": {},
+    "warmup_task": None,
+    "ready": False,
+    "startup_errors": {}
 }
 
 # Setup security
@@ -126,18 +119,101 @@ def get_api_key(api_key: str = Security(api_key_header)):
         detail="Invalid API key",
     )
 
+def admission(endpoint: str):
+    """
+    Dependency admitting a request to an LLM-heavy endpoint.
+
+    Callers over their rate get 429; when the endpoint's model is at capacity
+    and the wait queue is full or the wait deadline passes, 503. Both carry a
+    Retry-After header.
+    """
+    async def dependency(request: Request, api_key: Optional[str] = Security(api_key_header)):
+        if not ADMISSION_ENABLED:
+            yield
+            return
+        tenant = api_key or request.headers.get("X-Tenant-ID") or (request.client.host if request.client else "anonymous")
+        try:
+            limiter = await admission_controller.admit(endpoint, tenant)
+        except RateLimited as e:
+            raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e.retry_after))
+        except Saturated as e:
+            raise HTTPException(status_code=503, detail=str(e), headers=retry_after_header(e.retry_after))
+        try:
+            yield
+        finally:
+            admission_controller.release(limiter)
+    return dependency
+
+def warm_up():
+    """
+    Initialize heavy clients and modules off the startup path.
+
+    Runs in a worker thread from lifespan so the app can answer /livez while
+    Pinecone and Supabase connect.
+    """
+    started = time.time()
+    try:
+        import google.generativeai as genai
+        genai.configure(api_key=GOOGLE_API_KEY)
+    except Exception as e:
+        app_state["startup_errors"]["genai"] = str(e)
+
+    try:
+        app_state["pinecone_client"] = embedder.init_pinecone(PINECONE_API_KEY)
+        if app_state["pinecone_client"]:
+            # One pooled Index handle and one embedder shared by all namespaces
+            app_state["pinecone_index"], app_state["embedder"] = embedder.init_shared_resources(
+                app_state["pinecone_client"], api_key=GOOGLE_API_KEY
+            )
+            # Rebuild dedup fingerprints of a session from its stored vectors
+            dedup.dedup_registry.set_loader(
+                functools.partial(embedder.fetch_namespace_metadata, app_state["pinecone_client"])
+            )
+    except Exception as e:
+        app_state["startup_errors"]["pinecone"] = str(e)
+
+    try:
+        app_state["supabase_client"] = supabase_client.initialize_supabase()
+    except Exception as e:
+        app_state["startup_errors"]["supabase"] = str(e)
+
+    try:
+        preload(
+            search, document_loader, web_loader, ingestion_pipeline, writeragents, intent_detector,
+            session_manager, grader, curriculum_utils, dedup, llm_gateway, model_router, token_accounting,
+            *curriculum_service_modules
+        )
+    except Exception as e:
+        app_state["startup_errors"]["modules"] = str(e)
+
+    app_state["ready"] = True
+    print(f"Warm-up finished in {time.time() - started:.2f}s")
+
+async def ensure_warm():
+    """Wait for the background warm-up to finish before touching shared clients"""
+    task = app_state["warmup_task"]
+    if task is not None and not task.done():
+        await asyncio.shield(task)
+
 # Setup lifespan for FastAPI
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Initialize on startup
+    # Initialize on startup without blocking on network calls
     os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
-    genai.configure(api_key=GOOGLE_API_KEY)
-    app_state["pinecone_client"] = init_pinecone(PINECONE_API_KEY)
-    app_state["supabase_client"] = initialize_supabase()
+    app_state["warmup_task"] = asyncio.create_task(asyncio.to_thread(warm_up))
     
     yield
     
     # Clean up on shutdown
+    task = app_state["warmup_task"]
+    if task is not None and not task.done():
+        task.cancel()
+    shutdown_prefetcher()
+    if web_loader.is_loaded:
+        await web_loader.close_client()
+    shutdown_executors(wait=False)
+    if llm_gateway.is_loaded:
+        llm_gateway.gateway.shutdown()
     app_state["vector_store"] = None
     app_state["processed_documents"] = []
     app_state["session_vector_stores"] = {}
@@ -177,6 +253,7 @@ class ProcessResponse(BaseModel):
     success: bool
     sources: List[str] = []
     session_id: str
+    ingestion: Optional[Dict[str, Any]] = None
 
 class SourceResponse(BaseModel):
     sources: List[str]
@@ -204,19 +281,8 @@ class CreateSessionResponse(BaseModel):
     session_id: str
     session_name: str
 
-# Performance tracking dictionary
-performance_metrics = {
-    "vector_store_creation_time": [],
-    "vector_store_query_time": [],
-    "session_load_time": [],
-    "session_save_time": [],
-    "api_response_time": {},
-    "gemini_api_calls": 0
-}
-
 # Helper function to get or create session vector store with caching and performance tracking
 def get_session_vector_store(session_id: str):
-    import time
     start_time = time.time()
     
     if session_id in app_state["session_vector_stores"]:
@@ -233,19 +299,15 @@ def get_session_vector_store(session_id: str):
                     del app_state["session_vector_stores"][old_session]
                 print(f"Cleaned up {len(oldest_sessions)} old vector store sessions")
             
-            index = app_state["pinecone_client"].Index("gemini-thinking-agent-agno")
-            from embedder import GeminiEmbedder
-            vector_store = PineconeVectorStore(
-                index=index,
-                embedding=GeminiEmbedder(api_key=GOOGLE_API_KEY),
-                text_key="text",
-                namespace=session_id
-            )
+            # Lightweight view over the pooled index handle and embedder
+            vector_store = embedder.get_namespace_vector_store(app_state["pinecone_client"], namespace=session_id)
+            if vector_store is None:
+                return None
             app_state["session_vector_stores"][session_id] = vector_store
             
             # Track performance metric
             creation_time = time.time() - start_time
-            performance_metrics["vector_store_creation_time"].append(creation_time)
+            performance_monitor.track_vector_store_operation("open_namespace", creation_time)
             if creation_time > 1.0:  # Log slow operations
                 print(f"WARNING: Slow vector store creation: {creation_time:.2f}s for session {session_id}")
                 
@@ -255,11 +317,118 @@ def get_session_vector_store(session_id: str):
     
     return None
 
+def ingest_documents(session_id: str, documents, document_hash: Optional[str] = None):
+    """
+    Stream documents into the session's namespace.
+
+    Chunks are embedded and upserted as soon as they are produced; see
+    ingestion_pipeline.run_ingestion for buffering and per-stage metrics.
+    Near-duplicates of chunks already in the session are skipped. With a
+    document_hash, vector IDs are derived from it so a repeat overwrites
+    rather than duplicates.
+    """
+    result = ingestion_pipeline.run_ingestion(
+        documents,
+        embedder.get_shared_index(app_state["pinecone_client"]),
+        embedder.get_shared_embedder(GOOGLE_API_KEY),
+        namespace=session_id,
+        id_fn=ingestion_pipeline.deterministic_ids(document_hash) if document_hash else None,
+        dedup=dedup.dedup_registry if dedup.DEDUP_ENABLED else None
+    )
+    print(f"Ingestion metrics for session {session_id}: {json.dumps(result.summary())}")
+    return result
+
+def ingest_web_page(session_id: str, page) -> bool:
+    """
+    Ingest a fetched page into the session and record it; returns True if
+    the page's content is in the session (stored now or earlier)
+    """
+    try:
+        if find_ingested_document(session_id, page.content_hash):
+            return True
+        ingestion = ingest_documents(session_id, iter(page.documents), page.content_hash)
+        if ingestion.chunks or ingestion.skipped:
+            record_ingested_document(session_id, page.content_hash, page.url, "url", ingestion)
+            return True
+        return False
+    finally:
+        page.close()
+
+def find_ingested_document(session_id: str, document_hash: str) -> Optional[Dict[str, Any]]:
+    """Return the session's record for this content hash if it was already ingested"""
+    record, error = session_manager.get_session_document(session_id, document_hash)
+    if error:
+        print(f"Could not check previous ingestion for session {session_id}: {error}")
+    return record
+
+def record_ingested_document(session_id: str, document_hash: str, source: str, source_type: str, ingestion):
+    """Remember which vectors a document produced so repeats return immediately"""
+    success, error = session_manager.save_session_document(
+        session_id, document_hash, source, source_type, ingestion.vector_ids, ingestion.shared_vector_ids
+    )
+    if not success:
+        print(f"Failed to record ingested document {source}: {error}")
+
+def already_ingested_response(session_id: str, record: Dict[str, Any]) -> Dict[str, Any]:
+    """Response for a document whose content is already in the session"""
+    session_data, _ = session_manager.load_session(session_id)
+    sources = (session_data or {}).get("processed_documents") or [record["source"]]
+    return {
+        "success": True,
+        "sources": sources,
+        "session_id": session_id,
+        "ingestion": {
+            "status": "already_ingested",
+            "content_hash": record["content_hash"],
+            "source": record["source"],
+            "chunks": record.get("chunk_count", 0)
+        }
+    }
+
+def source_page(metadata: Dict[str, Any]) -> str:
+    """Format a chunk's page metadata for chat sources ("" when unknown)"""
+    page = metadata.get("page")
+    if page is not None:
+        # Pinecone returns numeric metadata as floats
+        return str(int(page)) if isinstance(page, (int, float)) else str(page)
+    pages = metadata.get("pages")
+    if pages:
+        return ", ".join(str(p) for p in pages)
+    return ""
+
 # API routes
 @app.get("/")
 async def root():
     return {"message": "Teacher Assistant API is running"}
 
+@app.get("/livez")
+async def liveness_check():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness_check():
+    """Readiness probe: warm-up finished and configured clients are connected"""
+    components = {
+        "warmup": app_state["ready"],
+        "pinecone_client": bool(app_state["pinecone_client"]) or not PINECONE_API_KEY,
+        "supabase_client": bool(app_state["supabase_client"]) or not SUPABASE_CONFIGURED
+    }
+    ready = all(components.values())
+    body = {
+        "status": "ready" if ready else "starting" if not app_state["ready"] else "degraded",
+        "components": components,
+        "errors": app_state["startup_errors"]
+    }
+    if not ready:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+@app.get("/metrics")
+async def metrics():
+    """Performance metrics in OpenMetrics format, for Prometheus scraping"""
+    return Response(content=performance_monitor.render_openmetrics(), media_type=OPENMETRICS_CONTENT_TYPE)
+
 @app.get("/health")
 async def health_check():
     return {
@@ -269,15 +438,25 @@ async def health_check():
         "pinecone_client": bool(app_state["pinecone_client"]),
         "supabase_client": bool(app_state["supabase_client"]),
         "documents_processed": len(app_state["processed_documents"]),
-        "sessions_active": len(app_state["session_vector_stores"])
+        "sessions_active": len(app_state["session_vector_stores"]),
+        "curriculum_cache": curriculum_utils.get_curriculum_cache_stats() if curriculum_utils.is_loaded else None,
+        "dedup": dedup.dedup_registry.stats() if dedup.is_loaded and dedup.DEDUP_ENABLED else None,
+        "executors": executor_stats(),
+        "admission": admission_controller.stats(),
+        "llm": llm_gateway.stats() if llm_gateway.is_loaded else None,
+        "model_routing": model_router.describe() if model_router.is_loaded else None,
+        "token_usage": performance_monitor.get_token_usage()
     }
 
 # SESSION MANAGEMENT ENDPOINTS
 @app.get("/sessions", response_model=SessionListResponse, dependencies=[Depends(get_api_key)])
+@track_endpoint_performance("GET /sessions")
 async def get_sessions():
     """Get all available sessions"""
+    await ensure_warm()
+    
     try:
-        sessions_list, error = get_available_sessions()
+        sessions_list, error = await run_db(session_manager.get_available_sessions)
         if error:
             raise HTTPException(status_code=500, detail=f"Error fetching sessions: {error}")
         
@@ -286,8 +465,11 @@ async def get_sessions():
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @app.post("/sessions", response_model=CreateSessionResponse, dependencies=[Depends(get_api_key)])
+@track_endpoint_performance("POST /sessions")
 async def create_session(request: CreateSessionRequest = None):
     """Create a new chat session"""
+    await ensure_warm()
+    
     try:
         # Create new session with Supabase
         session_id = str(uuid.uuid4())
@@ -307,7 +489,7 @@ async def create_session(request: CreateSessionRequest = None):
         }
         
         # Save session to database
-        success, error = save_session(session_id, session_data)
+        success, error = await run_db(session_manager.save_session, session_id, session_data)
         if not success:
             raise HTTPException(status_code=500, detail=f"Failed to create session: {error}")
         
@@ -316,10 +498,13 @@ async def create_session(request: CreateSessionRequest = None):
         raise HTTPException(status_code=500, detail=f"Error creating session: {str(e)}")
 
 @app.get("/sessions/{session_id}", response_model=SessionResponse, dependencies=[Depends(get_api_key)])
+@track_endpoint_performance("GET /sessions/{session_id}")
 async def get_session(session_id: str):
     """Get information about a specific session"""
+    await ensure_warm()
+    
     try:
-        session_data, error = load_session(session_id)
+        session_data, error = await run_db(session_manager.load_session, session_id)
         if error:
             raise HTTPException(status_code=404, detail=f"Session not found: {error}")
         
@@ -334,10 +519,27 @@ async def get_session(session_id: str):
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @app.delete("/sessions/{session_id}", dependencies=[Depends(get_api_key)])
+@track_endpoint_performance("DELETE /sessions/{session_id}")
 async def remove_session(session_id: str):
     """Delete a specific session"""
+    await ensure_warm()
+    
     try:
-        success, error = delete_session(session_id)
+        # Purge the session's vectors first: if that fails the session is
+        # kept, so the delete can be retried instead of orphaning them
+        vectors_purged = False
+        if app_state["pinecone_client"]:
+            vectors_purged = await run_db(embedder.delete_namespace, app_state["pinecone_client"], session_id)
+            if not vectors_purged:
+                raise HTTPException(status_code=502, detail=f"Failed to purge vectors for session {session_id}; the session was not deleted")
+        elif PINECONE_API_KEY:
+            raise HTTPException(status_code=503, detail="Vector store is not available")
+        _, error = await run_db(session_manager.delete_session_documents, session_id)
+        if error:
+            print(f"Failed to delete ingestion records for session {session_id}: {error}")
+        dedup.dedup_registry.drop_namespace(session_id)
+        
+        success, error = await run_db(session_manager.delete_session, session_id)
         if not success:
             raise HTTPException(status_code=500, detail=f"Failed to delete session: {error}")
         
@@ -345,12 +547,79 @@ async def remove_session(session_id: str):
         if session_id in app_state["session_vector_stores"]:
             del app_state["session_vector_stores"][session_id]
         
-        return {"success": True, "message": f"Session {session_id} deleted"}
+        return {"success": True, "message": f"Session {session_id} deleted", "vectors_purged": vectors_purged}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+@app.delete("/sessions/{session_id}/sources/{source:path}", dependencies=[Depends(get_api_key)])
+@track_endpoint_performance("DELETE /sessions/{session_id}/sources/{source}")
+async def remove_session_source(session_id: str, source: str):
+    """Remove one processed document or URL, and its vectors, from a session"""
+    await ensure_warm()
+    
+    try:
+        records, error = await run_db(session_manager.get_session_documents_by_source, session_id, source)
+        if error:
+            raise HTTPException(status_code=500, detail=error)
+        
+        session_data, _ = await run_db(session_manager.load_session, session_id)
+        processed_documents = (session_data or {}).get("processed_documents", [])
+        if not records and source not in processed_documents:
+            raise HTTPException(status_code=404, detail=f"Source not found in session: {source}")
+        
+        # Vectors the source produced, plus shared vectors it kept alive whose
+        # owner is already gone; keep any that another document still uses
+        own_ids = [vector_id for record in records for vector_id in record.get("vector_ids") or []]
+        shared_ids = [vector_id for record in records for vector_id in record.get("shared_vector_ids") or []]
+        candidates = list(dict.fromkeys(own_ids + shared_ids))
+        vector_ids = candidates
+        if candidates:
+            references, error = await run_db(session_manager.get_session_vector_references, session_id)
+            if error:
+                raise HTTPException(status_code=500, detail=error)
+            removed = {record["content_hash"] for record in records}
+            in_use = {
+                vector_id
+                for reference in references if reference["content_hash"] not in removed
+                for vector_id in (reference.get("vector_ids") or []) + (reference.get("shared_vector_ids") or [])
+            }
+            vector_ids = [vector_id for vector_id in candidates if vector_id not in in_use]
+        if vector_ids:
+            if not app_state["pinecone_client"]:
+                raise HTTPException(status_code=503, detail="Vector store is not available")
+            await run_db(embedder.delete_vectors, app_state["pinecone_client"], vector_ids, namespace=session_id)
+            dedup.dedup_registry.remove(session_id, vector_ids)
+        
+        success, error = await run_db(
+            session_manager.delete_session_documents, session_id, [record["content_hash"] for record in records]
+        )
+        if not success:
+            raise HTTPException(status_code=500, detail=error)
+        
+        if source in processed_documents:
+            session_data["processed_documents"] = [doc for doc in processed_documents if doc != source]
+            await run_db(session_manager.save_session, session_id, session_data)
+        
+        return {
+            "success": True,
+            "source": source,
+            "session_id": session_id,
+            "deleted_vectors": len(vector_ids),
+            # Vectors other documents depend on (their near-duplicate chunks were skipped)
+            "retained_vectors": len(set(own_ids) - set(vector_ids)),
+            # Sources ingested before vector IDs were tracked cannot be removed from the index
+            "untracked": not records
+        }
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 # DOCUMENT PROCESSING ENDPOINTS
 @app.post("/process/document", response_model=ProcessResponse, dependencies=[Depends(get_api_key)])
+@track_endpoint_performance("POST /process/document")
 async def process_document(
     background_tasks: BackgroundTasks, 
     file: UploadFile = File(...),
@@ -362,30 +631,11 @@ async def process_document(
     # Generate session ID if not provided
     if not session_id:
         session_id = str(uuid.uuid4())
+    token_accounting.bind(endpoint="process_document", session_id=session_id)
+    
+    await ensure_warm()
     
     try:
-        # Check file size (10 MB limit)
-        file_size = 0
-        chunk_size = 1024 * 1024  # 1 MB
-        file_content = bytearray()
-        
-        while True:
-            chunk = await file.read(chunk_size)
-            if not chunk:
-                break
-            file_content.extend(chunk)
-            file_size += len(chunk)
-            
-            # Stop if file is too large (over 10MB)
-            if file_size > 10 * 1024 * 1024:
-                raise HTTPException(
-                    status_code=413,
-                    detail="File too large, maximum size is 10 MB"
-                )
-        
-        # Reset file position for reading again
-        await file.seek(0)
-        
         # Check file type based on extension
         file_ext = os.path.splitext(file_name)[1].lower()
         allowed_extensions = ['.pdf', '.png', '.jpg', '.jpeg', '.gif', '.webp']
@@ -396,75 +646,78 @@ async def process_document(
                 detail=f"Unsupported file format: {file_ext}. Supported formats are: PDF, PNG, JPG, JPEG, GIF, WEBP"
             )
         
-        # Save uploaded file to temp location
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as temp_file:
-            temp_file.write(file_content)
-            temp_path = temp_file.name
+        # Stream the upload to a temp file, hashing it and enforcing the size
+        # limit and magic-byte check on the way
+        try:
+            upload = await uploads.stage_upload(file, allowed_extensions=allowed_extensions)
+        except uploads.UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except uploads.UnsupportedFileType as e:
+            raise HTTPException(status_code=415, detail=str(e))
         
-        # Process based on file type
         try:
-            if file_ext in ['.png', '.jpg', '.jpeg', '.gif', '.webp']:
-                texts = process_image(temp_path)
-                doc_type = "Image"
-            else:  # PDF or other document types
-                texts = process_pdf(temp_path)
-                doc_type = "Document"
-                
-            # Ensure we got valid text chunks
-            if not texts or len(texts) == 0:
-                raise ValueError("No text content could be extracted from the file")
-                
-            print(f"Successfully processed {doc_type}: {file_name}, extracted {len(texts)} text chunks")
+            # Identical content already ingested into this session: nothing to do
+            document_hash = upload.sha256
+            record = await run_db(find_ingested_document, session_id, document_hash)
+            if record:
+                print(f"Skipping {file_name}: content already ingested as {record['source']}")
+                return await run_db(already_ingested_response, session_id, record)
             
-        except Exception as e:
-            print(f"Error processing {doc_type} content: {str(e)}")
-            os.unlink(temp_path)  # Clean up temp file
-            raise HTTPException(
-                status_code=422, 
-                detail=f"Failed to process {doc_type.lower()} content: {str(e)}"
-            )
+            if not app_state["pinecone_client"]:
+                raise HTTPException(status_code=503, detail="Vector store is not available")
             
-        # Clean up temp file
-        os.unlink(temp_path)
-        
-        # Add to vector store
-        if texts and app_state["pinecone_client"]:
-            try:
-                # Get or create vector store for the session
-                vector_store = get_session_vector_store(session_id)
-                if not vector_store:
-                    # Create new vector store with session namespace
-                    vector_store = create_vector_store(app_state["pinecone_client"], texts, namespace=session_id)
-                    app_state["session_vector_stores"][session_id] = vector_store
-                else:
-                    # Add to existing vector store
-                    vector_store.add_documents(texts)
-                
-            except Exception as e:
-                print(f"Error adding to vector store: {str(e)}")
+            doc_type = "Document" if upload.extension == ".pdf" else "Image"
+            
+            # Stream extraction, splitting, embedding and upsert so early chunks
+            # become searchable while the rest of the file is still processing
+            documents = ingestion_pipeline.with_metadata(
+                document_loader.extract_document(upload.path),
+                file_name=file_name
+            )
+            ingestion = await run_llm(ingest_documents, session_id, documents, document_hash)
+        except ingestion_pipeline.IngestionError as e:
+            print(f"Error ingesting {doc_type} content: {str(e)}")
+            if e.stage in ("extract", "split"):
                 raise HTTPException(
-                    status_code=500,
-                    detail=f"Failed to add document to vector store: {str(e)}"
+                    status_code=422,
+                    detail=f"Failed to process {doc_type.lower()} content: {str(e.error)}"
                 )
-                
-            # Track processed document in session
-            processed_documents = [file_name]
-            
-            # Update session in database if it exists
-            session_data, _ = load_session(session_id)
-            if session_data:
-                # Append to existing documents if any
-                if "processed_documents" in session_data:
-                    processed_documents = list(set(session_data["processed_documents"] + [file_name]))
-                
-                # Update session
-                session_data["processed_documents"] = processed_documents
-                save_session(session_id, session_data)
-            
-            return {"success": True, "sources": processed_documents, "session_id": session_id}
-        else:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to add document to vector store: {str(e.error)}"
+            )
+        finally:
+            # Clean up temp file
+            upload.cleanup()
+        
+        # Ensure we got valid text chunks (a re-upload may consist only of duplicates)
+        if ingestion.chunks == 0 and not ingestion.skipped:
             raise HTTPException(status_code=422, detail="No content could be extracted from the document")
+        
+        print(f"Successfully processed {doc_type}: {file_name}, ingested {ingestion.chunks} text chunks")
+        await run_db(record_ingested_document, session_id, document_hash, file_name, doc_type.lower(), ingestion)
+        
+        # Track processed document in session
+        processed_documents = [file_name]
+        
+        # Update session in database if it exists
+        session_data, _ = await run_db(session_manager.load_session, session_id)
+        if session_data:
+            # Append to existing documents if any
+            if "processed_documents" in session_data:
+                processed_documents = list(set(session_data["processed_documents"] + [file_name]))
             
+            # Update session
+            session_data["processed_documents"] = processed_documents
+            await run_db(session_manager.save_session, session_id, session_data)
+        
+        return {
+            "success": True,
+            "sources": processed_documents,
+            "session_id": session_id,
+            "ingestion": dict(ingestion.summary(), status="ingested", content_hash=document_hash)
+        }
+        
     except HTTPException as e:
         # Re-raise HTTP exceptions as they already have status_code and detail
         raise e
@@ -475,31 +728,42 @@ async def process_document(
         raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
 
 @app.post("/process/url", response_model=ProcessResponse, dependencies=[Depends(get_api_key)])
+@track_endpoint_performance("POST /process/url")
 async def process_url(request: ProcessUrlRequest):
     """Process a URL and add to vector store"""
     web_url = str(request.url)
     
     # Generate session ID if not provided
     session_id = request.session_id or str(uuid.uuid4())
+    token_accounting.bind(endpoint="process_url", session_id=session_id)
+    
+    await ensure_warm()
     
     try:
-        texts = process_web(web_url)
-        if texts and app_state["pinecone_client"]:
-            # Get or create vector store for the session
-            vector_store = get_session_vector_store(session_id)
-            if not vector_store:
-                # Create new vector store with session namespace
-                vector_store = create_vector_store(app_state["pinecone_client"], texts, namespace=session_id)
-                app_state["session_vector_stores"][session_id] = vector_store
-            else:
-                # Add to existing vector store
-                vector_store.add_documents(texts)
+        ingestion = None
+        document_hash = None
+        if app_state["pinecone_client"]:
+            # Fetch over the shared connection pool (and HTTP cache); the page
+            # is keyed by its body, so unchanged content is not embedded again
+            page = await web_loader.load_web_document(web_url)
+            if page:
+                try:
+                    document_hash = page.content_hash
+                    record = await run_db(find_ingested_document, session_id, document_hash)
+                    if record:
+                        return await run_db(already_ingested_response, session_id, record)
+                    # PDF pages are extracted while the pipeline consumes them
+                    ingestion = await run_llm(ingest_documents, session_id, iter(page.documents), document_hash)
+                finally:
+                    page.close()
+        if ingestion and (ingestion.chunks or ingestion.skipped):
+            await run_db(record_ingested_document, session_id, document_hash, web_url, "url", ingestion)
             
             # Track processed URL in session
             processed_documents = [web_url]
             
             # Update session in database if it exists
-            session_data, _ = load_session(session_id)
+            session_data, _ = await run_db(session_manager.load_session, session_id)
             if session_data:
                 # Append to existing documents if any
                 if "processed_documents" in session_data:
@@ -507,19 +771,27 @@ async def process_url(request: ProcessUrlRequest):
                 
                 # Update session
                 session_data["processed_documents"] = processed_documents
-                save_session(session_id, session_data)
+                await run_db(session_manager.save_session, session_id, session_data)
             
-            return {"success": True, "sources": processed_documents, "session_id": session_id}
+            return {
+                "success": True,
+                "sources": processed_documents,
+                "session_id": session_id,
+                "ingestion": dict(ingestion.summary(), status="ingested", content_hash=document_hash)
+            }
         else:
             raise HTTPException(status_code=500, detail="Failed to process URL")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing URL: {str(e)}")
 
 @app.get("/sources/{session_id}", response_model=SourceResponse, dependencies=[Depends(get_api_key)])
+@track_endpoint_performance("GET /sources/{session_id}")
 async def get_session_sources(session_id: str):
     """Get all processed document sources for a session"""
+    await ensure_warm()
+    
     try:
-        session_data, error = load_session(session_id)
+        session_data, error = await run_db(session_manager.load_session, session_id)
         if error:
             raise HTTPException(status_code=404, detail=f"Session not found: {error}")
         
@@ -528,7 +800,8 @@ async def get_session_sources(session_id: str):
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 # CHAT ENDPOINTS
-@app.post("/chat", response_model=MessageResponse, dependencies=[Depends(get_api_key)])
+@app.post("/chat", response_model=MessageResponse, dependencies=[Depends(get_api_key), Depends(admission("chat"))])
+@track_endpoint_performance("POST /chat")
 async def chat(request: MessageRequest):
     """
     Process a chat message and return response
@@ -542,13 +815,16 @@ async def chat(request: MessageRequest):
     prompt = request.content
     force_web_search = request.force_web_search
     session_id = request.session_id or str(uuid.uuid4())
+    token_accounting.bind(endpoint="chat", session_id=session_id)
+    
+    await ensure_warm()
     
     # Process and respond to the message
     try:
         # Load or initialize session data
         session_data = None
         if session_id:
-            session_data, _ = load_session(session_id)
+            session_data, _ = await run_db(session_manager.load_session, session_id)
         
         if not session_data:
             session_data = {
@@ -569,32 +845,34 @@ async def chat(request: MessageRequest):
         session_data["history"] = history
         
         # Check for URLs in prompt
-        url_detector = test_url_detector(prompt)
+        url_detector = await run_llm(writeragents.test_url_detector, prompt)
         detected_urls = url_detector.urls
         
-        # Process any detected URLs
-        for url in detected_urls:
-            if url not in session_data.get("processed_documents", []):
-                texts = process_web(url)
-                if texts and app_state["pinecone_client"]:
-                    # Get or create vector store for the session
-                    vector_store = get_session_vector_store(session_id)
-                    if not vector_store:
-                        # Create new vector store with session namespace
-                        vector_store = create_vector_store(app_state["pinecone_client"], texts, namespace=session_id)
-                        app_state["session_vector_stores"][session_id] = vector_store
-                    else:
-                        # Add to existing vector store
-                        vector_store.add_documents(texts)
-                    
+        # Process any detected URLs: fetch them concurrently, then ingest in parallel
+        new_urls = []
+        if app_state["pinecone_client"]:
+            for url in detected_urls:
+                if url in session_data.get("processed_documents", []):
+                    continue
+                new_urls.append(url)
+        if new_urls:
+            web_pages = await web_loader.load_web_documents(new_urls)
+            fetched_urls = [url for url, page in web_pages.items() if page]
+            results = await asyncio.gather(
+                *(run_llm(ingest_web_page, session_id, web_pages[url]) for url in fetched_urls),
+                return_exceptions=True
+            )
+            processed_docs = session_data.get("processed_documents", [])
+            for url, result in zip(fetched_urls, results):
+                if isinstance(result, Exception):
+                    print(f"Error ingesting {url}: {str(result)}")
+                elif result:
                     # Add to processed documents
-                    processed_docs = session_data.get("processed_documents", [])
                     processed_docs.append(url)
-                    session_data["processed_documents"] = processed_docs
+            session_data["processed_documents"] = processed_docs
         
         # Rewrite the query for better retrieval
-        query_rewriter = get_query_rewriter_agent()
-        rewritten_query = query_rewriter.run(prompt).content
+        rewritten_query = await run_llm(writeragents.rewrite_query, prompt)
         
         # Save for display
         session_data["rewritten_query"] = {
@@ -613,7 +891,8 @@ async def chat(request: MessageRequest):
         # First, try document search if not forcing web search
         if not force_web_search and vector_store:
             # Try document search first
-            has_relevant_docs, docs = check_document_relevance(
+            has_relevant_docs, docs = await run_llm(
+                embedder.check_document_relevance,
                 rewritten_query,
                 vector_store,
                 SIMILARITY_THRESHOLD,
@@ -621,7 +900,13 @@ async def chat(request: MessageRequest):
             )
             
             if docs:
-                context = "\n\n".join([d.page_content for d in docs])
+                # Keep whole chunks, best first, within the document budget
+                context, included = token_accounting.pack_passages(
+                    [d.page_content for d in docs],
+                    token_accounting.budget("chat_documents"),
+                    stage="chat_documents"
+                )
+                docs = docs[:included]
                 source_docs = docs
                 
                 # Track documents used
@@ -633,6 +918,8 @@ async def chat(request: MessageRequest):
                         "source_type": source_type,
                         "source_name": source_name,
                         "url": doc.metadata.get("url", ""),
+                        "page": source_page(doc.metadata),
+                        "section": doc.metadata.get("section", ""),
                         "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
                     })
                 session_data["doc_sources"] = doc_sources
@@ -643,7 +930,7 @@ async def chat(request: MessageRequest):
         
         # Check if query needs web search based on intent detection
         try:
-            search_intent_detected = detect_google_search_intent(rewritten_query)
+            search_intent_detected = await run_llm(intent_detector.detect_google_search_intent, rewritten_query)
         except Exception as e:
             # Fall back to regular behavior if intent detection fails
             pass
@@ -656,8 +943,11 @@ async def chat(request: MessageRequest):
         )
         
         if should_use_web_search:
-            search_results, search_links = google_search(rewritten_query)
+            search_results, search_links = await run_llm(search.google_search, rewritten_query)
             if search_results:
+                search_results = token_accounting.fit_to_budget(
+                    search_results, token_accounting.budget("chat_search"), stage="chat_search"
+                )
                 if context:
                     context = f"{context}\n\n--- Additional Information from Google Search ---\n\n{search_results}"
                 else:
@@ -666,8 +956,6 @@ async def chat(request: MessageRequest):
                 session_data["search_sources"] = search_links
         
         # Generate response using the RAG agent
-        rag_agent = get_rag_agent()
-        
         if context:
             full_prompt = f"""Context: {context}
 
@@ -683,18 +971,18 @@ Rewritten Question: {rewritten_query}
             full_prompt = f"Original Question: {prompt}\nRewritten Question: {rewritten_query}"
             session_data["info_messages"] = ["No relevant information found in documents or Google search."]
 
-        response = rag_agent.run(full_prompt)
+        answer = await run_llm(writeragents.generate_rag_answer, full_prompt)
         
         # Add assistant response to history
-        history.append({"role": "assistant", "content": response.content})
+        history.append({"role": "assistant", "content": answer})
         session_data["history"] = history
         
         # Generate and save session title if not set
         if session_data.get("session_name") == "Untitled Session":
-            session_data["session_name"] = generate_session_title(prompt)
+            session_data["session_name"] = await run_llm(writeragents.generate_session_title, prompt)
         
         # Save session data
-        save_session(session_id, session_data)
+        await run_db(session_manager.save_session, session_id, session_data)
         
         # Prepare sources for response
         sources = []
@@ -708,7 +996,9 @@ Rewritten Question: {rewritten_query}
                     "type": source_type,
                     "name": source_name,
                     "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
-                    "url": doc.metadata.get("url", "")
+                    "url": doc.metadata.get("url", ""),
+                    "page": source_page(doc.metadata),
+                    "section": doc.metadata.get("section", "")
                 })
         
         # Add search sources
@@ -721,35 +1011,48 @@ Rewritten Question: {rewritten_query}
                     "content": ""
                 })
         
-        return {"content": response.content, "sources": sources, "session_id": session_id}
+        return {"content": answer, "sources": sources, "session_id": session_id}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
 
 # CURRICULUM API ENDPOINTS - PLURAL FORM (RECOMMENDED)
 @app.get("/curriculums", response_model=CurriculumListResponse, dependencies=[Depends(get_api_key)])
-async def list_curriculums():
-    """Get a list of all available curriculums"""
+@track_endpoint_performance("GET /curriculums")
+async def list_curriculums(
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    include_count: bool = False
+):
+    """Get available curriculums; pass limit to page through them"""
+    await ensure_warm()
+    
     try:
-        result = get_all_curriculums()
+        result = await run_db(get_all_curriculums, limit=limit, offset=offset, include_count=include_count)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing curriculums: {str(e)}")
 
 @app.post("/curriculums", dependencies=[Depends(get_api_key)])
+@track_endpoint_performance("POST /curriculums")
 async def create_new_curriculum(request: CurriculumCreateRequest):
     """Create a new empty curriculum"""
+    await ensure_warm()
+    
     try:
-        result = create_curriculum(request)
+        result = await run_db(create_curriculum, request)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating curriculum: {str(e)}")
 
 @app.get("/curriculums/{curriculum_id}", response_model=CurriculumResponse, dependencies=[Depends(get_api_key)])
+@track_endpoint_performance("GET /curriculums/{curriculum_id}")
 async def get_curriculum_by_id(curriculum_id: str):
     """Get a specific curriculum by ID"""
+    await ensure_warm()
+    
     try:
-        result = get_curriculum(curriculum_id)
+        result = await run_db(get_curriculum, curriculum_id)
         return result
     except Exception as e:
         if "not found" in str(e):
@@ -757,10 +1060,13 @@ async def get_curriculum_by_id(curriculum_id: str):
         raise HTTPException(status_code=500, detail=f"Error retrieving curriculum: {str(e)}")
 
 @app.delete("/curriculums/{curriculum_id}", dependencies=[Depends(get_api_key)])
+@track_endpoint_performance("DELETE /curriculums/{curriculum_id}")
 async def delete_curriculum(curriculum_id: str):
     """Delete a specific curriculum"""
+    await ensure_warm()
+    
     try:
-        success = delete_curriculum_by_id(curriculum_id)
+        success = await run_db(delete_curriculum_by_id, curriculum_id)
         return {"success": success, "message": f"Curriculum {curriculum_id} deleted"}
     except Exception as e:
         if "not found" in str(e):
@@ -768,42 +1074,60 @@ async def delete_curriculum(curriculum_id: str):
         raise HTTPException(status_code=500, detail=f"Error deleting curriculum: {str(e)}")
 
 # CURRICULUM API ENDPOINTS - SINGULAR FORM (KEPT FOR BACKWARD COMPATIBILITY)
-@app.post("/curriculum", response_model=CurriculumResponse, dependencies=[Depends(get_api_key)])
+@app.post("/curriculum", response_model=CurriculumResponse, dependencies=[Depends(get_api_key), Depends(admission("curriculum"))])
+@track_endpoint_performance("POST /curriculum")
 async def create_curriculum_endpoint(request: CurriculumRequest):
     """Generate a new curriculum based on subject, syllabus URL, and time constraint"""
+    token_accounting.bind(endpoint="curriculum_generate")
+    
+    await ensure_warm()
+    
     try:
-        result = generate_curriculum(request)
+        result = await run_llm(generate_curriculum, request)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating curriculum: {str(e)}")
 
 @app.get("/curriculum/{curriculum_id}", response_model=CurriculumResponse, dependencies=[Depends(get_api_key)])
+@track_endpoint_performance("GET /curriculum/{curriculum_id}")
 async def retrieve_curriculum(curriculum_id: str):
     """Get a specific curriculum by ID"""
+    await ensure_warm()
+    
     try:
-        result = get_curriculum(curriculum_id)
+        result = await run_db(get_curriculum, curriculum_id)
         return result
     except Exception as e:
         if "not found" in str(e):
             raise HTTPException(status_code=404, detail=str(e))
         raise HTTPException(status_code=500, detail=f"Error retrieving curriculum: {str(e)}")
 
-@app.put("/curriculum/{curriculum_id}", response_model=CurriculumResponse, dependencies=[Depends(get_api_key)])
+@app.put("/curriculum/{curriculum_id}", response_model=CurriculumResponse, dependencies=[Depends(get_api_key), Depends(admission("curriculum"))])
+@track_endpoint_performance("PUT /curriculum/{curriculum_id}")
 async def update_curriculum(curriculum_id: str, request: CurriculumModificationRequest):
     """Modify a curriculum based on the modification request"""
+    token_accounting.bind(endpoint="curriculum_modify", session_id=curriculum_id)
+    
+    await ensure_warm()
+    
     try:
-        result = modify_curriculum_by_id(curriculum_id, request)
+        result = await run_llm(modify_curriculum_by_id, curriculum_id, request)
         return result
     except Exception as e:
         if "not found" in str(e):
             raise HTTPException(status_code=404, detail=str(e))
         raise HTTPException(status_code=500, detail=f"Error modifying curriculum: {str(e)}")
 
-@app.post("/curriculum/{curriculum_id}/details", response_model=Dict[str, StepDetailResponse], dependencies=[Depends(get_api_key)])
+@app.post("/curriculum/{curriculum_id}/details", response_model=Dict[str, StepDetailResponse], dependencies=[Depends(get_api_key), Depends(admission("curriculum"))])
+@track_endpoint_performance("POST /curriculum/{curriculum_id}/details")
 async def create_curriculum_details(curriculum_id: str):
     """Generate detailed content for all steps in a curriculum"""
+    token_accounting.bind(endpoint="curriculum_details", session_id=curriculum_id)
+    
+    await ensure_warm()
+    
     try:
-        result = generate_curriculum_details(curriculum_id)
+        result = await run_llm(generate_curriculum_details, curriculum_id)
         # Convert integer keys to strings for JSON serialization
         return {str(k): v for k, v in result.items()}
     except Exception as e:
@@ -811,20 +1135,22 @@ async def create_curriculum_details(curriculum_id: str):
             raise HTTPException(status_code=404, detail=str(e))
         raise HTTPException(status_code=500, detail=f"Error generating curriculum details: {str(e)}")
 
-@app.get("/curriculum/{curriculum_id}/details/{step_index}", response_model=StepDetailResponse, dependencies=[Depends(get_api_key)])
+@app.get("/curriculum/{curriculum_id}/details/{step_index}", response_model=StepDetailResponse, dependencies=[Depends(get_api_key), Depends(admission("curriculum"))])
+@track_endpoint_performance("GET /curriculum/{curriculum_id}/details/{step_index}")
 async def retrieve_step_detail(curriculum_id: str, step_index: int):
     """Get detailed content for a specific step"""
+    token_accounting.bind(endpoint="curriculum_step_detail", session_id=curriculum_id)
+    
+    await ensure_warm()
+    
     try:
-        result = get_step_detail(curriculum_id, step_index)
+        result = await run_llm(get_step_detail, curriculum_id, step_index)
         return result
     except Exception as e:
         if "not found" in str(e):
             raise HTTPException(status_code=404, detail=str(e))
         raise HTTPException(status_code=500, detail=f"Error retrieving step detail: {str(e)}")
 
-from grader import process_document
-from pydantic import BaseModel
-from fastapi import HTTPException, Depends
 import logging
 import traceback
 
@@ -835,13 +1161,18 @@ grade_logger.setLevel(logging.INFO)
 class GradeRequest(BaseModel):
     file_url: str
 
-@app.post("/grade", dependencies=[Depends(get_api_key)])
+@app.post("/grade", dependencies=[Depends(get_api_key), Depends(admission("grade"))])
+@track_endpoint_performance("POST /grade")
 async def grade_document(request: GradeRequest):
     """Grade a document from a URL"""
     grade_logger.info(f"Received grading request for file: {request.file_url}")
+    token_accounting.bind(endpoint="grade")
+    
+    await ensure_warm()
+    
     try:
         grade_logger.info("Calling process_document function")
-        result = process_document(request.file_url)
+        result = await run_llm(grader.process_document, request.file_url)
         grade_logger.info(f"process_document returned success={result['success']}")
 
         if result['success']:
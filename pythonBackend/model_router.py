@@ -0,0 +1,132 @@
+"""
+Model tiering: which model, and with which generation settings, each task uses.
+
+Every model call names its task (query_rewrite, rag_answer, grading_feedback,
+...). TASK_POLICIES maps the task to a model tier plus max output tokens,
+temperature and whether the call is hedged. Short classification-style calls
+(titles, URL and intent detection, query rewriting) go to the lite tier;
+answers, grading, curriculum structure and transcription use the standard
+tier.
+
+Tier models can be changed with LLM_MODEL_LITE / LLM_MODEL_STANDARD, and
+individual policies overridden with LLM_TASK_POLICIES, a JSON object such as
+'{"step_detail": {"tier": "lite", "max_output_tokens": 3000}}'. Per-task
+latency is recorded by the LLM gateway so the policy can be tuned.
+"""
+import os
+import json
+import logging
+from typing import Any, Dict, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+MODEL_TIERS: Dict[str, str] = {
+    "lite": os.getenv("LLM_MODEL_LITE", "gemini-2.0-flash-lite"),
+    "standard": os.getenv("LLM_MODEL_STANDARD", "gemini-2.0-flash"),
+}
+
+# task -> tier, generation settings and whether slow calls are hedged
+TASK_POLICIES: Dict[str, Dict[str, Any]] = {
+    # Chat path: short, latency-critical calls
+    "session_title": {"tier": "lite", "max_output_tokens": 32, "temperature": 0.3, "hedge": True},
+    "url_detection": {"tier": "lite", "max_output_tokens": 1024, "temperature": 0.0, "hedge": True},
+    "intent_detection": {"tier": "lite", "max_output_tokens": 32, "temperature": 0.0, "hedge": True},
+    "query_rewrite": {"tier": "lite", "max_output_tokens": 256, "temperature": 0.2, "hedge": True},
+    # Search grounding is not available on the lite models
+    "web_search": {"tier": "standard", "max_output_tokens": 2048, "temperature": 0.2},
+    "rag_answer": {"tier": "standard", "max_output_tokens": 4096, "temperature": 0.4},
+    # Grading
+    "grading_feedback": {"tier": "standard", "max_output_tokens": 4096, "temperature": 0.2},
+    "grading_structure": {"tier": "standard", "max_output_tokens": 2048, "temperature": 0.0},
+    # Curriculum
+    "topic_extraction": {"tier": "standard", "max_output_tokens": 4096, "temperature": 0.2},
+    "curriculum_structure": {"tier": "standard", "max_output_tokens": 4096, "temperature": 0.2},
+    "curriculum_overview": {"tier": "standard", "max_output_tokens": 2048, "temperature": 0.3},
+    "curriculum_modify": {"tier": "standard", "max_output_tokens": 2048, "temperature": 0.2},
+    "step_detail": {"tier": "standard", "max_output_tokens": 4096, "temperature": 0.4},
+    # Ingestion
+    "document_transcription": {"tier": "standard", "max_output_tokens": 8192, "temperature": 0.0},
+    # Embeddings name their model directly; changing it requires re-indexing
+    "embedding": {"model": os.getenv("LLM_MODEL_EMBEDDING", "models/text-embedding-004"), "hedge": True},
+}
+
+DEFAULT_POLICY: Dict[str, Any] = {"tier": "standard", "max_output_tokens": None, "temperature": None, "hedge": False}
+
+
+def _load_overrides():
+    raw = os.getenv("LLM_TASK_POLICIES", "")
+    if not raw:
+        return
+    try:
+        overrides = json.loads(raw)
+    except ValueError as e:
+        logger.error(f"Ignoring invalid LLM_TASK_POLICIES: {str(e)}")
+        return
+    for task, override in overrides.items():
+        if isinstance(override, dict):
+            TASK_POLICIES[task] = dict(TASK_POLICIES.get(task, {}), **override)
+
+
+_load_overrides()
+
+
+class TaskPolicy:
+    """Resolved model and generation settings for one task"""
+
+    def __init__(self, task: str, model: str, max_output_tokens: Optional[int], temperature: Optional[float], hedge: bool):
+        self.task = task
+        self.model = model
+        self.max_output_tokens = max_output_tokens
+        self.temperature = temperature
+        self.hedge = hedge
+
+    def generation_config(self) -> Dict[str, Any]:
+        """Settings for a google.genai generate_content config"""
+        config: Dict[str, Any] = {}
+        if self.max_output_tokens is not None:
+            config["max_output_tokens"] = self.max_output_tokens
+        if self.temperature is not None:
+            config["temperature"] = self.temperature
+        return config
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "max_output_tokens": self.max_output_tokens,
+            "temperature": self.temperature,
+            "hedge": self.hedge
+        }
+
+
+def policy(task: str) -> TaskPolicy:
+    """Resolve the policy for a task (unknown tasks get the standard tier)"""
+    settings = dict(DEFAULT_POLICY, **TASK_POLICIES.get(task, {}))
+    # A policy may name a model directly instead of a tier
+    model = settings.get("model") or MODEL_TIERS.get(settings["tier"], MODEL_TIERS["standard"])
+    return TaskPolicy(task, model, settings["max_output_tokens"], settings["temperature"], bool(settings["hedge"]))
+
+
+def model_for(task: str) -> str:
+    return policy(task).model
+
+
+def gemini_model(task: str):
+    """agno Gemini model configured for a task"""
+    from agno.models.google import Gemini
+
+    task_policy = policy(task)
+    return Gemini(
+        id=task_policy.model,
+        temperature=task_policy.temperature,
+        max_output_tokens=task_policy.max_output_tokens
+    )
+
+
+def describe() -> Dict[str, Any]:
+    """Current tiers and resolved per-task policies"""
+    return {
+        "tiers": dict(MODEL_TIERS),
+        "tasks": {task: policy(task).as_dict() for task in TASK_POLICIES}
+    }
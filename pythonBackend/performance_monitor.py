@@ -1,79 +1,288 @@
+"""
+Process-wide performance metrics.
+
+Timings are recorded into LatencyHistogram instances: log-spaced buckets
+that grow by LATENCY_BUCKET_GROWTH per bucket (about 2.5% relative error at
+the default 1.05) between 0.1 ms and one hour. Recording is O(1) and memory
+is fixed no matter how long the worker runs, and p50/p95/p99 are read from
+the bucket counts without sorting samples. Every histogram has its own lock,
+so endpoints, model calls and database operations never contend with each
+other; the monitor-level locks only guard creation of new series, the
+request counters and token usage.
+
+Histograms also count into a short list of export buckets
+(METRICS_HISTOGRAM_BUCKETS), which render_openmetrics() publishes together
+with the token counters for the /metrics endpoint, so p95s can be computed
+and alerted on in Prometheus with histogram_quantile().
+"""
+import os
+import math
 import time
+import bisect
 import functools
-import statistics
-from typing import Dict, List, Any, Callable
+from collections import OrderedDict
+from typing import Dict, List, Any, Callable, Optional
 import threading
 import logging
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    filename='performance.log'
-)
+# Configure logging: slow-call warnings go to their own file without
+# redirecting the application's root logger there. The file is opened on the
+# first warning, so importing this module (for its decorators) does no I/O.
 logger = logging.getLogger("performance_monitor")
+logger.setLevel(logging.INFO)
+_handler_lock = threading.Lock()
+
+
+def _warn_slow(message: str):
+    if not logger.handlers:
+        with _handler_lock:
+            if not logger.handlers:
+                handler = logging.FileHandler(os.getenv("PERFORMANCE_LOG_FILE", "performance.log"))
+                handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+                logger.addHandler(handler)
+    logger.warning(message)
+
+# Histogram range (seconds) and bucket growth factor
+LATENCY_MIN_SECONDS = float(os.getenv("LATENCY_MIN_SECONDS", "0.0001"))
+LATENCY_MAX_SECONDS = float(os.getenv("LATENCY_MAX_SECONDS", "3600"))
+LATENCY_BUCKET_GROWTH = float(os.getenv("LATENCY_BUCKET_GROWTH", "1.05"))
+
+# Upper bounds (seconds) of the buckets exported on /metrics
+METRICS_HISTOGRAM_BUCKETS = sorted(
+    float(bound) for bound in os.getenv(
+        "METRICS_HISTOGRAM_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,120"
+    ).split(",") if bound.strip()
+)
+# Prefix of every exported metric name
+METRICS_PREFIX = os.getenv("METRICS_PREFIX", "edumate")
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Sessions whose token totals are kept in memory (least recently used are dropped)
+TOKEN_USAGE_MAX_SESSIONS = int(os.getenv("TOKEN_USAGE_MAX_SESSIONS", "1000"))
+
+
+def _new_token_totals() -> Dict[str, int]:
+    return {"calls": 0, "input_tokens": 0, "output_tokens": 0, "estimated_calls": 0}
+
+
+def _add_tokens(totals: Dict[str, int], input_tokens: int, output_tokens: int, estimated: bool):
+    totals["calls"] += 1
+    totals["input_tokens"] += input_tokens
+    totals["output_tokens"] += output_tokens
+    if estimated:
+        totals["estimated_calls"] += 1
+
+
+class LatencyHistogram:
+    """
+    Fixed-size log-bucketed histogram (HDR-style) of durations in seconds
+
+    Bucket i (1..n) covers [min * growth^(i-1), min * growth^i); bucket 0
+    holds values below min and the last bucket values above max. Quantiles
+    are reported as the geometric midpoint of the bucket they fall in,
+    clamped to the observed min/max. Values are also counted exactly into
+    the export buckets (le = upper bound) used by render_openmetrics().
+    """
+
+    def __init__(
+        self,
+        min_value: float = LATENCY_MIN_SECONDS,
+        max_value: float = LATENCY_MAX_SECONDS,
+        growth: float = LATENCY_BUCKET_GROWTH
+    ):
+        self.min_value = min_value
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        self._size = int(math.ceil(math.log(max_value / min_value) / self._log_growth)) + 2
+        self._buckets = [0] * self._size
+        self.export_bounds = METRICS_HISTOGRAM_BUCKETS
+        # Last slot counts values above the largest bound (+Inf)
+        self._export_buckets = [0] * (len(self.export_bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def _index(self, value: float) -> int:
+        if value < self.min_value:
+            return 0
+        return min(self._size - 1, int(math.log(value / self.min_value) / self._log_growth) + 1)
+
+    def record(self, value: float):
+        index = self._index(value)
+        export_index = bisect.bisect_left(self.export_bounds, value)
+        with self._lock:
+            self._buckets[index] += 1
+            self._export_buckets[export_index] += 1
+            self.count += 1
+            self.sum += value
+            if value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def _bucket_value(self, index: int, low: float, high: float) -> float:
+        if index == 0:
+            value = self.min_value
+        else:
+            # Geometric midpoint of [min * g^(i-1), min * g^i)
+            value = self.min_value * self.growth ** (index - 0.5)
+        return min(max(value, low), high)
+
+    def snapshot(self, quantiles=(0.5, 0.95, 0.99)) -> Dict[str, Any]:
+        """Count, sum, avg, max and the requested quantiles (as "p50", "p95", ...)"""
+        with self._lock:
+            buckets = list(self._buckets)
+            count, total, low, high = self.count, self.sum, self.min, self.max
+        result: Dict[str, Any] = {"count": count, "sum": total, "avg": total / count if count else 0.0, "max": high}
+        pending = sorted(quantiles)
+        seen = 0
+        for index, bucket_count in enumerate(buckets):
+            if not pending or not count:
+                break
+            seen += bucket_count
+            while pending and seen >= pending[0] * count:
+                result[f"p{pending.pop(0) * 100:g}"] = self._bucket_value(index, low, high)
+        for quantile in pending:
+            result[f"p{quantile * 100:g}"] = 0.0
+        return result
+
+    def export(self):
+        """(cumulative export bucket counts including +Inf, count, sum)"""
+        with self._lock:
+            buckets = list(self._export_buckets)
+            count, total = self.count, self.sum
+        cumulative = []
+        seen = 0
+        for bucket_count in buckets:
+            seen += bucket_count
+            cumulative.append(seen)
+        return cumulative, count, total
+
 
 class PerformanceMonitor:
     def __init__(self):
         self.metrics = {
-            "api_response_times": {},  # Endpoint -> list of response times
-            "db_operation_times": {},  # Operation -> list of times
-            "vector_store_times": {},  # Operation -> list of times
-            "llm_api_calls": {         # API name -> count and total time
-                "count": 0,
-                "total_time": 0,
-                "times": []
-            },
+            "api_response_times": {},  # Endpoint -> LatencyHistogram
+            "db_operation_times": {},  # Operation -> LatencyHistogram
+            "vector_store_times": {},  # Operation -> LatencyHistogram
+            "llm_api_calls": {},       # Task -> LatencyHistogram
+            "api_errors": {},          # Endpoint -> 5xx / unhandled exception count
             "active_requests": 0,
             "peak_concurrent_requests": 0,
-            "memory_usage": []
+            "token_usage": {
+                "total": _new_token_totals(),
+                "by_task": {},      # Task -> token totals
+                "by_endpoint": {},  # Endpoint -> token totals
+                "by_session": OrderedDict(),  # Session -> token totals (LRU)
+                "truncations": {}   # Prompt stage -> truncation counts
+            }
         }
+        # Guards creation of new histogram series
+        self._series_lock = threading.Lock()
+        # Guards the request counters
         self.lock = threading.Lock()
-        
-    def track_api_call(self, endpoint: str, time_taken: float):
-        """Track API endpoint response time"""
-        with self.lock:
-            if endpoint not in self.metrics["api_response_times"]:
-                self.metrics["api_response_times"][endpoint] = []
-            self.metrics["api_response_times"][endpoint].append(time_taken)
-            
-            # Log slow API calls (over 3 seconds)
-            if time_taken > 3.0:
-                logger.warning(f"Slow API call to {endpoint}: {time_taken:.2f}s")
-    
-    def track_llm_call(self, time_taken: float):
+        self._token_lock = threading.Lock()
+
+    def _histogram(self, family: str, name: str) -> LatencyHistogram:
+        series = self.metrics[family]
+        histogram = series.get(name)
+        if histogram is None:
+            with self._series_lock:
+                histogram = series.get(name)
+                if histogram is None:
+                    histogram = series[name] = LatencyHistogram()
+        return histogram
+
+    def track_api_call(self, endpoint: str, time_taken: float, error: bool = False):
+        """Track API endpoint response time (and whether the request failed)"""
+        self._histogram("api_response_times", endpoint).record(time_taken)
+        if error:
+            with self.lock:
+                self.metrics["api_errors"][endpoint] = self.metrics["api_errors"].get(endpoint, 0) + 1
+
+        # Log slow API calls (over 3 seconds)
+        if time_taken > 3.0:
+            _warn_slow(f"Slow API call to {endpoint}: {time_taken:.2f}s")
+
+    def track_llm_call(self, time_taken: float, task: str = "default"):
         """Track LLM API call time"""
-        with self.lock:
-            self.metrics["llm_api_calls"]["count"] += 1
-            self.metrics["llm_api_calls"]["total_time"] += time_taken
-            self.metrics["llm_api_calls"]["times"].append(time_taken)
-            
-            # Log slow LLM calls (over 2 seconds)
-            if time_taken > 2.0:
-                logger.warning(f"Slow LLM API call: {time_taken:.2f}s")
-    
+        self._histogram("llm_api_calls", task).record(time_taken)
+
+        # Log slow LLM calls (over 2 seconds)
+        if time_taken > 2.0:
+            _warn_slow(f"Slow LLM API call ({task}): {time_taken:.2f}s")
+
     def track_vector_store_operation(self, operation: str, time_taken: float):
         """Track vector store operation time"""
-        with self.lock:
-            if operation not in self.metrics["vector_store_times"]:
-                self.metrics["vector_store_times"][operation] = []
-            self.metrics["vector_store_times"][operation].append(time_taken)
-            
-            # Log slow vector store operations
-            if time_taken > 1.0:
-                logger.warning(f"Slow vector store {operation}: {time_taken:.2f}s")
-    
+        self._histogram("vector_store_times", operation).record(time_taken)
+
+        # Log slow vector store operations
+        if time_taken > 1.0:
+            _warn_slow(f"Slow vector store {operation}: {time_taken:.2f}s")
+
     def track_db_operation(self, operation: str, time_taken: float):
         """Track database operation time"""
-        with self.lock:
-            if operation not in self.metrics["db_operation_times"]:
-                self.metrics["db_operation_times"][operation] = []
-            self.metrics["db_operation_times"][operation].append(time_taken)
-            
-            # Log slow database operations
-            if time_taken > 0.5:
-                logger.warning(f"Slow DB {operation}: {time_taken:.2f}s")
-    
+        self._histogram("db_operation_times", operation).record(time_taken)
+
+        # Log slow database operations
+        if time_taken > 0.5:
+            _warn_slow(f"Slow DB {operation}: {time_taken:.2f}s")
+
+    def track_tokens(
+        self,
+        task: str,
+        model: str,
+        input_tokens: int,
+        output_tokens: int,
+        endpoint: Optional[str] = None,
+        session_id: Optional[str] = None,
+        estimated: bool = False
+    ):
+        """Track the input and output tokens of one model call"""
+        with self._token_lock:
+            usage = self.metrics["token_usage"]
+            _add_tokens(usage["total"], input_tokens, output_tokens, estimated)
+            task_totals = usage["by_task"].setdefault(task, dict(_new_token_totals(), model=model))
+            task_totals["model"] = model
+            _add_tokens(task_totals, input_tokens, output_tokens, estimated)
+            if endpoint:
+                _add_tokens(usage["by_endpoint"].setdefault(endpoint, _new_token_totals()), input_tokens, output_tokens, estimated)
+            if session_id:
+                sessions = usage["by_session"]
+                if session_id not in sessions:
+                    sessions[session_id] = _new_token_totals()
+                    while len(sessions) > TOKEN_USAGE_MAX_SESSIONS:
+                        sessions.popitem(last=False)
+                else:
+                    sessions.move_to_end(session_id)
+                _add_tokens(sessions[session_id], input_tokens, output_tokens, estimated)
+
+    def track_truncation(self, stage: str, tokens_before: int, tokens_after: int):
+        """Track a prompt stage being cut down to its token budget"""
+        with self._token_lock:
+            stage_totals = self.metrics["token_usage"]["truncations"].setdefault(
+                stage, {"count": 0, "tokens_dropped": 0}
+            )
+            stage_totals["count"] += 1
+            stage_totals["tokens_dropped"] += max(0, tokens_before - tokens_after)
+
+    def get_token_usage(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Token totals overall, per task, per endpoint and per prompt stage, or for one session"""
+        with self._token_lock:
+            usage = self.metrics["token_usage"]
+            if session_id is not None:
+                return dict(usage["by_session"].get(session_id) or _new_token_totals())
+            return {
+                "total": dict(usage["total"]),
+                "by_task": {task: dict(totals) for task, totals in usage["by_task"].items()},
+                "by_endpoint": {endpoint: dict(totals) for endpoint, totals in usage["by_endpoint"].items()},
+                "sessions_tracked": len(usage["by_session"]),
+                "truncations": {stage: dict(totals) for stage, totals in usage["truncations"].items()}
+            }
+
     def request_started(self):
         """Track an active request"""
         with self.lock:
@@ -91,53 +300,102 @@ class PerformanceMonitor:
     def get_summary(self) -> Dict[str, Any]:
         """Get a summary of performance metrics"""
         with self.lock:
-            summary = {
-                "api_response_times": {},
-                "llm_api_calls": {
-                    "count": self.metrics["llm_api_calls"]["count"],
-                    "avg_time": 0
-                },
-                "vector_store_operations": {},
-                "db_operations": {},
-                "current_active_requests": self.metrics["active_requests"],
-                "peak_concurrent_requests": self.metrics["peak_concurrent_requests"]
+            active, peak = self.metrics["active_requests"], self.metrics["peak_concurrent_requests"]
+        families = self._families()
+
+        # Histograms are read one at a time, each under its own lock
+        summary = {
+            "api_response_times": {
+                endpoint: histogram.snapshot() for endpoint, histogram in families["api_response_times"].items()
+            },
+            "llm_api_calls": {
+                task: histogram.snapshot() for task, histogram in families["llm_api_calls"].items()
+            },
+            "vector_store_operations": {
+                operation: histogram.snapshot() for operation, histogram in families["vector_store_times"].items()
+            },
+            "db_operations": {
+                operation: histogram.snapshot() for operation, histogram in families["db_operation_times"].items()
+            },
+            "current_active_requests": active,
+            "peak_concurrent_requests": peak
+        }
+        summary["token_usage"] = self.get_token_usage()
+        return summary
+
+    def _families(self) -> Dict[str, Dict[str, LatencyHistogram]]:
+        with self._series_lock:
+            return {
+                family: dict(self.metrics[family])
+                for family in ("api_response_times", "llm_api_calls", "vector_store_times", "db_operation_times")
             }
-            
-            # Calculate API response time statistics
-            for endpoint, times in self.metrics["api_response_times"].items():
-                if times:
-                    summary["api_response_times"][endpoint] = {
-                        "avg": statistics.mean(times[-100:]),  # Last 100 calls
-                        "p95": sorted(times[-100:])[min(len(times[-100:]) - 1, int(len(times[-100:]) * 0.95))],
-                        "max": max(times[-100:]),
-                        "count": len(times)
-                    }
-            
-            # Calculate LLM API call statistics
-            times = self.metrics["llm_api_calls"]["times"]
-            if times:
-                summary["llm_api_calls"]["avg_time"] = statistics.mean(times[-100:])
-                summary["llm_api_calls"]["p95"] = sorted(times[-100:])[min(len(times[-100:]) - 1, int(len(times[-100:]) * 0.95))]
-            
-            # Calculate vector store statistics
-            for operation, times in self.metrics["vector_store_times"].items():
-                if times:
-                    summary["vector_store_operations"][operation] = {
-                        "avg": statistics.mean(times[-100:]),
-                        "max": max(times[-100:]),
-                        "count": len(times)
-                    }
-            
-            # Calculate DB operation statistics
-            for operation, times in self.metrics["db_operation_times"].items():
-                if times:
-                    summary["db_operations"][operation] = {
-                        "avg": statistics.mean(times[-100:]),
-                        "max": max(times[-100:]),
-                        "count": len(times)
-                    }
-                    
-            return summary
+
+    def render_openmetrics(self) -> str:
+        """All metrics in the OpenMetrics text exposition format"""
+        lines: List[str] = []
+        families = self._families()
+        histograms = [
+            ("http_request_duration_seconds", "API endpoint response time", "endpoint", families["api_response_times"]),
+            ("llm_call_duration_seconds", "Model call time including retries", "task", families["llm_api_calls"]),
+            ("vector_store_operation_duration_seconds", "Vector store operation time", "operation", families["vector_store_times"]),
+            ("db_operation_duration_seconds", "Database operation time", "operation", families["db_operation_times"]),
+        ]
+        for name, help_text, label, series in histograms:
+            name = f"{METRICS_PREFIX}_{name}"
+            lines.extend([f"# TYPE {name} histogram", f"# UNIT {name} seconds", f"# HELP {name} {help_text}."])
+            for value, histogram in sorted(series.items()):
+                labels = f'{label}="{_escape_label(value)}"'
+                cumulative, count, total = histogram.export()
+                for bound, bucket_count in zip(histogram.export_bounds + [math.inf], cumulative):
+                    le = "+Inf" if bound == math.inf else repr(bound)
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {bucket_count}')
+                lines.append(f"{name}_count{{{labels}}} {count}")
+                lines.append(f"{name}_sum{{{labels}}} {total!r}")
+
+        with self.lock:
+            errors = dict(self.metrics["api_errors"])
+            active, peak = self.metrics["active_requests"], self.metrics["peak_concurrent_requests"]
+        _counter(lines, "http_request_errors", "API requests that failed with a 5xx status or an unhandled exception", [
+            ({"endpoint": endpoint}, count) for endpoint, count in sorted(errors.items())
+        ])
+        for name, help_text, value in (
+            ("active_requests", "Requests currently being handled", active),
+            ("peak_concurrent_requests", "Most requests handled at once since start", peak),
+        ):
+            name = f"{METRICS_PREFIX}_{name}"
+            lines.extend([f"# TYPE {name} gauge", f"# HELP {name} {help_text}.", f"{name} {value}"])
+
+        usage = self.get_token_usage()
+        _counter(lines, "llm_tokens", "Model tokens used, by task", [
+            ({"task": task, "model": totals["model"], "direction": direction}, totals[f"{direction}_tokens"])
+            for task, totals in sorted(usage["by_task"].items())
+            for direction in ("input", "output")
+        ])
+        _counter(lines, "llm_endpoint_tokens", "Model tokens used, by API endpoint", [
+            ({"endpoint": endpoint, "direction": direction}, totals[f"{direction}_tokens"])
+            for endpoint, totals in sorted(usage["by_endpoint"].items())
+            for direction in ("input", "output")
+        ])
+        _counter(lines, "prompt_truncations", "Prompt stages cut down to their token budget", [
+            ({"stage": stage}, totals["count"]) for stage, totals in sorted(usage["truncations"].items())
+        ])
+        _counter(lines, "prompt_truncated_tokens", "Tokens dropped to fit prompt budgets", [
+            ({"stage": stage}, totals["tokens_dropped"]) for stage, totals in sorted(usage["truncations"].items())
+        ])
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _counter(lines: List[str], name: str, help_text: str, samples):
+    name = f"{METRICS_PREFIX}_{name}"
+    lines.extend([f"# TYPE {name} counter", f"# HELP {name} {help_text}."])
+    for labels, value in samples:
+        label_text = ",".join(f'{key}="{_escape_label(label)}"' for key, label in labels.items())
+        lines.append(f"{name}_total{{{label_text}}} {value}")
 
 # Create singleton instance
 performance_monitor = PerformanceMonitor()
@@ -148,41 +406,56 @@ def track_endpoint_performance(endpoint_name: str = None):
         @functools.wraps(func)
         async def wrapper(*args, **kwargs):
             endpoint = endpoint_name or func.__name__
-            start_time = time.time()
+            start_time = time.perf_counter()
             performance_monitor.request_started()
+            error = False
             
             try:
                 result = await func(*args, **kwargs)
                 return result
+            except Exception as e:
+                # HTTPException 4xx are the client's fault (validation, 404,
+                # rate limits); only 5xx and unhandled exceptions are errors
+                status_code = getattr(e, "status_code", None)
+                error = not isinstance(status_code, int) or status_code >= 500
+                raise
             finally:
-                elapsed = time.time() - start_time
-                performance_monitor.track_api_call(endpoint, elapsed)
+                elapsed = time.perf_counter() - start_time
+                performance_monitor.track_api_call(endpoint, elapsed, error=error)
                 performance_monitor.request_ended()
                 
         return wrapper
     return decorator
 
-# Decorator for tracking LLM API call performance
-def track_llm_performance(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        start_time = time.time()
-        result = func(*args, **kwargs)
-        elapsed = time.time() - start_time
-        performance_monitor.track_llm_call(elapsed)
-        return result
-    return wrapper
+# Decorator for tracking LLM API call performance; use as @track_llm_performance
+# or @track_llm_performance("task")
+def track_llm_performance(task=None):
+    def decorator(func):
+        name = task or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                performance_monitor.track_llm_call(time.perf_counter() - start_time, task=name)
+        return wrapper
+    if callable(task):
+        func, task = task, None
+        return decorator(func)
+    return decorator
 
 # Decorator for tracking vector store operations
 def track_vector_store(operation: str):
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            start_time = time.time()
-            result = func(*args, **kwargs)
-            elapsed = time.time() - start_time
-            performance_monitor.track_vector_store_operation(operation, elapsed)
-            return result
+            start_time = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                performance_monitor.track_vector_store_operation(operation, time.perf_counter() - start_time)
         return wrapper
     return decorator
 
@@ -191,10 +464,10 @@ def track_db_operation(operation: str):
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            start_time = time.time()
-            result = func(*args, **kwargs)
-            elapsed = time.time() - start_time
-            performance_monitor.track_db_operation(operation, elapsed)
-            return result
+            start_time = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                performance_monitor.track_db_operation(operation, time.perf_counter() - start_time)
         return wrapper
     return decorator
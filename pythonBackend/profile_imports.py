@@ -0,0 +1,106 @@
+"""
+Report the import-time cost of a module and everything it pulls in.
+
+Runs the target import in a fresh interpreter with ``-X importtime`` and
+aggregates the per-module timings, so cold-start regressions in main.py can
+be spotted before they reach the autoscaled containers.
+
+Usage:
+    python profile_imports.py                 # profile "import main"
+    python profile_imports.py --module grader --top 30
+    python profile_imports.py --by-package
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+current_dir = Path(__file__).parent.absolute()
+
+
+def run_importtime(module: str) -> Tuple[List[Tuple[str, int, int]], float]:
+    """
+    Import a module in a subprocess and parse the -X importtime report
+
+    Args:
+        module: Dotted name of the module to import
+
+    Returns:
+        Tuple[List[Tuple[str, int, int]], float]: ([(name, self_us, cumulative_us)], wall_seconds)
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(current_dir), env.get("PYTHONPATH", "")]))
+    code = (
+        "import time; _t = time.perf_counter(); "
+        f"import {module}; "
+        "print(time.perf_counter() - _t)"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=str(current_dir),
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    if proc.returncode != 0:
+        tail = proc.stderr.strip().splitlines()[-5:]
+        raise RuntimeError(f"Importing {module} failed:\n" + "\n".join(tail))
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us = int(parts[0].strip())
+            cumulative_us = int(parts[1].strip())
+        except ValueError:
+            continue
+        rows.append((parts[2].strip(), self_us, cumulative_us))
+
+    wall = float(proc.stdout.strip().splitlines()[-1]) if proc.stdout.strip() else 0.0
+    return rows, wall
+
+
+def aggregate_by_package(rows: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    """Sum self time per top-level package"""
+    totals = defaultdict(int)
+    for name, self_us, _ in rows:
+        totals[name.split(".")[0]] += self_us
+    return dict(totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile per-module import cost")
+    parser.add_argument("--module", default="main", help="Module to import (default: main)")
+    parser.add_argument("--top", type=int, default=25, help="Number of rows to show")
+    parser.add_argument("--by-package", action="store_true", help="Aggregate self time by top-level package")
+    args = parser.parse_args()
+
+    try:
+        rows, wall = run_importtime(args.module)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print(f"import {args.module}: {wall * 1000:.1f} ms wall, {len(rows)} modules loaded\n")
+
+    if args.by_package:
+        totals = aggregate_by_package(rows)
+        print(f"{'self [ms]':>10}  package")
+        for package, self_us in sorted(totals.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+            print(f"{self_us / 1000:>10.1f}  {package}")
+        return
+
+    print(f"{'cumul [ms]':>10}  {'self [ms]':>10}  module")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda row: row[2], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>10.1f}  {self_us / 1000:>10.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
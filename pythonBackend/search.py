@@ -1,10 +1,11 @@
-from google import genai
 from google.genai import types
 from typing import List, Tuple
 import logging
-import os
 from dotenv import load_dotenv
 
+import llm_gateway
+import model_router
+
 # Load environment variables
 load_dotenv()
 
@@ -18,13 +19,11 @@ def google_search(query: str) -> Tuple[str, List[str]]:
     Returns a tuple containing (text_response, search_links)
     """
     try:
-        client = genai.Client(api_key=os.getenv("GEMINI_API_KEY", ""))
-        
-        response = client.models.generate_content(
-            model='gemini-2.0-flash',
-            contents=query,
+        response = llm_gateway.generate(
+            "web_search",
+            query,
             config=types.GenerateContentConfig(
-                temperature=0.2,
+                **model_router.policy("web_search").generation_config(),
                 tools=[types.Tool(
                     google_search=types.GoogleSearchRetrieval()
                 )]
@@ -0,0 +1,226 @@
+"""
+Token accounting and prompt budgets.
+
+Every model call that goes through the LLM gateway is recorded with its
+input and output token counts, under its task and under the endpoint and
+session of the request that made it. The request scope lives in context
+variables, so it follows the call into the executor and gateway threads.
+Counts come from the API's usage metadata when present and are estimated
+from the text otherwise. Totals are kept by performance_monitor.
+
+Prompt-building code keeps each stage within a token budget
+(TOKEN_BUDGET_<STAGE> env vars) using fit_to_budget / pack_passages, which
+cut at paragraph and sentence boundaries rather than mid-word, and report
+how much was dropped.
+"""
+import os
+import re
+import contextvars
+from typing import Any, Iterable, List, Optional, Tuple
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+TRUNCATION_MARKER = "[... truncated]"
+
+# Default token budgets per prompt stage
+DEFAULT_BUDGETS = {
+    # Retrieved document chunks in a chat prompt
+    "chat_documents": 3000,
+    # Google search results appended to a chat prompt
+    "chat_search": 1500,
+    # Syllabus, web and search material sent for topic extraction
+    "curriculum_sources": 4000,
+    # Search results inlined into the overview and step detail prompts
+    "curriculum_search": 1500,
+    "step_detail_search": 1500,
+}
+
+current_endpoint: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_endpoint", default=None)
+current_session: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_session", default=None)
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximate the token count of text.
+
+    Counts words and punctuation marks, which tracks subword tokenizer counts
+    closely enough for chunk sizing and budgets without pulling in a tokenizer.
+    """
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+def budget(stage: str) -> int:
+    """Token budget for a prompt stage (TOKEN_BUDGET_<STAGE> overrides the default)"""
+    return int(os.getenv(f"TOKEN_BUDGET_{stage.upper()}", str(DEFAULT_BUDGETS.get(stage, 2000))))
+
+
+def bind(endpoint: Optional[str] = None, session_id: Optional[str] = None):
+    """Attribute model calls made from the current context to an endpoint and/or session"""
+    if endpoint is not None:
+        current_endpoint.set(endpoint)
+    if session_id is not None:
+        current_session.set(session_id)
+
+
+def _truncate_text(text: str, max_tokens: int) -> str:
+    """Longest prefix of text within max_tokens, cut at a sentence or word boundary"""
+    kept: List[str] = []
+    used = 0
+    for sentence in _SENTENCE_END.split(text):
+        tokens = count_tokens(sentence)
+        if used + tokens <= max_tokens:
+            kept.append(sentence)
+            used += tokens
+            continue
+        if not kept:
+            # A single over-long sentence: fall back to whole words
+            words: List[str] = []
+            for word in sentence.split():
+                tokens = count_tokens(word)
+                if used + tokens > max_tokens:
+                    break
+                words.append(word)
+                used += tokens
+            kept.append(" ".join(words))
+        break
+    return " ".join(kept).strip()
+
+
+def fit_to_budget(text: str, max_tokens: int, stage: Optional[str] = None) -> str:
+    """
+    Shorten text to at most max_tokens
+
+    Whole paragraphs are kept in order; the first paragraph that does not
+    fit is cut at a sentence boundary. A marker shows that text was removed.
+
+    Args:
+        text: Text to fit
+        max_tokens: Token budget
+        stage: Budget stage name, for truncation metrics
+
+    Returns:
+        str: The text, unchanged if it already fits
+    """
+    total = count_tokens(text)
+    if total <= max_tokens:
+        return text
+    # Leave room for the marker
+    limit = max(0, max_tokens - count_tokens(TRUNCATION_MARKER))
+    kept: List[str] = []
+    used = 0
+    for paragraph in re.split(r"\n\s*\n", text):
+        tokens = count_tokens(paragraph)
+        if used + tokens <= limit:
+            kept.append(paragraph)
+            used += tokens
+            continue
+        partial = _truncate_text(paragraph, limit - used)
+        if partial:
+            kept.append(partial)
+        break
+    result = "\n\n".join(kept + [TRUNCATION_MARKER])
+    record_truncation(stage, total, count_tokens(result))
+    return result
+
+
+def pack_passages(passages: Iterable[str], max_tokens: int, separator: str = "\n\n",
+                  stage: Optional[str] = None) -> Tuple[str, int]:
+    """
+    Join ranked passages until the budget is spent
+
+    Passages are taken in the given (relevance) order and kept whole; if the
+    first passage alone is over budget it is shortened instead of dropped.
+
+    Returns:
+        Tuple[str, int]: (joined text, number of passages included)
+    """
+    passages = list(passages)
+    kept: List[str] = []
+    used = 0
+    separator_tokens = count_tokens(separator)
+    for passage in passages:
+        tokens = count_tokens(passage) + (separator_tokens if kept else 0)
+        if used + tokens > max_tokens:
+            if not kept:
+                kept.append(fit_to_budget(passage, max_tokens))
+            break
+        kept.append(passage)
+        used += tokens
+    if len(kept) < len(passages) or (kept and kept[-1] is not passages[len(kept) - 1]):
+        record_truncation(
+            stage,
+            sum(count_tokens(passage) for passage in passages),
+            sum(count_tokens(passage) for passage in kept)
+        )
+    return separator.join(kept), len(kept)
+
+
+def usage_from_response(response: Any) -> Optional[Tuple[int, int]]:
+    """(input_tokens, output_tokens) reported by a google.genai or agno response, if any"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        prompt_tokens = getattr(usage, "prompt_token_count", None)
+        output_tokens = getattr(usage, "candidates_token_count", None)
+        if prompt_tokens is not None or output_tokens is not None:
+            return int(prompt_tokens or 0), int(output_tokens or 0)
+
+    # agno run responses keep per-model-call counts in `metrics`
+    metrics = getattr(response, "metrics", None)
+    if metrics is not None:
+        def total(key):
+            value = metrics.get(key) if isinstance(metrics, dict) else getattr(metrics, key, None)
+            if isinstance(value, (list, tuple)):
+                return sum(v for v in value if isinstance(v, (int, float)))
+            return value if isinstance(value, (int, float)) else None
+        input_tokens, output_tokens = total("input_tokens"), total("output_tokens")
+        if input_tokens or output_tokens:
+            return int(input_tokens or 0), int(output_tokens or 0)
+    return None
+
+
+def _prompt_text(contents: Any) -> str:
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, (list, tuple)):
+        return "\n".join(part for part in contents if isinstance(part, str))
+    return ""
+
+
+def _response_text(response: Any) -> str:
+    for attr in ("text", "content"):
+        try:
+            value = getattr(response, attr, None)
+        except Exception:
+            continue
+        if isinstance(value, str):
+            return value
+    return ""
+
+
+def record_call(task: str, model: str, contents: Any, response: Any):
+    """Record the tokens used by one model call in the current request scope"""
+    from performance_monitor import performance_monitor
+
+    usage = usage_from_response(response)
+    estimated = usage is None
+    if estimated:
+        usage = (count_tokens(_prompt_text(contents)), count_tokens(_response_text(response)))
+    performance_monitor.track_tokens(
+        task=task,
+        model=model,
+        input_tokens=usage[0],
+        output_tokens=usage[1],
+        endpoint=current_endpoint.get(),
+        session_id=current_session.get(),
+        estimated=estimated
+    )
+
+
+def record_truncation(stage: Optional[str], tokens_before: int, tokens_after: int):
+    """Record that a prompt stage was cut down to its budget"""
+    if not stage:
+        return
+    from performance_monitor import performance_monitor
+
+    performance_monitor.track_truncation(stage, tokens_before, tokens_after)
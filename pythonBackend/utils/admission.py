@@ -0,0 +1,272 @@
+"""
+Admission control for the LLM-heavy endpoints (/chat, /grade, /curriculum).
+
+Two layers decide whether a request may start:
+
+1. A token bucket per tenant (API key, X-Tenant-ID header or client address)
+   limits how fast each caller can spend model capacity. Endpoints have a
+   cost in tokens, so a curriculum generation weighs more than a chat turn.
+   An empty bucket is answered immediately with 429 and a Retry-After.
+2. A concurrency cap per upstream model bounds how many admitted requests
+   call that model at once. Requests over the cap wait in a bounded FIFO
+   queue; when the queue is full, or a request waits longer than its
+   deadline, it is answered with 503 and a Retry-After.
+
+Shedding load early keeps latency predictable under bursts instead of
+letting every request reach Gemini, hit its rate limits and fail.
+"""
+import os
+import math
+import time
+import asyncio
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+# Per-tenant token bucket: sustained tokens per minute and burst size
+ADMISSION_TENANT_RATE_PER_MINUTE = float(os.getenv("ADMISSION_TENANT_RATE_PER_MINUTE", "60"))
+ADMISSION_TENANT_BURST = float(os.getenv("ADMISSION_TENANT_BURST", "20"))
+# Tenants whose buckets are kept in memory (least recently seen are dropped)
+ADMISSION_MAX_TENANTS = int(os.getenv("ADMISSION_MAX_TENANTS", "10000"))
+# Requests allowed to call one upstream model at the same time
+ADMISSION_MODEL_CONCURRENCY = int(os.getenv("ADMISSION_MODEL_CONCURRENCY", "16"))
+# Requests allowed to wait for a model slot, and how long each may wait
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "15"))
+
+# Endpoint -> upstream model and token cost per request
+ENDPOINT_POLICIES: Dict[str, Dict[str, Any]] = {
+    "chat": {"model": "gemini-2.0-flash", "cost": 1},
+    "grade": {"model": "gemini-2.0-flash", "cost": 2},
+    "curriculum": {"model": "gemini-2.0-flash", "cost": 3},
+}
+
+
+class RateLimited(Exception):
+    """Raised when a tenant has exhausted its token bucket"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Saturated(Exception):
+    """Raised when a model's wait queue is full or the wait deadline passed"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` tokens per second"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = max(rate, 1e-9)
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, cost: float = 1.0) -> Tuple[bool, float]:
+        """
+        Take `cost` tokens if available
+
+        Returns:
+            Tuple[bool, float]: (acquired, seconds until enough tokens are available)
+        """
+        now = time.monotonic()
+        self._refill(now)
+        cost = min(cost, self.burst)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True, 0.0
+        return False, (cost - self.tokens) / self.rate
+
+    def refund(self, cost: float = 1.0):
+        self.tokens = min(self.burst, self.tokens + cost)
+
+
+class ConcurrencyLimiter:
+    """
+    Async concurrency cap with a bounded FIFO wait queue
+
+    Must be used from a single event loop (no thread safety needed).
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.name = name
+        self.queue_timeout = queue_timeout
+        self.limit = max(1, limit)
+        self.max_queue = max(0, max_queue)
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.queued_total = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self._total_wait = 0.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, timeout: float):
+        """
+        Take a slot, waiting in the queue for at most `timeout` seconds
+
+        Raises:
+            Saturated: if the queue is full or the deadline passes
+        """
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise Saturated(f"Too many requests waiting for {self.name}", self._retry_after())
+
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued_total += 1
+        try:
+            await asyncio.wait({waiter}, timeout=timeout)
+        except asyncio.CancelledError:
+            # Client went away while queued; pass on a slot we were just handed
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                waiter.cancel()
+                self._discard(waiter)
+            raise
+        if not waiter.done():
+            waiter.cancel()
+            self._discard(waiter)
+            self.rejected_timeout += 1
+            raise Saturated(f"Timed out waiting for {self.name}", self._retry_after())
+        self._total_wait += time.monotonic() - started
+        self.admitted += 1
+
+    def release(self):
+        """Hand the slot to the next live waiter, or free it"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active = max(0, self.active - 1)
+
+    def _discard(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _retry_after(self) -> float:
+        # Rough estimate: one queue timeout scaled by how full the queue is
+        return max(1.0, self.queue_timeout * (len(self._waiters) + 1) / (self.max_queue + 1))
+
+    def stats(self) -> Dict[str, Any]:
+        waited = self.queued_total - self.rejected_timeout
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_queue_wait_ms": round(self._total_wait / waited * 1000, 2) if waited > 0 else 0.0
+        }
+
+
+class AdmissionController:
+    """Per-tenant token buckets plus per-model concurrency limiters"""
+
+    def __init__(
+        self,
+        rate_per_minute: float = ADMISSION_TENANT_RATE_PER_MINUTE,
+        burst: float = ADMISSION_TENANT_BURST,
+        model_concurrency: int = ADMISSION_MODEL_CONCURRENCY,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        max_tenants: int = ADMISSION_MAX_TENANTS
+    ):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.model_concurrency = model_concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.max_tenants = max(1, max_tenants)
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._limiters: Dict[str, ConcurrencyLimiter] = {}
+        self.rate_limited = 0
+
+    def _bucket(self, tenant: str) -> TokenBucket:
+        bucket = self._buckets.get(tenant)
+        if bucket is None:
+            bucket = self._buckets[tenant] = TokenBucket(self.rate, self.burst)
+            while len(self._buckets) > self.max_tenants:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(tenant)
+        return bucket
+
+    def limiter(self, model: str) -> ConcurrencyLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            limiter = self._limiters[model] = ConcurrencyLimiter(
+                model, self.model_concurrency, self.queue_size, self.queue_timeout
+            )
+        return limiter
+
+    async def admit(self, endpoint: str, tenant: str, timeout: Optional[float] = None) -> ConcurrencyLimiter:
+        """
+        Admit a request or raise
+
+        Returns:
+            ConcurrencyLimiter: The limiter holding the request's slot; pass it to release()
+
+        Raises:
+            RateLimited: the tenant is over its rate
+            Saturated: the endpoint's model is at capacity
+        """
+        policy = ENDPOINT_POLICIES[endpoint]
+        bucket = self._bucket(tenant)
+        acquired, retry_after = bucket.try_acquire(policy["cost"])
+        if not acquired:
+            self.rate_limited += 1
+            raise RateLimited(f"Rate limit exceeded for {endpoint}", retry_after)
+
+        limiter = self.limiter(policy["model"])
+        try:
+            await limiter.acquire(self.queue_timeout if timeout is None else timeout)
+        except BaseException:
+            # The request never ran, so it should not count against the tenant
+            bucket.refund(policy["cost"])
+            raise
+        return limiter
+
+    @staticmethod
+    def release(limiter: ConcurrencyLimiter):
+        limiter.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": ADMISSION_ENABLED,
+            "tenants": len(self._buckets),
+            "rate_limited": self.rate_limited,
+            "models": {model: limiter.stats() for model, limiter in self._limiters.items()}
+        }
+
+
+def retry_after_header(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+# Process-wide controller used by the API dependencies
+admission_controller = AdmissionController()
@@ -0,0 +1,111 @@
+"""
+Small in-process caches shared by the service layer.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe LRU cache with an optional per-entry TTL.
+
+    Values are deep-copied on the way in and out so callers can mutate what
+    they get back without corrupting the cached copy.
+    """
+
+    def __init__(self, max_size: int = 256, ttl: Optional[float] = None, name: str = "cache"):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.name = name
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        # Bumped on every invalidate/clear so fills can detect a racing write
+        self._generation = 0
+
+    def generation(self) -> int:
+        """
+        Token to take before reading the source of truth; pass it to set()
+        so a value read before a concurrent invalidation is not cached
+        """
+        with self._lock:
+            return self._generation
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a copy of the cached value, or default on a miss or expiry"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self._misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._data[key]
+                self._misses += 1
+                return default
+            self._data.move_to_end(key)
+            self._hits += 1
+        return copy.deepcopy(value)
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None) -> bool:
+        """
+        Store a copy of value, evicting the least recently used entries
+
+        Args:
+            key: Cache key
+            value: Value to store
+            generation: Token from generation(); if the cache was invalidated
+                since it was taken, the (possibly stale) value is not stored
+
+        Returns:
+            bool: True if the value was stored
+        """
+        value = copy.deepcopy(value)
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return False
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._evictions += 1
+        return True
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop a single entry"""
+        with self._lock:
+            self._generation += 1
+            if self._data.pop(key, _MISSING) is not _MISSING:
+                self._invalidations += 1
+
+    def clear(self) -> None:
+        """Drop every entry"""
+        with self._lock:
+            self._generation += 1
+            self._invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters for monitoring"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": (self._hits / lookups) if lookups else 0.0,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations
+            }
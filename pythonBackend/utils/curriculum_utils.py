@@ -1,7 +1,77 @@
+import os
 import uuid
+from datetime import datetime, timezone
 from typing import Dict, Any, Optional, Tuple, List
 from utils.supabase_client import initialize_supabase
+from utils.cache import LRUCache
+from performance_monitor import track_db_operation
 
+# One row per curriculum. Listings are ordered by created_at, so existing
+# deployments need it added (alter table curriculum_steps add column
+# created_at timestamptz not null default now()):
+#
+#   create table curriculum_steps (
+#       step_id uuid primary key,
+#       step_title text not null,
+#       estimated_time text,
+#       overview jsonb,
+#       detailed_content jsonb,
+#       created_at timestamptz not null default now()
+#   );
+
+# Upper bound on rows returned when listing curriculums without a limit
+CURRICULUM_LIST_MAX_ROWS = int(os.getenv("CURRICULUM_LIST_MAX_ROWS", "10000"))
+
+# Read-through cache for curriculum rows. Set CURRICULUM_CACHE_ENABLED=false
+# to always hit Supabase.
+CURRICULUM_CACHE_ENABLED = os.getenv("CURRICULUM_CACHE_ENABLED", "true").lower() == "true"
+curriculum_cache = LRUCache(
+    max_size=int(os.getenv("CURRICULUM_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("CURRICULUM_CACHE_TTL", "300")),
+    name="curriculum_steps"
+)
+
+def get_curriculum_cache_stats() -> Dict[str, Any]:
+    """Return hit/miss metrics for the curriculum row cache"""
+    stats = curriculum_cache.stats()
+    stats["enabled"] = CURRICULUM_CACHE_ENABLED
+    return stats
+
+# Per-step detail rows. Each generated step is stored in its own row so that
+# concurrent generations for different steps never overwrite each other:
+#
+#   create table curriculum_step_details (
+#       curriculum_id uuid not null,
+#       step_index integer not null,
+#       detail jsonb not null,
+#       updated_at timestamptz not null default now(),
+#       primary key (curriculum_id, step_index)
+#   );
+STEP_DETAILS_TABLE = "curriculum_step_details"
+
+
+class StepDetailsTableMissing(Exception):
+    """Raised when the curriculum_step_details table has not been created"""
+
+
+def _is_missing_table(error: Exception) -> bool:
+    # Postgres "undefined table" and PostgREST "table not in schema cache"
+    message = str(error).lower()
+    return (
+        "42p01" in message
+        or "pgrst205" in message
+        or "could not find the table" in message
+        or ("relation" in message and "does not exist" in message)
+    )
+
+def invalidate_curriculum_cache(step_id: Optional[str] = None):
+    """Drop one cached curriculum row, or the whole cache if no ID is given"""
+    if step_id:
+        curriculum_cache.invalidate(step_id)
+    else:
+        curriculum_cache.clear()
+
+@track_db_operation("create_curriculum_step")
 def create_curriculum_step(step_title: str, estimated_time: str, overview=None, detailed_content=None) -> Tuple[str, bool]:
     """
     Create a new curriculum step and save to Supabase
@@ -19,6 +89,7 @@ def create_curriculum_step(step_title: str, estimated_time: str, overview=None,
     success = save_curriculum_step(step_id, step_title, estimated_time, overview, detailed_content)
     return step_id, success
 
+@track_db_operation("save_curriculum_step")
 def save_curriculum_step(step_id: str, step_title: str, estimated_time: str, overview=None, detailed_content=None) -> bool:
     """
     Save curriculum step to Supabase
@@ -44,7 +115,8 @@ def save_curriculum_step(step_id: str, step_title: str, estimated_time: str, ove
         data = {
             "step_id": step_id,
             "step_title": step_title,
-            "estimated_time": estimated_time
+            "estimated_time": estimated_time,
+            "created_at": datetime.now(timezone.utc).isoformat()
         }
         
         # Add JSON data if provided
@@ -62,20 +134,42 @@ def save_curriculum_step(step_id: str, step_title: str, estimated_time: str, ove
     except Exception as e:
         print(f"Error saving curriculum step to Supabase: {e}")
         return False
+    finally:
+        curriculum_cache.invalidate(step_id)
 
-def get_curriculum_step(step_id: str) -> Optional[Dict[str, Any]]:
+def get_curriculum_step(step_id: str, use_cache: bool = True) -> Optional[Dict[str, Any]]:
     """
-    Get curriculum step from Supabase
+    Get curriculum step from Supabase, served from the row cache when possible
     
     Args:
         step_id: UUID of the curriculum step
+        use_cache: Set to False to bypass the cache and read from Supabase
         
     Returns:
         Optional[Dict[str, Any]]: Curriculum step data or None if not found
     """
+    print(f"DEBUG: get_curriculum_step called for step_id={step_id}")
+    
+    use_cache = use_cache and CURRICULUM_CACHE_ENABLED
+    if not use_cache:
+        return _read_curriculum_step(step_id)
+    
+    cached = curriculum_cache.get(step_id)
+    if cached is not None:
+        return cached
+    
+    # Taken before the read: a save that lands meanwhile invalidates the
+    # row, and the value read here must then not be cached
+    generation = curriculum_cache.generation()
+    step_data = _read_curriculum_step(step_id)
+    if step_data is not None:
+        curriculum_cache.set(step_id, step_data, generation=generation)
+    return step_data
+
+@track_db_operation("get_curriculum_step")
+def _read_curriculum_step(step_id: str) -> Optional[Dict[str, Any]]:
+    """Read one curriculum step from Supabase, bypassing the cache"""
     try:
-        print(f"DEBUG: get_curriculum_step called for step_id={step_id}")
-        
         # Initialize Supabase client
         supabase = initialize_supabase()
         if not supabase:
@@ -127,6 +221,53 @@ def get_all_curriculum_steps() -> List[Dict[str, Any]]:
         print(f"Error getting curriculum steps from Supabase: {e}")
         return []
 
+@track_db_operation("list_curriculum_steps")
+def list_curriculum_steps(limit: Optional[int] = None, offset: int = 0, columns: Tuple[str, ...] = ("step_id", "step_title"), include_count: bool = False) -> Tuple[List[Dict[str, Any]], bool, Optional[int]]:
+    """
+    Get curriculum steps from Supabase, projecting only the given columns
+    
+    Rows are ordered by creation time (the created_at column), so pages are
+    stable and new curriculums come last. The offset is always applied by
+    the database; with a limit, one extra row is fetched to tell whether
+    another page exists without a separate count query.
+    
+    Args:
+        limit: Maximum number of rows to return (None for all rows, up to
+            CURRICULUM_LIST_MAX_ROWS)
+        offset: Number of rows to skip
+        columns: Columns to select (avoid the large overview/detailed_content blobs)
+        include_count: Also return the exact total row count
+        
+    Returns:
+        Tuple[List[Dict[str, Any]], bool, Optional[int]]: (rows, has_more, total_count)
+        
+    Raises:
+        Exception: If Supabase is unavailable or the query fails
+    """
+    # Initialize Supabase client
+    supabase = initialize_supabase()
+    if not supabase:
+        raise Exception("Failed to initialize Supabase client")
+        
+    # Query Supabase
+    query = supabase.table("curriculum_steps").select(
+        ", ".join(columns),
+        count="exact" if include_count else None
+    )
+    query = query.order("created_at")
+    if limit is None:
+        response = query.range(offset, offset + CURRICULUM_LIST_MAX_ROWS - 1).execute()
+        rows = response.data if response and response.data else []
+        total = getattr(response, "count", None) if include_count else None
+        return rows, False, total
+    
+    response = query.range(offset, offset + limit).execute()
+    rows = response.data if response and response.data else []
+    has_more = len(rows) > limit
+    total = getattr(response, "count", None) if include_count else None
+    return rows[:limit], has_more, total
+
+@track_db_operation("update_curriculum_step")
 def update_curriculum_step(step_id: str, step_title: str, estimated_time: str, overview=None, detailed_content=None) -> bool:
     """
     Update an existing curriculum step in Supabase
@@ -169,3 +310,176 @@ def update_curriculum_step(step_id: str, step_title: str, estimated_time: str, o
     except Exception as e:
         print(f"Error updating curriculum step in Supabase: {e}")
         return False
+    finally:
+        curriculum_cache.invalidate(step_id)
+
+@track_db_operation("save_step_detail")
+def save_step_detail(curriculum_id: str, step_index: int, detail: Dict[str, Any]) -> bool:
+    """
+    Atomically store the detailed content of a single curriculum step
+    
+    Upserts one row keyed by (curriculum_id, step_index); other steps of the
+    same curriculum are not touched.
+    
+    Args:
+        curriculum_id: UUID of the curriculum
+        step_index: Index of the step within the curriculum
+        detail: JSON data for the detailed step
+        
+    Returns:
+        bool: True if save was successful, False if no Supabase client is available
+        
+    Raises:
+        StepDetailsTableMissing: the per-step table does not exist
+        Exception: any other Supabase error, so callers do not mistake a
+            transient failure for a missing table
+    """
+    try:
+        # Initialize Supabase client
+        supabase = initialize_supabase()
+        if not supabase:
+            print("Failed to initialize Supabase client")
+            return False
+            
+        data = {
+            "curriculum_id": curriculum_id,
+            "step_index": step_index,
+            "detail": detail,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }
+        supabase.table(STEP_DETAILS_TABLE).upsert(data, on_conflict="curriculum_id,step_index").execute()
+        print(f"Successfully saved detail for step {step_index} of curriculum {curriculum_id}")
+        return True
+        
+    except Exception as e:
+        print(f"Error saving step detail to Supabase: {e}")
+        if _is_missing_table(e):
+            raise StepDetailsTableMissing(str(e)) from e
+        raise
+
+@track_db_operation("get_step_detail_record")
+def get_step_detail_record(curriculum_id: str, step_index: int) -> Optional[Dict[str, Any]]:
+    """
+    Get the stored detailed content of a single curriculum step
+    
+    Args:
+        curriculum_id: UUID of the curriculum
+        step_index: Index of the step within the curriculum
+        
+    Returns:
+        Optional[Dict[str, Any]]: Detail JSON or None if not stored yet
+    """
+    try:
+        # Initialize Supabase client
+        supabase = initialize_supabase()
+        if not supabase:
+            return None
+            
+        response = (
+            supabase.table(STEP_DETAILS_TABLE)
+            .select("detail")
+            .eq("curriculum_id", curriculum_id)
+            .eq("step_index", step_index)
+            .limit(1)
+            .execute()
+        )
+        if response and response.data:
+            return response.data[0].get("detail")
+        return None
+        
+    except Exception as e:
+        print(f"Error getting step detail from Supabase: {e}")
+        return None
+
+@track_db_operation("get_step_details")
+def get_step_details(curriculum_id: str) -> Dict[int, Dict[str, Any]]:
+    """
+    Get every stored step detail of a curriculum
+    
+    Args:
+        curriculum_id: UUID of the curriculum
+        
+    Returns:
+        Dict[int, Dict[str, Any]]: Mapping of step index to detail JSON
+    """
+    try:
+        # Initialize Supabase client
+        supabase = initialize_supabase()
+        if not supabase:
+            return {}
+            
+        response = (
+            supabase.table(STEP_DETAILS_TABLE)
+            .select("step_index, detail")
+            .eq("curriculum_id", curriculum_id)
+            .execute()
+        )
+        return {row["step_index"]: row["detail"] for row in (response.data or [])}
+        
+    except Exception as e:
+        print(f"Error getting step details from Supabase: {e}")
+        return {}
+
+@track_db_operation("delete_step_details")
+def delete_step_details(curriculum_id: str) -> bool:
+    """
+    Delete every stored step detail of a curriculum
+    
+    Removes the per-step rows and clears the legacy detailed_content blob, so
+    details generated for old step indexes are not served again.
+    
+    Args:
+        curriculum_id: UUID of the curriculum
+        
+    Returns:
+        bool: True if the details were deleted, False otherwise
+    """
+    try:
+        # Initialize Supabase client
+        supabase = initialize_supabase()
+        if not supabase:
+            return False
+            
+        try:
+            supabase.table(STEP_DETAILS_TABLE).delete().eq("curriculum_id", curriculum_id).execute()
+        except Exception as e:
+            if not _is_missing_table(e):
+                raise
+        supabase.table("curriculum_steps").update({"detailed_content": None}).eq("step_id", curriculum_id).execute()
+        print(f"Deleted step details of curriculum {curriculum_id}")
+        return True
+        
+    except Exception as e:
+        print(f"Error deleting step details from Supabase: {e}")
+        return False
+    finally:
+        curriculum_cache.invalidate(curriculum_id)
+
+@track_db_operation("patch_legacy_step_detail")
+def patch_legacy_step_detail(curriculum_id: str, step_index: int, detail: Dict[str, Any]) -> bool:
+    """
+    Store a step detail inside the legacy detailed_content blob
+    
+    Used only when the per-step table is unavailable. The row is re-read
+    uncached right before the write to keep the race window small.
+    
+    Args:
+        curriculum_id: UUID of the curriculum
+        step_index: Index of the step within the curriculum
+        detail: JSON data for the detailed step
+        
+    Returns:
+        bool: True if update was successful, False otherwise
+    """
+    curriculum_step = get_curriculum_step(curriculum_id, use_cache=False)
+    if not curriculum_step:
+        return False
+    detailed_content = curriculum_step.get("detailed_content") or {}
+    detailed_content[str(step_index)] = detail
+    return update_curriculum_step(
+        curriculum_id,
+        curriculum_step.get("step_title", "Untitled Curriculum"),
+        curriculum_step.get("estimated_time", "Not specified"),
+        curriculum_step.get("overview"),
+        detailed_content
+    )
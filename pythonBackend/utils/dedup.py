@@ -0,0 +1,284 @@
+"""
+Near-duplicate chunk detection for ingestion.
+
+Each chunk gets a 64-bit SimHash of its word shingles; chunks whose
+fingerprints differ in at most DEDUP_MAX_DISTANCE bits are treated as
+near-duplicates. Lookups use LSH banding: the fingerprint is cut into
+DEDUP_MAX_DISTANCE + 1 bands, and by the pigeonhole principle any match
+within the distance shares at least one band exactly, so only those
+candidates are compared.
+
+Fingerprints are stored with the vectors (FINGERPRINT_METADATA_KEY
+metadata), so the in-memory index of a namespace (session) is only a cache:
+it is rebuilt from the vector store the first time the namespace is seen by
+this process, and the least recently used namespaces are dropped once more
+than DEDUP_MAX_FINGERPRINTS fingerprints are held.
+"""
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Mapping, Optional, Set
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+# Maximum Hamming distance between fingerprints of near-duplicate chunks
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", "6"))
+# Words per shingle
+DEDUP_SHINGLE_SIZE = int(os.getenv("DEDUP_SHINGLE_SIZE", "3"))
+# Fingerprints held in memory across all namespaces before the least recently
+# used namespaces are dropped (they are reloaded from the vector store)
+DEDUP_MAX_FINGERPRINTS = int(os.getenv("DEDUP_MAX_FINGERPRINTS", "200000"))
+
+FINGERPRINT_BITS = 64
+# Vector metadata key holding a chunk's fingerprint as 16 hex digits
+# (Pinecone stores numbers as floats, which cannot hold 64 bits)
+FINGERPRINT_METADATA_KEY = "simhash"
+_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text: str, shingle_size: int = DEDUP_SHINGLE_SIZE) -> int:
+    """Return the 64-bit SimHash of text's lower-cased word shingles"""
+    words = _WORD_PATTERN.findall(text.lower())
+    if not words:
+        return 0
+    size = max(1, min(shingle_size, len(words)))
+    weights = [0] * FINGERPRINT_BITS
+    for i in range(len(words) - size + 1):
+        h = _hash64(" ".join(words[i:i + size]))
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def format_fingerprint(fingerprint: int) -> str:
+    return format(fingerprint, "016x")
+
+
+def fingerprint_from_metadata(metadata: Mapping[str, Any], text_key: str = "text") -> Optional[int]:
+    """Fingerprint stored with a vector, or computed from its text for vectors stored without one"""
+    value = metadata.get(FINGERPRINT_METADATA_KEY)
+    if isinstance(value, str):
+        try:
+            return int(value, 16)
+        except ValueError:
+            pass
+    text = metadata.get(text_key)
+    return simhash(text) if isinstance(text, str) else None
+
+
+class SimHashIndex:
+    """LSH-banded fingerprint index for a single namespace"""
+
+    def __init__(self, max_distance: int = DEDUP_MAX_DISTANCE):
+        self.max_distance = max(0, min(max_distance, FINGERPRINT_BITS // 2 - 1))
+        self.bands = self.max_distance + 1
+        self.band_bits = FINGERPRINT_BITS // self.bands
+        self._buckets: List[Dict[int, Set[Hashable]]] = [{} for _ in range(self.bands)]
+        self._fingerprints: Dict[Hashable, int] = {}
+
+    def _band_values(self, fingerprint: int) -> List[int]:
+        mask = (1 << self.band_bits) - 1
+        return [(fingerprint >> (band * self.band_bits)) & mask for band in range(self.bands)]
+
+    def find(self, fingerprint: int) -> Optional[Hashable]:
+        """Return the key of a stored near-duplicate, or None"""
+        seen: Set[Hashable] = set()
+        for band, value in enumerate(self._band_values(fingerprint)):
+            for key in self._buckets[band].get(value, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                if hamming_distance(fingerprint, self._fingerprints[key]) <= self.max_distance:
+                    return key
+        return None
+
+    def add(self, key: Hashable, fingerprint: int) -> None:
+        self.remove(key)
+        self._fingerprints[key] = fingerprint
+        for band, value in enumerate(self._band_values(fingerprint)):
+            self._buckets[band].setdefault(value, set()).add(key)
+
+    def remove(self, key: Hashable) -> None:
+        fingerprint = self._fingerprints.pop(key, None)
+        if fingerprint is None:
+            return
+        for band, value in enumerate(self._band_values(fingerprint)):
+            bucket = self._buckets[band].get(value)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][value]
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+
+class NearDuplicateRegistry:
+    """
+    Thread-safe per-namespace near-duplicate registry keyed by vector ID
+
+    A namespace's index is built on first use from `loader(namespace)`,
+    which returns {vector_id: metadata} for the vectors already stored
+    there. Without a loader (no vector store) indexes start empty.
+    """
+
+    def __init__(self, max_distance: int = DEDUP_MAX_DISTANCE, max_fingerprints: int = DEDUP_MAX_FINGERPRINTS,
+                 loader: Optional[Callable[[str], Mapping[str, Mapping[str, Any]]]] = None):
+        self.max_distance = max_distance
+        self.max_fingerprints = max(1, max_fingerprints)
+        self.loader = loader
+        # Least recently used namespace first
+        self._indexes: "OrderedDict[str, SimHashIndex]" = OrderedDict()
+        # Fingerprints held across all namespaces
+        self._held = 0
+        self._lock = threading.Lock()
+        self._checked = 0
+        self._duplicates = 0
+        self._loads = 0
+        self._load_failures = 0
+        self._evictions = 0
+
+    def set_loader(self, loader: Optional[Callable[[str], Mapping[str, Mapping[str, Any]]]]) -> None:
+        """Set the function that reads stored vector metadata of a namespace"""
+        self.loader = loader
+
+    def fingerprint(self, text: str) -> int:
+        """Fingerprint of a chunk, to be stored in its metadata under FINGERPRINT_METADATA_KEY"""
+        return simhash(text)
+
+    def _load(self, namespace: str) -> SimHashIndex:
+        """Build a namespace's index from the vector store (called without the lock)"""
+        index = SimHashIndex(self.max_distance)
+        if self.loader is None:
+            return index
+        try:
+            stored = self.loader(namespace)
+        except Exception as e:
+            # Dedup is best effort; an empty index only misses duplicates
+            print(f"Could not load dedup fingerprints for namespace '{namespace}': {e}")
+            with self._lock:
+                self._load_failures += 1
+            return index
+        for key, metadata in stored.items():
+            fingerprint = fingerprint_from_metadata(metadata or {})
+            if fingerprint is not None:
+                index.add(key, fingerprint)
+        with self._lock:
+            self._loads += 1
+        return index
+
+    def _index_for(self, namespace: str) -> SimHashIndex:
+        """Return the namespace's index, loading it from the vector store if needed"""
+        with self._lock:
+            index = self._indexes.get(namespace)
+            if index is not None:
+                self._indexes.move_to_end(namespace)
+                return index
+        # Load without the lock so other namespaces are not blocked
+        loaded = self._load(namespace)
+        with self._lock:
+            # Another thread may have loaded it meanwhile
+            index = self._indexes.setdefault(namespace, loaded)
+            if index is loaded:
+                self._held += len(loaded)
+                self._evict(keep=namespace)
+            self._indexes.move_to_end(namespace)
+            return index
+
+    def _evict(self, keep: str) -> None:
+        """Drop least recently used namespaces until the bound holds (lock held)"""
+        for namespace in list(self._indexes):
+            if self._held <= self.max_fingerprints:
+                break
+            if namespace == keep:
+                continue
+            self._held -= len(self._indexes.pop(namespace))
+            self._evictions += 1
+
+    def check_and_add(self, namespace: str, text: str, key: Hashable,
+                      fingerprint: Optional[int] = None) -> Optional[Hashable]:
+        """
+        Register a chunk unless a near-duplicate is already present
+
+        Args:
+            namespace: Namespace (session ID) the chunk is ingested into
+            text: Chunk text
+            key: Vector ID the chunk will be stored under
+            fingerprint: Precomputed fingerprint of text, if available
+
+        Returns:
+            The vector ID of the existing near-duplicate, or None if the
+            chunk is new (in which case it has been registered under key)
+        """
+        if fingerprint is None:
+            fingerprint = simhash(text)
+        index = self._index_for(namespace)
+        with self._lock:
+            current = self._indexes.get(namespace)
+            if current is None:
+                # Evicted since _index_for returned; put it back so _held counts it
+                self._indexes[namespace] = index
+                self._held += len(index)
+            elif current is not index:
+                # Evicted and reloaded by another thread meanwhile
+                index = current
+            self._indexes.move_to_end(namespace)
+            self._checked += 1
+            duplicate = index.find(fingerprint)
+            if duplicate is not None:
+                self._duplicates += 1
+                return duplicate
+            held = len(index)
+            index.add(key, fingerprint)
+            self._held += len(index) - held
+            self._evict(keep=namespace)
+            return None
+
+    def remove(self, namespace: str, keys: Iterable[Hashable]) -> None:
+        """Forget the given vector IDs (e.g. after they were deleted)"""
+        with self._lock:
+            index = self._indexes.get(namespace)
+            if index is None:
+                return
+            held = len(index)
+            for key in keys:
+                index.remove(key)
+            self._held -= held - len(index)
+
+    def drop_namespace(self, namespace: str) -> None:
+        """Forget everything registered for a namespace"""
+        with self._lock:
+            index = self._indexes.pop(namespace, None)
+            if index is not None:
+                self._held -= len(index)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "namespaces": len(self._indexes),
+                "fingerprints": self._held,
+                "max_fingerprints": self.max_fingerprints,
+                "checked": self._checked,
+                "duplicates": self._duplicates,
+                "loads": self._loads,
+                "load_failures": self._load_failures,
+                "evictions": self._evictions,
+                "max_distance": self.max_distance
+            }
+
+
+# Process-wide registry used by the ingestion pipeline
+dedup_registry = NearDuplicateRegistry()
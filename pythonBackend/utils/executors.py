@@ -0,0 +1,167 @@
+"""
+Dedicated thread pools for blocking work called from async routes.
+
+The FastAPI handlers are `async def`, but the Gemini SDKs, the agno agents,
+Pinecone and Supabase are all synchronous. Calling them directly stalls the
+event loop, so one slow request blocks every other request on the worker.
+Handlers instead await run_llm / run_db / run_cpu, which run the call on a
+sized pool for that kind of work:
+
+- llm: model calls, embedding and web search (long network waits)
+- db:  Supabase and other short database round trips
+- cpu: parsing and other CPU-bound work
+
+Keeping the pools separate means a burst of slow model calls cannot starve
+quick session reads. Each pool reports its queue depth, active workers and
+queue wait times through executor_stats().
+"""
+import os
+import time
+import asyncio
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# Worker threads per pool
+EXECUTOR_LLM_WORKERS = int(os.getenv("EXECUTOR_LLM_WORKERS", "32"))
+EXECUTOR_DB_WORKERS = int(os.getenv("EXECUTOR_DB_WORKERS", "16"))
+EXECUTOR_CPU_WORKERS = int(os.getenv("EXECUTOR_CPU_WORKERS", str(os.cpu_count() or 4)))
+
+
+class ManagedPool:
+    """A named ThreadPoolExecutor that tracks queue depth and wait times"""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._max_queued = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=f"{self.name}-pool"
+                )
+            return self._executor
+
+    def _run(self, enqueued_at: float, fn: Callable[..., Any]) -> Any:
+        waited = time.monotonic() - enqueued_at
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        failed = False
+        try:
+            return fn()
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._completed += 1
+                if failed:
+                    self._failed += 1
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs) on this pool and await its result
+
+        The caller's context variables are copied into the worker thread, so
+        request-scoped state set before the call is visible inside it.
+        """
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, fn, *args, **kwargs)
+        executor = self._get_executor()
+        with self._lock:
+            self._queued += 1
+            self._submitted += 1
+            self._max_queued = max(self._max_queued, self._queued)
+        try:
+            future = executor.submit(self._run, time.monotonic(), call)
+        except RuntimeError:
+            # Executor already shut down: the call never started
+            with self._lock:
+                self._queued -= 1
+            raise
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future):
+        # Calls cancelled by shutdown() leave the queue without running
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            started = self._completed + self._active
+            return {
+                "max_workers": self.max_workers,
+                "active": self._active,
+                "queued": self._queued,
+                "max_queued": self._max_queued,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "avg_wait_ms": round(self._total_wait / started * 1000, 2) if started else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 2)
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Stop the pool; queued calls that have not started are cancelled"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+pools: Dict[str, ManagedPool] = {
+    "llm": ManagedPool("llm", EXECUTOR_LLM_WORKERS),
+    "db": ManagedPool("db", EXECUTOR_DB_WORKERS),
+    "cpu": ManagedPool("cpu", EXECUTOR_CPU_WORKERS),
+}
+
+
+async def run_in_pool(pool: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking call on the named pool ("llm", "db" or "cpu")"""
+    return await pools[pool].run(fn, *args, **kwargs)
+
+
+async def run_llm(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a model, embedding or search call off the event loop"""
+    return await pools["llm"].run(fn, *args, **kwargs)
+
+
+async def run_db(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a database call off the event loop"""
+    return await pools["db"].run(fn, *args, **kwargs)
+
+
+async def run_cpu(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run CPU-bound work off the event loop"""
+    return await pools["cpu"].run(fn, *args, **kwargs)
+
+
+def executor_stats() -> Dict[str, Dict[str, Any]]:
+    """Per-pool worker, queue-depth and wait-time stats"""
+    return {name: pool.stats() for name, pool in pools.items()}
+
+
+def shutdown_executors(wait: bool = True):
+    """Shut down all pools (called on application shutdown)"""
+    for pool in pools.values():
+        pool.shutdown(wait=wait)
@@ -0,0 +1,385 @@
+"""
+Local HTTP cache for fetched pages and files.
+
+Bodies are stored on disk next to a small JSON record with the validators
+(ETag, Last-Modified) and the freshness lifetime derived from Cache-Control
+or Expires. Fresh entries are served without a request; stale ones are
+revalidated with If-None-Match / If-Modified-Since, and a 304 refreshes the
+entry without re-downloading. The cache is shared by all users of the
+backend, so responses marked `private` are never stored. The least recently used entries are evicted
+once the total size exceeds HTTP_CACHE_MAX_BYTES.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import requests
+
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE_ENABLED", "true").lower() == "true"
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", os.path.join(tempfile.gettempdir(), "edumate_http_cache"))
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Larger responses are passed through without being cached
+HTTP_CACHE_MAX_ENTRY_BYTES = int(os.getenv("HTTP_CACHE_MAX_ENTRY_BYTES", str(25 * 1024 * 1024)))
+# Upper bound for heuristic freshness of responses with only Last-Modified
+HTTP_CACHE_MAX_HEURISTIC_SECONDS = int(os.getenv("HTTP_CACHE_MAX_HEURISTIC_SECONDS", "86400"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+
+
+def _parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    directives: Dict[str, Optional[str]] = {}
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition("=")
+        directives[name.strip().lower()] = arg.strip().strip('"') or None
+    return directives
+
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def freshness_lifetime(headers: Mapping[str, str], now: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds a response may be served without revalidation, or None if it
+    must not be stored at all (no-store, or private since this is a shared cache).
+    """
+    now = now or time.time()
+    cache_control = _parse_cache_control(headers.get("cache-control", ""))
+    if "no-store" in cache_control or "private" in cache_control:
+        return None
+    if "no-cache" in cache_control:
+        return 0.0
+    if cache_control.get("max-age") is not None:
+        try:
+            return max(0.0, float(cache_control["max-age"]))
+        except ValueError:
+            return 0.0
+
+    expires = _http_date(headers.get("expires"))
+    if expires is not None:
+        date = _http_date(headers.get("date")) or now
+        return max(0.0, expires - date)
+
+    # Heuristic freshness: 10% of the time since last modification
+    last_modified = _http_date(headers.get("last-modified"))
+    if last_modified is not None:
+        return min(max(0.0, (now - last_modified) * 0.1), HTTP_CACHE_MAX_HEURISTIC_SECONDS)
+    return 0.0
+
+
+class HttpCache:
+    """Disk-backed HTTP response cache with size-based LRU eviction"""
+
+    def __init__(self, directory: str = HTTP_CACHE_DIR, max_bytes: int = HTTP_CACHE_MAX_BYTES,
+                 max_entry_bytes: int = HTTP_CACHE_MAX_ENTRY_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._revalidations = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _body_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.body")
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load(self):
+        """Build the in-memory index from disk on first use (lock held)"""
+        if self._entries is not None:
+            return
+        self._entries = {}
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-5]
+            try:
+                with open(self._meta_path(key)) as f:
+                    meta = json.load(f)
+                if not os.path.exists(self._body_path(key)):
+                    raise FileNotFoundError(key)
+            except (OSError, ValueError):
+                self._remove_files(key)
+                continue
+            self._entries[key] = meta
+            self._total_bytes += meta.get("size", 0)
+
+    def _remove_files(self, key: str):
+        for path in (self._body_path(key), self._meta_path(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _write_meta(self, key: str, meta: Dict[str, Any]):
+        tmp_path = self._meta_path(key) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path(key))
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits (lock held)"""
+        if self._total_bytes <= self.max_bytes:
+            return
+        for key, meta in sorted(self._entries.items(), key=lambda item: item[1].get("last_access", 0)):
+            if self._total_bytes <= self.max_bytes:
+                break
+            self._entries.pop(key)
+            self._total_bytes -= meta.get("size", 0)
+            self._remove_files(key)
+            self._evictions += 1
+
+    def lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        """Return the cache record for url (with `fresh`), or None. Read the body with read_body/copy_body."""
+        key = self._key(url)
+        with self._lock:
+            self._load()
+            meta = self._entries.get(key)
+            if meta is None:
+                return None
+            meta["last_access"] = time.time()
+            return dict(meta, fresh=time.time() < meta.get("expires_at", 0))
+
+    def _use_body(self, url: str, action) -> Optional[Dict[str, Any]]:
+        """
+        Run action(body_path) under the lock so a concurrent store or evict
+        cannot swap or delete the file mid-read. Returns the entry's record,
+        or None if the entry is gone (a missing body file drops the entry).
+        """
+        key = self._key(url)
+        with self._lock:
+            self._load()
+            meta = self._entries.get(key)
+            if meta is None:
+                return None
+            try:
+                action(self._body_path(key))
+            except OSError:
+                self._entries.pop(key)
+                self._total_bytes -= meta.get("size", 0)
+                self._remove_files(key)
+                return None
+            return dict(meta)
+
+    def read_body(self, url: str) -> Optional[Tuple[bytes, str]]:
+        """Return (body, content_type) of the cached entry for url, or None if it is gone"""
+        body = []
+
+        def read(path: str):
+            with open(path, "rb") as f:
+                body.append(f.read())
+
+        meta = self._use_body(url, read)
+        return (body[0], meta.get("content_type", "")) if meta else None
+
+    def copy_body(self, url: str, dest_path: str) -> Optional[str]:
+        """Copy the cached body for url to dest_path and return its content type, or None if it is gone"""
+        meta = self._use_body(url, lambda path: shutil.copyfile(path, dest_path))
+        return meta.get("content_type", "") if meta else None
+
+    @staticmethod
+    def validators(entry: Dict[str, Any]) -> Dict[str, str]:
+        """Conditional request headers for revalidating an entry"""
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store_file(self, url: str, source_path: str, headers: Mapping[str, str]) -> bool:
+        """
+        Copy a downloaded body into the cache if the response allows it
+
+        Args:
+            url: Requested URL
+            source_path: File holding the response body
+            headers: Response headers (case-insensitive mapping)
+
+        Returns:
+            bool: True if the response was cached
+        """
+        lifetime = freshness_lifetime(headers)
+        size = os.path.getsize(source_path)
+        has_validators = bool(headers.get("etag") or headers.get("last-modified"))
+        # Nothing to gain from an entry that is stale and cannot be revalidated
+        if lifetime is None or size > self.max_entry_bytes or (lifetime == 0 and not has_validators):
+            return False
+
+        key = self._key(url)
+        now = time.time()
+        meta = {
+            "url": url,
+            "size": size,
+            "content_type": headers.get("content-type", ""),
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "stored_at": now,
+            "expires_at": now + lifetime,
+            "last_access": now
+        }
+        with self._lock:
+            self._load()
+            tmp_path = self._body_path(key) + ".tmp"
+            shutil.copyfile(source_path, tmp_path)
+            os.replace(tmp_path, self._body_path(key))
+            self._write_meta(key, meta)
+            previous = self._entries.get(key)
+            if previous is not None:
+                self._total_bytes -= previous.get("size", 0)
+            self._entries[key] = meta
+            self._total_bytes += size
+            self._evict()
+        return True
+
+    def store_bytes(self, url: str, body: bytes, headers: Mapping[str, str]) -> bool:
+        """Cache an in-memory response body (see store_file)"""
+        with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
+            tmp_file.write(body)
+            tmp_path = tmp_file.name
+        try:
+            return self.store_file(url, tmp_path, headers)
+        finally:
+            os.unlink(tmp_path)
+
+    def revalidated(self, url: str, headers: Mapping[str, str]):
+        """Refresh an entry's freshness after a 304 Not Modified"""
+        key = self._key(url)
+        lifetime = freshness_lifetime(headers)
+        with self._lock:
+            self._load()
+            meta = self._entries.get(key)
+            if meta is None:
+                return
+            if lifetime is None:
+                self._entries.pop(key)
+                self._total_bytes -= meta.get("size", 0)
+                self._remove_files(key)
+                return
+            now = time.time()
+            meta["expires_at"] = now + lifetime
+            meta["last_access"] = now
+            meta["etag"] = headers.get("etag") or meta.get("etag")
+            meta["last_modified"] = headers.get("last-modified") or meta.get("last_modified")
+            self._write_meta(key, meta)
+
+    def record(self, outcome: str):
+        """Count a hit, revalidation or miss for stats()"""
+        with self._lock:
+            if outcome == "hit":
+                self._hits += 1
+            elif outcome == "revalidated":
+                self._revalidations += 1
+            else:
+                self._misses += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": HTTP_CACHE_ENABLED,
+                "entries": len(self._entries or {}),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "revalidated": self._revalidations,
+                "misses": self._misses,
+                "evictions": self._evictions
+            }
+
+
+# Process-wide cache and a pooled session for synchronous downloads
+http_cache = HttpCache()
+_session = requests.Session()
+
+
+def _download(url: str, entry: Optional[Dict[str, Any]], temp_path: str, timeout: float) -> Optional[str]:
+    """
+    Fetch url into temp_path, revalidating entry if given. Returns the content
+    type, or None if the server answered 304 but the entry has since been evicted.
+    """
+    headers = HttpCache.validators(entry) if entry else {}
+    with _session.get(url, stream=True, headers=headers, timeout=timeout) as response:
+        if entry and response.status_code == 304:
+            # Copy first: a 304 that forbids storing removes the entry
+            content_type = http_cache.copy_body(url, temp_path)
+            if content_type is None:
+                return None
+            http_cache.revalidated(url, response.headers)
+            http_cache.record("revalidated")
+            return content_type
+
+        response.raise_for_status()  # Raise an exception for 4XX/5XX responses
+        with open(temp_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=8192):
+                f.write(chunk)
+        http_cache.record("miss")
+        if HTTP_CACHE_ENABLED:
+            http_cache.store_file(url, temp_path, response.headers)
+        return response.headers.get("content-type", "")
+
+
+def download_to_tempfile(url: str, suffix: str = "", timeout: float = HTTP_TIMEOUT) -> Tuple[str, str]:
+    """
+    Download url into a new temporary file, going through the HTTP cache
+
+    Args:
+        url: URL to download
+        suffix: Suffix for the temporary file (e.g. ".pdf")
+
+    Returns:
+        Tuple[str, str]: (temp_file_path, content_type). The caller deletes the file.
+    """
+    entry = http_cache.lookup(url) if HTTP_CACHE_ENABLED else None
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+        temp_path = tmp_file.name
+
+    try:
+        if entry and entry["fresh"]:
+            content_type = http_cache.copy_body(url, temp_path)
+            if content_type is not None:
+                http_cache.record("hit")
+                return temp_path, content_type
+            # Evicted since the lookup, so download it as a miss
+            entry = None
+
+        content_type = _download(url, entry, temp_path, timeout)
+        if content_type is None:
+            # Evicted between the lookup and the 304, so fetch the full body
+            content_type = _download(url, None, temp_path, timeout)
+        return temp_path, content_type
+    except Exception:
+        os.unlink(temp_path)
+        raise
+
+
+def get(url: str, timeout: float = HTTP_TIMEOUT) -> Tuple[bytes, str]:
+    """Fetch url through the HTTP cache and return (body, content_type)"""
+    temp_path, content_type = download_to_tempfile(url, timeout=timeout)
+    try:
+        with open(temp_path, "rb") as f:
+            return f.read(), content_type
+    finally:
+        os.unlink(temp_path)
@@ -0,0 +1,58 @@
+"""
+Deferred module imports so heavy SDKs are only loaded when first used.
+"""
+import importlib
+import threading
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Module proxy that imports the real module on first attribute access"""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_name"] = name
+        self.__dict__["_lazy_module"] = None
+        self.__dict__["_lazy_lock"] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            with self.__dict__["_lazy_lock"]:
+                module = self.__dict__["_lazy_module"]
+                if module is None:
+                    module = importlib.import_module(self.__dict__["_lazy_name"])
+                    self.__dict__["_lazy_module"] = module
+        return module
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.__dict__["_lazy_module"] is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name: str) -> LazyModule:
+    """
+    Return a proxy for a module that is imported on first use
+
+    Args:
+        name: Dotted module name, e.g. "agents.writeragents"
+
+    Returns:
+        LazyModule: Proxy that forwards attribute access to the real module
+    """
+    return LazyModule(name)
+
+
+def preload(*modules: LazyModule) -> None:
+    """Force-import lazy modules, e.g. from a background warm-up task"""
+    for module in modules:
+        if isinstance(module, LazyModule):
+            module._load()
+        else:
+            importlib.import_module(module)
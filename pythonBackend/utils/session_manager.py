@@ -1,20 +1,38 @@
 import uuid
+from datetime import datetime, timezone
 from typing import Dict, Any, List, Tuple, Optional
-from langchain_pinecone import PineconeVectorStore
 import traceback
 import logging
 import os
 
 from utils.supabase_client import initialize_supabase
-from embedder import INDEX_NAME, GeminiEmbedder
-from agents.writeragents import generate_session_title
+from performance_monitor import track_db_operation
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Initialize Supabase client
-supabase_client = initialize_supabase()
+# One row per document ingested into a session, keyed by content hash, with
+# the IDs of the vectors it produced (so it can be skipped or deleted later)
+# and of other documents' vectors its near-duplicate chunks were skipped in
+# favour of (so those are kept while this document still needs them):
+#
+#   create table session_documents (
+#       session_id text not null,
+#       content_hash text not null,
+#       source text not null,
+#       source_type text not null,
+#       vector_ids jsonb not null default '[]',
+#       shared_vector_ids jsonb not null default '[]',
+#       chunk_count integer not null default 0,
+#       created_at timestamptz not null default now(),
+#       primary key (session_id, content_hash)
+#   );
+SESSION_DOCUMENTS_TABLE = "session_documents"
+
+def get_client():
+    """Return the shared Supabase client, created on first use rather than at import time"""
+    return initialize_supabase()
 
 def convert_uuid_to_str(obj):
     """
@@ -36,6 +54,7 @@ def convert_uuid_to_str(obj):
         return tuple(convert_uuid_to_str(item) for item in obj)
     return obj
 
+@track_db_operation("delete_session")
 def delete_session(session_id: str) -> Tuple[bool, str]:
     """
     Delete a session from Supabase
@@ -48,13 +67,14 @@ def delete_session(session_id: str) -> Tuple[bool, str]:
     """
     try:
         # Delete the session from Supabase
-        supabase_client.table('sessions').delete().eq('session_id', session_id).execute()
+        get_client().table('sessions').delete().eq('session_id', session_id).execute()
         return True, ""
     except Exception as e:
         error_details = traceback.format_exc()
         error_message = f"Error deleting session: {str(e)}"
         return False, error_message
 
+@track_db_operation("save_session")
 def save_session(session_id: str, session_data: Dict[str, Any]) -> Tuple[bool, str]:
     """
     Save session data to Supabase
@@ -78,11 +98,11 @@ def save_session(session_id: str, session_data: Dict[str, Any]) -> Tuple[bool, s
         serializable_data = convert_uuid_to_str(session_data)
         
         # Check if session exists
-        response = supabase_client.table('sessions').select('session_id').eq('session_id', db_session_id).execute()
+        response = get_client().table('sessions').select('session_id').eq('session_id', db_session_id).execute()
         
         if len(response.data) > 0:
             # Update existing session
-            supabase_client.table('sessions').update({
+            get_client().table('sessions').update({
                 'session_name': serializable_data.get('session_name', 'Untitled Session'),
                 'history': serializable_data['history'],
                 'processed_documents': serializable_data['processed_documents'],
@@ -95,7 +115,7 @@ def save_session(session_id: str, session_data: Dict[str, Any]) -> Tuple[bool, s
             }).eq('session_id', db_session_id).execute()
         else:
             # Insert new session
-            supabase_client.table('sessions').insert({
+            get_client().table('sessions').insert({
                 'session_id': db_session_id,
                 'session_name': serializable_data.get('session_name', 'Untitled Session'),
                 'history': serializable_data['history'],
@@ -112,6 +132,7 @@ def save_session(session_id: str, session_data: Dict[str, Any]) -> Tuple[bool, s
         error_message = f"Error saving session: {str(e)}"
         return False, error_message
 
+@track_db_operation("load_session")
 def load_session(session_id: str) -> Tuple[Optional[Dict[str, Any]], str]:
     """
     Load session data from Supabase
@@ -120,7 +141,7 @@ def load_session(session_id: str) -> Tuple[Optional[Dict[str, Any]], str]:
         Tuple[Optional[Dict], str]: (session_data, error_message)
     """
     try:
-        response = supabase_client.table('sessions').select('*').eq('session_id', session_id).execute()
+        response = get_client().table('sessions').select('*').eq('session_id', session_id).execute()
         
         if len(response.data) > 0:
             return response.data[0], ""
@@ -130,6 +151,7 @@ def load_session(session_id: str) -> Tuple[Optional[Dict[str, Any]], str]:
         error_message = f"Error loading session: {str(e)}"
         return None, error_message
 
+@track_db_operation("get_available_sessions")
 def get_available_sessions() -> Tuple[List[Dict[str, Any]], str]:
     """
     Get list of available saved sessions from Supabase
@@ -138,13 +160,151 @@ def get_available_sessions() -> Tuple[List[Dict[str, Any]], str]:
         Tuple[List[Dict], str]: (sessions_list, error_message)
     """
     try:
-        response = supabase_client.table('sessions').select('session_id, session_name, created_at').order('updated_at', desc=True).execute()
+        response = get_client().table('sessions').select('session_id, session_name, created_at').order('updated_at', desc=True).execute()
         return response.data, ""
     except Exception as e:
         error_details = traceback.format_exc()
         error_message = f"Error fetching sessions: {str(e)}"
         return [], error_message
 
+@track_db_operation("get_session_document")
+def get_session_document(session_id: str, content_hash: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """
+    Look up a document already ingested into a session by its content hash
+    
+    Returns:
+        Tuple[Optional[Dict], str]: (document_record, error_message)
+    """
+    try:
+        response = (
+            get_client().table(SESSION_DOCUMENTS_TABLE)
+            .select('content_hash, source, source_type, chunk_count, created_at')
+            .eq('session_id', session_id)
+            .eq('content_hash', content_hash)
+            .limit(1)
+            .execute()
+        )
+        if response.data:
+            return response.data[0], ""
+        return None, ""
+    except Exception as e:
+        error_message = f"Error loading session document: {str(e)}"
+        return None, error_message
+
+@track_db_operation("save_session_document")
+def save_session_document(
+    session_id: str,
+    content_hash: str,
+    source: str,
+    source_type: str,
+    vector_ids: List[str],
+    shared_vector_ids: Optional[List[str]] = None
+) -> Tuple[bool, str]:
+    """
+    Record a document ingested into a session, the vector IDs it produced and
+    the vector IDs of other documents it depends on
+    
+    Returns:
+        Tuple[bool, str]: (success, error_message)
+    """
+    try:
+        get_client().table(SESSION_DOCUMENTS_TABLE).upsert({
+            'session_id': session_id,
+            'content_hash': content_hash,
+            'source': source,
+            'source_type': source_type,
+            'vector_ids': vector_ids,
+            'shared_vector_ids': shared_vector_ids or [],
+            'chunk_count': len(vector_ids),
+            'created_at': datetime.now(timezone.utc).isoformat()
+        }, on_conflict='session_id,content_hash').execute()
+        return True, ""
+    except Exception as e:
+        error_message = f"Error saving session document: {str(e)}"
+        return False, error_message
+
+@track_db_operation("list_session_documents")
+def list_session_documents(session_id: str) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    List the documents ingested into a session
+    
+    Returns:
+        Tuple[List[Dict], str]: (document_records, error_message)
+    """
+    try:
+        response = (
+            get_client().table(SESSION_DOCUMENTS_TABLE)
+            .select('content_hash, source, source_type, chunk_count, created_at')
+            .eq('session_id', session_id)
+            .order('created_at')
+            .execute()
+        )
+        return response.data, ""
+    except Exception as e:
+        error_message = f"Error listing session documents: {str(e)}"
+        return [], error_message
+
+@track_db_operation("get_session_documents_by_source")
+def get_session_documents_by_source(session_id: str, source: str) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    Get the ingestion records (including vector IDs) of a source in a session
+    
+    Returns:
+        Tuple[List[Dict], str]: (document_records, error_message)
+    """
+    try:
+        response = (
+            get_client().table(SESSION_DOCUMENTS_TABLE)
+            .select('content_hash, source, source_type, vector_ids, shared_vector_ids')
+            .eq('session_id', session_id)
+            .eq('source', source)
+            .execute()
+        )
+        return response.data, ""
+    except Exception as e:
+        error_message = f"Error loading session documents: {str(e)}"
+        return [], error_message
+
+@track_db_operation("get_session_vector_references")
+def get_session_vector_references(session_id: str) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    Get the vector IDs every document of a session produced or depends on
+    
+    Returns:
+        Tuple[List[Dict], str]: (records with content_hash, vector_ids and shared_vector_ids, error_message)
+    """
+    try:
+        response = (
+            get_client().table(SESSION_DOCUMENTS_TABLE)
+            .select('content_hash, vector_ids, shared_vector_ids')
+            .eq('session_id', session_id)
+            .execute()
+        )
+        return response.data, ""
+    except Exception as e:
+        error_message = f"Error loading session vector references: {str(e)}"
+        return [], error_message
+
+@track_db_operation("delete_session_documents")
+def delete_session_documents(session_id: str, content_hashes: Optional[List[str]] = None) -> Tuple[bool, str]:
+    """
+    Delete ingestion records of a session (all of them if no hashes are given)
+    
+    Returns:
+        Tuple[bool, str]: (success, error_message)
+    """
+    try:
+        query = get_client().table(SESSION_DOCUMENTS_TABLE).delete().eq('session_id', session_id)
+        if content_hashes is not None:
+            if not content_hashes:
+                return True, ""
+            query = query.in_('content_hash', content_hashes)
+        query.execute()
+        return True, ""
+    except Exception as e:
+        error_message = f"Error deleting session documents: {str(e)}"
+        return False, error_message
+
 def get_session_vector_store(pinecone_client, session_state):
     """Get or create a vector store for the current session."""
     session_id = session_state.chat_session_id
@@ -158,13 +318,10 @@ def get_session_vector_store(pinecone_client, session_state):
     if pinecone_client:
         # Initialize empty vector store with namespace
         try:
-            index = pinecone_client.Index(INDEX_NAME)
-            vector_store = PineconeVectorStore(
-                index=index,
-                embedding=GeminiEmbedder(api_key=os.getenv("GOOGLE_API_KEY", "")),
-                text_key="text",
-                namespace=session_id
-            )
+            from embedder import get_namespace_vector_store
+            vector_store = get_namespace_vector_store(pinecone_client, namespace=session_id)
+            if vector_store is None:
+                return None
             session_state.session_vector_stores[session_id] = vector_store
             return vector_store
         except Exception as e:
@@ -185,6 +342,7 @@ def save_current_session(session_state):
         # Use the existing session name if it exists and isn't the default
         session_name = existing_session.get("session_name")
     elif session_state.history:
+        from agents.writeragents import generate_session_title
         # If no existing name or default name and we have history, generate name from first user query
         for message in session_state.history:
             if message["role"] == "user":
@@ -0,0 +1,84 @@
+"""
+Single-flight deduplication of concurrent identical calls.
+
+When several callers ask for the same expensive result at once (the same
+curriculum step, the same grading URL), only the first one runs the work and
+the others wait for and share its result.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution"""
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._executions = 0
+        self._shared = 0
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs) unless a call with the same key is in flight
+
+        Args:
+            key: Hashable identity of the work, e.g. (curriculum_id, step_index)
+            fn: Function producing the result
+
+        Returns:
+            The result of the single execution, shared by all concurrent callers.
+            Exceptions raised by fn are re-raised in every caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Return True if a call with this key is currently running"""
+        with self._lock:
+            return key in self._calls
+
+    def stats(self) -> Dict[str, Any]:
+        """Return execution and deduplication counters"""
+        with self._lock:
+            return {
+                "name": self.name,
+                "in_flight": len(self._calls),
+                "executions": self._executions,
+                "shared": self._shared
+            }
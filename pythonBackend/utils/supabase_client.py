@@ -1,4 +1,6 @@
 import os
+import time
+import threading
 import traceback
 from dotenv import load_dotenv
 from supabase import create_client, Client
@@ -11,16 +13,28 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
+# How often (seconds) the cached client is probed before being handed out
+SUPABASE_HEALTHCHECK_INTERVAL = float(os.getenv("SUPABASE_HEALTHCHECK_INTERVAL", "60"))
+# Table and column used for the lightweight health-check query
+SUPABASE_HEALTHCHECK_TABLE = os.getenv("SUPABASE_HEALTHCHECK_TABLE", "sessions")
+SUPABASE_HEALTHCHECK_COLUMN = os.getenv("SUPABASE_HEALTHCHECK_COLUMN", "session_id")
+
+# Process-wide cached client. Reusing one client keeps its HTTP connection
+# pool (and TLS sessions) alive across DB operations.
+_client: Optional[Client] = None
+_client_lock = threading.Lock()
+_last_healthcheck = 0.0
+
 def get_supabase_client() -> Tuple[Optional[Client], str]:
     """
     Create and return a Supabase client instance
-    
+
     Returns:
         Tuple[Optional[Client], str]: (client, error_message)
     """
     if not SUPABASE_URL or not SUPABASE_KEY:
         return None, "Supabase URL and Key must be provided in environment variables"
-    
+
     try:
         client = create_client(SUPABASE_URL, SUPABASE_KEY)
         return client, ""
@@ -28,13 +42,61 @@ def get_supabase_client() -> Tuple[Optional[Client], str]:
         error_details = traceback.format_exc()
         return None, f"Error creating Supabase client: {str(e)}"
 
-def initialize_supabase():
-    """Initialize Supabase and return client"""
+def _is_healthy(client: Client) -> bool:
+    """Run a minimal query to confirm the client can still reach Supabase"""
     try:
+        client.table(SUPABASE_HEALTHCHECK_TABLE).select(SUPABASE_HEALTHCHECK_COLUMN).limit(1).execute()
+        return True
+    except Exception as e:
+        print(f"Supabase health check failed: {e}")
+        return False
+
+def get_cached_supabase_client() -> Optional[Client]:
+    """
+    Return the process-wide Supabase client, creating it lazily.
+
+    The client is probed at most once every SUPABASE_HEALTHCHECK_INTERVAL
+    seconds and recreated if the probe fails. Safe to call from any thread.
+
+    Returns:
+        Optional[Client]: The shared client, or None if it cannot be created
+    """
+    global _client, _last_healthcheck
+
+    client = _client
+    if client is not None and time.monotonic() - _last_healthcheck < SUPABASE_HEALTHCHECK_INTERVAL:
+        return client
+
+    with _client_lock:
+        now = time.monotonic()
+        if _client is not None:
+            if now - _last_healthcheck < SUPABASE_HEALTHCHECK_INTERVAL:
+                return _client
+            if _is_healthy(_client):
+                _last_healthcheck = now
+                return _client
+            print("Recreating Supabase client after failed health check")
+            _client = None
+
         client, error = get_supabase_client()
         if error:
             print(f"Supabase initialization warning: {error}")
-        return client
+            return None
+        _client = client
+        _last_healthcheck = now
+        return _client
+
+def reset_supabase_client():
+    """Drop the cached client so the next call creates a fresh one"""
+    global _client, _last_healthcheck
+    with _client_lock:
+        _client = None
+        _last_healthcheck = 0.0
+
+def initialize_supabase():
+    """Initialize Supabase and return the shared client"""
+    try:
+        return get_cached_supabase_client()
     except Exception as e:
         print(f"Error initializing Supabase: {e}")
         return None
@@ -0,0 +1,139 @@
+"""
+Bounded-memory handling of uploaded files.
+
+Uploads are streamed in fixed-size chunks straight to a temporary file on
+disk while their SHA-256 is computed and their size checked, so memory use
+stays at one chunk per upload. The real file type is sniffed from the
+leading magic bytes rather than trusted from the file name, and the staged
+file is always removed when the request is done with it.
+"""
+import os
+import hashlib
+import tempfile
+from typing import Iterable, Optional
+
+import aiofiles
+
+# Maximum accepted upload size
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+
+# Leading bytes identifying each supported format
+_SIGNATURES = [
+    (b"%PDF-", ".pdf"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+]
+_EQUIVALENT_EXTENSIONS = {".jpeg": ".jpg"}
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the configured size limit"""
+
+
+class UnsupportedFileType(Exception):
+    """Raised when an upload's content does not match a supported format"""
+
+
+def sniff_extension(head: bytes) -> Optional[str]:
+    """Return the file extension implied by the leading bytes, or None"""
+    # PDFs may have a few bytes of junk before the header
+    if b"%PDF-" in head[:1024]:
+        return ".pdf"
+    for signature, extension in _SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def normalize_extension(extension: str) -> str:
+    extension = extension.lower()
+    return _EQUIVALENT_EXTENSIONS.get(extension, extension)
+
+
+class StagedUpload:
+    """An upload written to a temporary file"""
+
+    def __init__(self, path: str, size: int, sha256: str, extension: str, declared_extension: str):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.extension = extension
+        self.declared_extension = declared_extension
+
+    def cleanup(self):
+        """Delete the temporary file (safe to call more than once)"""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def stage_upload(
+    upload,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    allowed_extensions: Optional[Iterable[str]] = None,
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> StagedUpload:
+    """
+    Stream an UploadFile to a temporary file with hashing and size checks
+
+    Args:
+        upload: FastAPI UploadFile
+        max_bytes: Maximum accepted size
+        allowed_extensions: Extensions accepted after sniffing (None accepts any known type)
+        chunk_size: Bytes read per iteration
+
+    Returns:
+        StagedUpload: The staged file; the caller must call cleanup()
+
+    Raises:
+        UploadTooLarge: if the upload is larger than max_bytes
+        UnsupportedFileType: if the content is not an allowed format
+    """
+    declared_extension = normalize_extension(os.path.splitext(upload.filename or "")[1])
+    allowed = {normalize_extension(ext) for ext in allowed_extensions} if allowed_extensions else None
+
+    fd, path = tempfile.mkstemp(suffix=".upload")
+    os.close(fd)
+    digest = hashlib.sha256()
+    size = 0
+    extension = None
+    try:
+        async with aiofiles.open(path, "wb") as out:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                if extension is None:
+                    extension = sniff_extension(chunk)
+                    if extension is None or (allowed is not None and extension not in allowed):
+                        raise UnsupportedFileType(
+                            f"File content does not match a supported format (declared {declared_extension or 'none'})"
+                        )
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"File too large, maximum size is {max_bytes // (1024 * 1024)} MB")
+                digest.update(chunk)
+                await out.write(chunk)
+
+        if extension is None:
+            raise UnsupportedFileType("Uploaded file is empty")
+
+        # Give the file the sniffed extension so downstream loaders pick the right type
+        typed_path = path[:-len(".upload")] + extension
+        os.replace(path, typed_path)
+        path = typed_path
+    except BaseException:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    return StagedUpload(path, size, digest.hexdigest(), extension, declared_extension)
+
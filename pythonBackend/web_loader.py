@@ -0,0 +1,319 @@
+"""
+Async web loading for ingestion.
+
+All fetches share one pooled httpx.AsyncClient (keep-alive connections and
+TLS sessions are reused across requests), run with connect/read timeouts and
+a response size cap, and several URLs are fetched concurrently under a
+semaphore. HTML pages are reduced to their readable main content, with
+headings kept as markdown so the structured chunker can split on them.
+Parsing runs on the managed cpu pool; PDF pages are extracted lazily, so they
+stream into the ingestion pipeline as they come out of the PDF.
+"""
+import os
+import asyncio
+import logging
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import httpx
+from bs4 import BeautifulSoup
+from langchain_core.documents import Document
+
+from ingestion_pipeline import content_hash
+from utils.executors import run_cpu, run_db
+from utils.http_cache import HTTP_CACHE_ENABLED, HttpCache, http_cache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+WEB_CONNECT_TIMEOUT = float(os.getenv("WEB_CONNECT_TIMEOUT", "5"))
+WEB_READ_TIMEOUT = float(os.getenv("WEB_READ_TIMEOUT", "20"))
+# Responses larger than this are rejected instead of buffered
+WEB_MAX_BYTES = int(os.getenv("WEB_MAX_BYTES", str(10 * 1024 * 1024)))
+# URLs fetched at once per call to load_web_documents
+WEB_FETCH_CONCURRENCY = int(os.getenv("WEB_FETCH_CONCURRENCY", "4"))
+WEB_MAX_CONNECTIONS = int(os.getenv("WEB_MAX_CONNECTIONS", "20"))
+WEB_USER_AGENT = os.getenv(
+    "WEB_USER_AGENT",
+    "Mozilla/5.0 (compatible; EduMateBot/1.0; +https://github.com/pallavibandarkar/EduMate)"
+)
+
+# Elements that never hold main content
+_BOILERPLATE_TAGS = ["script", "style", "noscript", "nav", "header", "footer", "aside", "form", "iframe", "svg", "button"]
+_HEADING_LEVELS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+_BLOCK_TAGS = ["h1", "h2", "h3", "h4", "h5", "h6", "p", "li", "pre", "blockquote", "td", "th", "dt", "dd"]
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+class FetchError(Exception):
+    """Raised when a URL cannot be fetched within the configured limits"""
+
+
+class WebPage:
+    """
+    A fetched URL: the SHA-256 of its body and the documents extracted from it
+
+    For PDFs `documents` is a generator that extracts pages while it is
+    consumed; call close() once done with the page to release its temp file.
+    """
+
+    def __init__(self, url: str, content_hash: str, documents: Iterable[Document], temp_path: Optional[str] = None):
+        self.url = url
+        self.content_hash = content_hash
+        self.documents = documents
+        self.temp_path = temp_path
+
+    def close(self):
+        close = getattr(self.documents, "close", None)
+        if close is not None:
+            close()
+        if self.temp_path:
+            _remove_file(self.temp_path)
+            self.temp_path = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared AsyncClient, creating it on first use"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(WEB_READ_TIMEOUT, connect=WEB_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=WEB_MAX_CONNECTIONS, max_keepalive_connections=WEB_MAX_CONNECTIONS // 2),
+            follow_redirects=True,
+            headers={"User-Agent": WEB_USER_AGENT}
+        )
+    return _client
+
+
+async def close_client():
+    """Close the shared client (called on application shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _media_type(content_type: str) -> str:
+    return content_type.split(";")[0].strip().lower()
+
+
+def _remove_file(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _write_temp_file(body: bytes, suffix: str) -> str:
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+        tmp_file.write(body)
+        return tmp_file.name
+
+
+async def _download(url: str, entry: Optional[Dict[str, Any]], max_bytes: int) -> Optional[Tuple[bytes, str, str]]:
+    """
+    Stream url with the shared client, revalidating entry if given. Returns
+    None if the server answered 304 but the entry has since been evicted.
+    """
+    headers = HttpCache.validators(entry) if entry else {}
+    async with get_client().stream("GET", url, headers=headers) as response:
+        if entry and response.status_code == 304:
+            # Read first: a 304 that forbids storing removes the entry
+            cached = await run_db(http_cache.read_body, url)
+            if cached is None:
+                return None
+            http_cache.record("revalidated")
+            await run_db(http_cache.revalidated, url, response.headers)
+            return cached[0], _media_type(cached[1]), url
+        if response.status_code >= 400:
+            raise FetchError(f"HTTP {response.status_code} for {url}")
+        declared = response.headers.get("content-length")
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise FetchError(f"{url} is larger than {max_bytes} bytes")
+        body = bytearray()
+        async for chunk in response.aiter_bytes():
+            body.extend(chunk)
+            if len(body) > max_bytes:
+                raise FetchError(f"{url} is larger than {max_bytes} bytes")
+        http_cache.record("miss")
+        if HTTP_CACHE_ENABLED:
+            await run_db(http_cache.store_bytes, url, bytes(body), response.headers)
+        return bytes(body), _media_type(response.headers.get("content-type", "")), str(response.url)
+
+
+async def fetch(url: str, max_bytes: int = WEB_MAX_BYTES) -> Tuple[bytes, str, str]:
+    """
+    Fetch a URL with the shared client, enforcing the size cap while streaming.
+    Fresh responses come from the local HTTP cache; stale ones are revalidated.
+
+    Args:
+        url: URL to fetch
+        max_bytes: Maximum response body size
+
+    Returns:
+        Tuple[bytes, str, str]: (body, content_type, final_url)
+
+    Raises:
+        FetchError: on HTTP errors, timeouts or oversized responses
+    """
+    entry = await run_db(http_cache.lookup, url) if HTTP_CACHE_ENABLED else None
+    if entry and entry["fresh"]:
+        cached = await run_db(http_cache.read_body, url)
+        if cached is not None:
+            http_cache.record("hit")
+            return cached[0], _media_type(cached[1]), url
+        # Evicted since the lookup, so fetch it as a miss
+        entry = None
+
+    try:
+        result = await _download(url, entry, max_bytes)
+        if result is None:
+            # Evicted between the lookup and the 304, so fetch the full body
+            result = await _download(url, None, max_bytes)
+        return result
+    except httpx.HTTPError as e:
+        raise FetchError(f"Failed to fetch {url}: {str(e)}")
+
+
+def extract_main_content(html: str) -> Tuple[Optional[str], str]:
+    """
+    Reduce an HTML page to its readable main content.
+
+    Prefers <article>/<main>, otherwise the element holding the most
+    paragraph text. Headings are emitted as markdown headings and blocks are
+    separated by blank lines.
+
+    Returns:
+        Tuple[Optional[str], str]: (title, text)
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    title = soup.title.get_text(strip=True) if soup.title else None
+
+    for tag in soup(_BOILERPLATE_TAGS):
+        tag.decompose()
+
+    root = soup.find("article") or soup.find("main") or soup.find(attrs={"role": "main"})
+    if root is None:
+        # Pick the container with the most paragraph text
+        best_score = 0
+        for candidate in soup.find_all(["div", "section", "body"]):
+            score = sum(len(p.get_text(strip=True)) for p in candidate.find_all("p", recursive=False))
+            if score > best_score:
+                root, best_score = candidate, score
+        if root is None or best_score == 0:
+            root = soup.body or soup
+
+    blocks: List[str] = []
+    for element in root.find_all(_BLOCK_TAGS):
+        # Nested blocks (e.g. <p> inside <li>) are emitted by the innermost one
+        if element.find(_BLOCK_TAGS):
+            continue
+        text = " ".join(element.get_text(" ", strip=True).split())
+        if not text:
+            continue
+        if element.name in _HEADING_LEVELS:
+            blocks.append("#" * _HEADING_LEVELS[element.name] + " " + text)
+        elif element.name == "li":
+            blocks.append("- " + text)
+        else:
+            blocks.append(text)
+
+    if not blocks:
+        text = root.get_text("\n", strip=True)
+        return title, text
+    return title, "\n\n".join(blocks)
+
+
+def _url_metadata(url: str) -> Dict[str, str]:
+    return {
+        "source_type": "url",
+        "url": url,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+def is_pdf(url: str, content_type: str) -> bool:
+    return content_type == "application/pdf" or url.lower().endswith(".pdf")
+
+
+def pdf_documents(url: str, temp_path: str) -> Iterator[Document]:
+    """Yield the pages of a downloaded PDF as they are extracted, with URL metadata"""
+    # Reuse the PDF text-layer / model extraction path
+    from document_loader import extract_document
+    metadata = _url_metadata(url)
+    try:
+        for doc in extract_document(temp_path):
+            doc.metadata.update(metadata)
+            doc.metadata.pop("file_name", None)
+            yield doc
+    finally:
+        _remove_file(temp_path)
+
+
+def documents_from_response(url: str, body: bytes, content_type: str) -> List[Document]:
+    """Turn a fetched HTML or text body into unsplit documents with URL metadata"""
+    metadata = _url_metadata(url)
+    text = body.decode("utf-8", errors="replace")
+    if content_type in ("text/html", "application/xhtml+xml") or "<html" in text[:1000].lower():
+        title, text = extract_main_content(text)
+        if title:
+            metadata["title"] = title
+    if not text.strip():
+        return []
+    return [Document(page_content=text, metadata=metadata)]
+
+
+async def load_web_document(url: str) -> Optional[WebPage]:
+    """
+    Fetch one URL and return its main content as unsplit documents.
+
+    The page is keyed by a hash of the fetched body, like uploads, so a
+    changed page is ingested again and the same content under another URL
+    is recognised.
+
+    PDF pages are not extracted here: the returned page's documents extract
+    them lazily, so the ingestion pipeline embeds early pages while later
+    ones are still being read.
+
+    Returns None if the page cannot be fetched or has no content.
+    """
+    try:
+        body, content_type, final_url = await fetch(url)
+        if is_pdf(url, content_type):
+            temp_path = await run_cpu(_write_temp_file, body, ".pdf")
+            logger.info(f"Loaded {url} ({len(body)} bytes, PDF): pages are extracted during ingestion")
+            return WebPage(url, content_hash(body), pdf_documents(url, temp_path), temp_path=temp_path)
+        # HTML parsing is CPU-bound
+        docs = await run_cpu(documents_from_response, url, body, content_type)
+        logger.info(f"Loaded {url} ({len(body)} bytes, {content_type or 'unknown type'}): {len(docs)} documents")
+        if not docs:
+            return None
+        return WebPage(url, content_hash(body), docs)
+    except Exception as e:
+        logger.error(f"Web loading error for {url}: {str(e)}")
+        return None
+
+
+async def load_web_documents(urls: Iterable[str], concurrency: int = WEB_FETCH_CONCURRENCY) -> Dict[str, Optional[WebPage]]:
+    """
+    Fetch several URLs concurrently over the shared connection pool.
+
+    Args:
+        urls: URLs to load (duplicates are fetched once)
+        concurrency: Maximum fetches in flight
+
+    Returns:
+        Dict[str, Optional[WebPage]]: Page per URL (None if it failed), in input order
+    """
+    unique_urls = list(dict.fromkeys(urls))
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def load(url: str) -> Optional[WebPage]:
+        async with semaphore:
+            return await load_web_document(url)
+
+    results = await asyncio.gather(*(load(url) for url in unique_urls))
+    return dict(zip(unique_urls, results))